@@ -0,0 +1,92 @@
+"""
+Bounded caches for serving (see predict.Predictor): raw text -> token ids, and (token ids, aspect, model version)
+-> class probabilities, so repeated and near-duplicate review sentences are not cleaned, encoded or scored again.
+"""
+import hashlib
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+# a Python int above the small-int cache, held by a tuple of token ids
+INT_BYTES = 28
+
+
+class LRUCache():
+    """
+    Evicts the least recently used entries once the entries take more than max_bytes. Sizes are estimated by
+    sizeof(key, value) when an entry is added. Counts hits, misses and evictions.
+    """
+
+    def __init__(self, max_bytes, sizeof):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """ The value of key (now most recently used), None on a miss """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(key, value)
+        if size > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self.entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+    def clear(self):
+        """ Drops every entry; the counters keep running """
+        self.entries.clear()
+        self.bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'entries': len(self.entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / float(lookups) if lookups else 0.0}
+
+
+def token_bytes(text, ids):
+    """ Size of a text -> tuple of token ids entry """
+    return sys.getsizeof(text) + sys.getsizeof(ids) + INT_BYTES * len(ids)
+
+
+def result_bytes(key, p):
+    """ Size of a (token id bytes, aspect id, version) -> probabilities entry """
+    return sys.getsizeof(key) + sys.getsizeof(key[0]) + sys.getsizeof(key[2]) + sys.getsizeof(p)
+
+
+def model_version(model):
+    """ Digest of the weights (and int8 scales) of a numpy model; a retrained or requantized model gets a new one """
+    digest = hashlib.md5(model.cell_type.encode('utf-8'))
+    # embeddings read from a shared store are not in weights; the store and domain stand for them
+    digest.update(str(getattr(model.embedding_matrix, 'version', '')).encode('utf-8'))
+    digest.update(str(getattr(getattr(model, 'aspect_embedding_matrix', None), 'version', '')).encode('utf-8'))
+    for name in sorted(model.weights):
+        digest.update(name.encode('utf-8'))
+        digest.update(np.ascontiguousarray(model.weights[name]).tobytes())
+    for name, scales in sorted(getattr(model, 'scales', {}).items()):
+        digest.update(name.encode('utf-8'))
+        for scale in scales:
+            digest.update(np.ascontiguousarray(scale).tobytes())
+    return digest.hexdigest()
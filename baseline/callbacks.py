@@ -0,0 +1,67 @@
+class _Monitor():
+    """ Tracks the best value of a dev metric and how many evaluations passed without improving on it """
+
+    def __init__(self, mode='max', min_delta=0.0, patience=5):
+        assert mode in ('max', 'min')
+        self.mode = mode
+        self.min_delta = min_delta
+        self.patience = patience
+        self.best = None
+        self.wait = 0
+
+    def improved(self, value):
+        if self.best is None:
+            return True
+        if self.mode == 'max':
+            return value > self.best + self.min_delta
+        return value < self.best - self.min_delta
+
+    def update(self, value):
+        if self.improved(value):
+            self.best = value
+            self.wait = 0
+            return True
+        self.wait += 1
+        return False
+
+    def state_dict(self):
+        return {'best': self.best, 'wait': self.wait}
+
+    def load_state_dict(self, state):
+        self.best = state['best']
+        self.wait = state['wait']
+
+
+class EarlyStopping(_Monitor):
+    """ Stop once the dev metric has not improved by more than min_delta for patience evaluations """
+
+    def __init__(self, mode='max', min_delta=0.0, patience=5):
+        _Monitor.__init__(self, mode, min_delta, patience)
+        self.stop_reason = None
+
+    def step(self, value):
+        """ Returns True when training should stop """
+        if not self.update(value) and self.wait >= self.patience:
+            self.stop_reason = "no improvement of more than %g over %d evaluations (best %f)" % (
+                self.min_delta, self.wait, self.best)
+            return True
+        return False
+
+
+class ReduceLROnPlateau(_Monitor):
+    """ Multiply the learning rate by factor once the dev metric stalls for patience evaluations """
+
+    def __init__(self, mode='max', min_delta=0.0, patience=2, factor=0.5, min_lr=1e-5):
+        _Monitor.__init__(self, mode, min_delta, patience)
+        self.factor = factor
+        self.min_lr = min_lr
+
+    def step(self, value, lr):
+        """ Returns the learning rate to use from now on """
+        if not self.update(value) and self.wait >= self.patience:
+            self.wait = 0
+            # lr is read back from a float32 variable, so min_lr itself comes back slightly off
+            if lr <= self.min_lr * (1 + 1e-6):
+                return lr
+            return max(lr * self.factor, self.min_lr)
+        return lr
@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+from queue import Queue
+from time import time
+
+import numpy as np
+
+
+class CheckpointManager():
+    """
+    Periodic checkpoints that keep the training thread free: variable values are read with one
+    session.run (a consistent snapshot between two train steps) and a background thread writes them
+    to disk. Keeps the last keep_last checkpoints, plus the best one by dev metric in best/.
+
+    Every checkpoint is a ckpt-<step>.npz of variable values and a ckpt-<step>.json of training state
+    (epoch, iterator position, RNG seed, ...). Files are written under a temporary name and renamed,
+    so a process killed mid-write never leaves a truncated checkpoint behind.
+    """
+
+    def __init__(self, session, var_list, directory='saves/checkpoints', keep_last=5,
+                 every_steps=None, every_seconds=None, higher_is_better=True):
+        self.session = session
+        self.var_list = var_list
+        self.directory = directory
+        self.best_directory = os.path.join(directory, 'best')
+        self.keep_last = keep_last
+        self.every_steps = every_steps
+        self.every_seconds = every_seconds
+        self.higher_is_better = higher_is_better
+        self.last_save = time()
+        self.best_metric = None
+        self.error = None
+        for d in [self.directory, self.best_directory]:
+            if not os.path.exists(d):
+                os.makedirs(d)
+
+        index = self._read_index(self.directory)
+        self.checkpoints = index.get('checkpoints', [])
+        best = self._read_index(self.best_directory)
+        if best:
+            self.best_metric = best['metric']
+
+        self.queue = Queue()
+        self.writer = threading.Thread(target=self._write_loop)
+        self.writer.daemon = True
+        self.writer.start()
+
+    @classmethod
+    def latest_state(cls, directory, best=False):
+        """ Training state of the latest checkpoint without touching any variables, e.g. to seed the graph """
+        if best:
+            directory = os.path.join(directory, 'best')
+        index = cls._read_index(directory)
+        if not index:
+            return None
+        with open(os.path.join(directory, index['latest'] + '.json')) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _read_index(directory):
+        path = os.path.join(directory, 'checkpoint.json')
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _atomic_write(path, write):
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+
+    def _write_checkpoint(self, directory, step, values, state):
+        name = 'ckpt-%d' % step
+        self._atomic_write(os.path.join(directory, name + '.npz'), lambda f: np.savez(f, **values))
+        self._atomic_write(os.path.join(directory, name + '.json'),
+                           lambda f: f.write(json.dumps(state, indent=2).encode('utf-8')))
+        return name
+
+    def _write_loop(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            try:
+                self._write(*job)
+            except Exception as e:
+                # surfaced on the training thread by the next save/close
+                self.error = e
+            self.queue.task_done()
+
+    def _write(self, kind, step, values, state):
+        if kind == 'best':
+            # the new best is complete and indexed before the old one goes, so a crash in between leaves one
+            name = self._write_checkpoint(self.best_directory, step, values, state)
+            index = {'latest': name, 'metric': state['metric'], 'checkpoints': [name]}
+            self._atomic_write(os.path.join(self.best_directory, 'checkpoint.json'),
+                               lambda f: f.write(json.dumps(index).encode('utf-8')))
+            for f in os.listdir(self.best_directory):
+                if f.startswith('ckpt-') and f not in (name + '.npz', name + '.json'):
+                    os.remove(os.path.join(self.best_directory, f))
+            return
+
+        name = self._write_checkpoint(self.directory, step, values, state)
+        self.checkpoints = [c for c in self.checkpoints if c != name] + [name]
+        stale, self.checkpoints = self.checkpoints[:-self.keep_last], self.checkpoints[-self.keep_last:]
+        index = {'latest': name, 'checkpoints': self.checkpoints}
+        self._atomic_write(os.path.join(self.directory, 'checkpoint.json'),
+                           lambda f: f.write(json.dumps(index).encode('utf-8')))
+        for c in stale:
+            for ext in ['.npz', '.json']:
+                if os.path.exists(os.path.join(self.directory, c + ext)):
+                    os.remove(os.path.join(self.directory, c + ext))
+
+    def _snapshot(self):
+        if self.error is not None:
+            raise self.error
+        values = self.session.run(self.var_list)
+        return {v.op.name: value for v, value in zip(self.var_list, values)}
+
+    def due(self, step):
+        if self.every_steps and step % self.every_steps == 0:
+            return True
+        return bool(self.every_seconds) and time() - self.last_save >= self.every_seconds
+
+    def save(self, step, state):
+        """ state -> json-serialisable dict, handed back by restore() """
+        self.last_save = time()
+        self.queue.put(('periodic', step, self._snapshot(), dict(state, step=step)))
+
+    def maybe_save(self, step, state):
+        if self.due(step):
+            self.save(step, state)
+            return True
+        return False
+
+    def save_if_best(self, step, metric, state):
+        improved = self.best_metric is None or (
+            metric > self.best_metric if self.higher_is_better else metric < self.best_metric)
+        if improved:
+            self.best_metric = metric
+            self.queue.put(('best', step, self._snapshot(), dict(state, step=step, metric=metric)))
+        return improved
+
+    def restore(self, best=False):
+        """ Loads the latest (or best) checkpoint into the session; returns its state, or None if there is none """
+        directory = self.best_directory if best else self.directory
+        index = self._read_index(directory)
+        if not index:
+            return None
+        name = index['latest']
+        with np.load(os.path.join(directory, name + '.npz')) as values:
+            for v in self.var_list:
+                v.load(values[v.op.name], self.session)
+        with open(os.path.join(directory, name + '.json')) as f:
+            return json.load(f)
+
+    def close(self):
+        """ Blocks until every queued checkpoint is on disk """
+        self.queue.put(None)
+        self.writer.join()
+        if self.error is not None:
+            raise self.error
@@ -1,48 +1,95 @@
+import pickle
+
 import pandas as pd
 import numpy as np
 
 
+def get_emb(word, h):
+    if word in h:
+        return h[word]
+    else:
+        return h['__UNK__']
+
+
+def load_emb():
+    emb = []
+    a_emb = []
+    with open('../data/semeval14/text_vocab.vocab', 'r') as f:
+        with open('../data/semeval14/text_vector.pkl', 'rb') as pkl_file:
+            h = pickle.load(pkl_file)
+            lines = f.readlines()
+
+            for line in lines:
+                i, word = line.strip().split('\t')
+                emb.append(get_emb(word, h))
+            emb = np.asarray(emb)
+
+    with open('../data/semeval14/aspect_vocab.vocab', 'r') as f:
+        with open('../data/semeval14/aspect_vector.pkl', 'rb') as pkl_file:
+            h = pickle.load(pkl_file)
+            lines = f.readlines()
+
+            for line in lines:
+                i, word = line.strip().split('\t')
+                a_emb.append(get_emb(word, h))
+            # print len(a_emb), len(a_emb[0])
+            a_emb = np.asarray(a_emb)
+            # print a_emb.shape
+    return emb, a_emb, emb.shape[0], a_emb.shape[0]
+
+
+def read_model_data(path):
+    """
+    Per-aspect rows of a split and the padded word ids of its sentences; row r reads sentences[r.sentence].
+    Splits written before the sentences were stored once (ids on every row, in 'text') are converted.
+    """
+    df = pd.read_pickle(path)
+    if 'sentence' in df:
+        sentences = np.load(path[:-len('.pkl')] + '_sentences.npy')
+    else:
+        sentences = np.asarray([list(map(int, t)) for t in df['text']], dtype=np.int32)
+        df = df.drop(columns='text')
+        df['sentence'] = np.arange(df.shape[0])
+    return df, sentences
+
+
+def polarity_array(polarity):
+    return np.asarray([list(map(int, p)) for p in polarity], dtype=np.int64)
+
+
 class TrainData():
-    def __init__(self, batch_size, input_len):
+    def __init__(self, batch_size, input_len, shard=0, num_shards=1, dev_size=None,
+                 path='../data/semeval14/rest_train_data.pkl'):
         # load training data
-        self.df = pd.read_pickle('../data/semeval14/rest_train_data.pkl')
+        self.df, self.sentences = read_model_data(path)
         self.bz = batch_size
         self.i = 0
         self.len = input_len
-        l = self.df.shape[0] - self.bz
+        # the last dev_size rows are held out for DevData / EvalData
+        l = self.df.shape[0] - (dev_size or self.bz)
         self.df = self.df.head(l)
+        if num_shards > 1:
+            # every num_shards-th row, so step k of all shards together covers one contiguous block of rows
+            self.df = self.df.iloc[shard::num_shards].reset_index(drop=True)
 
     def __iter__(self):
         return self
 
     def __next__(self):
-        x = self.df['text'][self.i:self.i + self.bz]
-        a = self.df['aspect'][self.i:self.i + self.bz]
-        y = self.df['polarity'][self.i:self.i + self.bz]
-        x_len = self.df['seq_len'][self.i:self.i + self.bz]
-        # print x
+        rows = self.df.iloc[self.i:self.i + self.bz]
         self.i += self.bz
 
-        x_ = []
-        a_ = []
-        y_ = []
-        for i in x:
-            x_.append(np.asarray(list(map(int, i))))
-        for i in y:
-            y_.append(np.asarray(list(map(int, i))))
-        for i in a:
-            a_.append(int(i))
-        x = np.asarray(x_)
-        a = np.asarray(a_)
-        y = np.asarray(y_, dtype=np.int64)
-        x_len = np.asarray(x_len, dtype=np.int64)
+        x = self.sentences[rows['sentence'].values]
+        a = np.asarray(rows['aspect'], dtype=np.int64)
+        y = polarity_array(rows['polarity'])
+        x_len = np.asarray(rows['seq_len'], dtype=np.int64)
         return x, x_len, a, y
 
 
 class EvalData():
     def __init__(self, batch_size, input_len):
         # load training data
-        self.a = pd.read_pickle('../data/semeval14/rest_train_data.pkl')
+        self.a, self.sentences = read_model_data('../data/semeval14/rest_train_data.pkl')
 
         self.bz = batch_size
         self.i = 0
@@ -52,33 +99,47 @@ class EvalData():
         return self
 
     def __next__(self):
-        x = self.a['text'].tail(self.bz)
-        a = self.a['aspect'].tail(self.bz)
-
-        y = self.a['polarity'].tail(self.bz)
-        x_len = self.a['seq_len'].tail(self.bz)
+        rows = self.a.tail(self.bz)
         # self.i += self.bz
 
-        x_ = []
-        a_ = []
-        y_ = []
-        for i in x:
-            x_.append(np.asarray(list(map(int, i))))
-        for i in y:
-            y_.append(np.asarray(list(map(int, i))))
-        for i in a:
-            a_.append(int(i))
-        x = np.asarray(x_)
-        a = np.asarray(a_)
-        x_len = np.asarray(x_len, dtype=np.int64)
+        x = self.sentences[rows['sentence'].values]
+        a = np.asarray(rows['aspect'], dtype=np.int64)
+        y = rows['polarity']
+        x_len = np.asarray(rows['seq_len'], dtype=np.int64)
 
         return x, x_len, a, y
 
 
+class DevData():
+    """ One full pass over the rows TrainData holds out, in batches of exactly batch_size """
+
+    def __init__(self, batch_size, input_len, dev_size=None):
+        df, self.sentences = read_model_data('../data/semeval14/rest_train_data.pkl')
+        self.df = df.tail(dev_size or batch_size).reset_index(drop=True)
+        self.bz = batch_size
+        self.len = input_len
+
+    def __iter__(self):
+        """
+        Yields x, x_len, a, y, n: the graph has a fixed batch size, so the last batch is padded by
+        repeating its first row and only its first n rows count
+        """
+        for i in range(0, self.df.shape[0], self.bz):
+            rows = self.df.iloc[i:i + self.bz]
+            n = rows.shape[0]
+            if n < self.bz:
+                rows = rows.iloc[list(range(n)) + [0] * (self.bz - n)]
+            x = self.sentences[rows['sentence'].values]
+            a = np.asarray(rows['aspect'], dtype=np.int64)
+            y = polarity_array(rows['polarity'])
+            x_len = np.asarray(rows['seq_len'], dtype=np.int64)
+            yield x, x_len, a, y, n
+
+
 class TestData():
-    def __init__(self, batch_size, input_len):
-        # load training data
-        self.a = pd.read_pickle('../data/semeval14/rest_train_data.pkl')
+    def __init__(self, batch_size, input_len, path='../data/semeval14/rest_test_data.pkl'):
+        # load test data
+        self.a, self.sentences = read_model_data(path)
         self.bz = batch_size
         self.i = 0
         self.len = input_len
@@ -87,25 +148,61 @@ class TestData():
         return self
 
     def __next__(self):
-        x = self.a['text'][self.i:self.i + self.bz]
-        a = self.a['aspect'][self.i:self.i + self.bz]
-        x_len = self.a['seq_len'][self.i:self.i + self.bz]
-        # self.i += self.bz
-
-        x_ = []
-        a_ = []
-        for i in x:
-            x_.append(np.asarray(list(map(int, i))))
+        rows = self.a.iloc[self.i:self.i + self.bz]
+        self.i += self.bz
 
-        for i in a:
-            a_.append(int(i))
-        x = np.asarray(x_)
-        a = np.asarray(a_)
-        x_len = np.asarray(x_len, dtype=np.int64)
+        x = self.sentences[rows['sentence'].values]
+        a = np.asarray(rows['aspect'], dtype=np.int64)
+        x_len = np.asarray(rows['seq_len'], dtype=np.int64)
 
         return x, x_len, a
 
 
+polarity_index = {'negative': 0, 'neutral': 1, 'positive': 2}
+
+
+def held_out_size(rows, eval_fraction=None, dev_size=None):
+    """
+    Rows held out at the end of a split of rows rows: dev_size when given, else the eval_fraction share of them.
+    A model trained with run.py --dev-size of this many rows has not seen them.
+    """
+    if dev_size:
+        return dev_size
+    if not eval_fraction or not 0 < eval_fraction < 1:
+        raise ValueError("eval_fraction must be in (0, 1), got %r" % eval_fraction)
+    return max(1, int(round(rows * eval_fraction)))
+
+
+
+def load_labelled_data(path='../data/semeval14/rest_train_data.pkl', dev_size=None):
+    """
+    Whole split as arrays, y as class index. Rows without a 3-class polarity (e.g. conflict) are dropped. With
+    dev_size only the last dev_size rows, the ones TrainData holds out. The SemEval 2014 test split (phase B) has no
+    gold polarities, so it cannot be scored here.
+    """
+    df, sentences = read_model_data(path)
+    if dev_size:
+        df = df.tail(dev_size)
+    keep, y = [], []
+    for i, p in enumerate(df['polarity']):
+        if isinstance(p, str):
+            if p not in polarity_index:
+                continue
+            y.append(polarity_index[p])
+        elif p is None or isinstance(p, float):
+            # no gold label (None / NaN)
+            continue
+        else:
+            y.append(int(np.argmax(list(map(int, p)))))
+        keep.append(i)
+    if not keep:
+        raise ValueError("%s has no rows with a gold polarity to evaluate on, use a labelled split such as the "
+                         "rows held out from rest_train_data.pkl" % path)
+    df = df.iloc[keep]
+    return (sentences[df['sentence'].values], np.asarray(df['seq_len'], dtype=np.int64),
+            np.asarray(df['aspect'], dtype=np.int64), np.asarray(y, dtype=np.int64))
+
+
 # testing
 if __name__ == '__main__':
     data = TrainData(25, 80)
@@ -0,0 +1,195 @@
+"""
+Distils a trained AspectLevelModel (the teacher, weights exported by run.py) into a much narrower one (the student):
+
+    python distill.py saves/weights.npz saves/student_weights.npz --hidden-size 64 [--unlabeled reviews.txt]
+
+The student is trained on the teacher's class probabilities, softened by --temperature, over the training rows and,
+with --unlabeled, over review sentences without labels (a text file with one sentence per line, or any SemEval
+XML), each paired with every aspect category. The training rows also keep their hard labels (weight 1 - --alpha).
+The teacher runs with numpy_model, so only the student is a tensorflow graph.
+
+The student is an AspectLevelModel too: its weights load with NumpyAspectLevelModel, predict.py and quantize.py
+like the teacher's. At the end the teacher and the student are compared on the labelled rows held out at the end of
+rest_train_data.pkl, --eval-fraction of them (default 10%) or --dev-size rows, which are left out of the transfer set
+(accuracy, ms / batch); throughput is timed over the whole transfer set. The teacher should not have seen those rows
+either: train it with run.py --dev-size of the number of rows the report prints.
+"""
+import argparse
+import os
+import xml.etree.ElementTree
+from time import time
+
+import numpy as np
+import tensorflow as tf
+from tqdm import tqdm
+
+from data_loader import load_emb, load_labelled_data, read_model_data, polarity_array, held_out_size
+from model import AspectLevelModel
+from numpy_model import NumpyAspectLevelModel, softmax
+from predict import load_vocab, Predictor
+from quantize import evaluate, weight_bytes
+
+
+def read_texts(path):
+    """ Sentences of a text file (one per line) or of the <text> elements of a SemEval XML file """
+    if path.endswith('.xml'):
+        for _, e in xml.etree.ElementTree.iterparse(path):
+            if e.tag == 'text' and e.text:
+                yield e.text
+                e.clear()
+    else:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+
+def unlabeled_rows(path, predictor):
+    """ x, x_len, a with every sentence of path paired with every aspect category """
+    aspects = sorted(i for aspect, i in predictor.a2i.items() if aspect != '__UNK__')
+    x, x_len, a = [], [], []
+    for text in read_texts(path):
+        ids, n = predictor.encode_text(text)
+        if n == 0:
+            continue
+        for aspect in aspects:
+            x.append(ids)
+            x_len.append(n)
+            a.append(aspect)
+    return (np.asarray(x, dtype=np.int64).reshape(-1, predictor.input_len), np.asarray(x_len, dtype=np.int64),
+            np.asarray(a, dtype=np.int64))
+
+
+def soft_targets(teacher, x, x_len, a, temperature, batch_size=256):
+    """ The teacher's probabilities at the temperature, scored in batches of rows of similar length """
+    order = np.argsort(x_len, kind='stable')
+    p = np.empty((len(order), teacher.class_size), dtype=np.float32)
+    for i in range(0, len(order), batch_size):
+        rows = order[i:i + batch_size]
+        p[rows] = teacher.logits(x[rows], x_len[rows], a[rows])
+    # the graph only exposes probabilities; their log is the logits up to a per-row constant
+    return softmax(np.log(np.maximum(p, 1e-30)) / temperature)
+
+
+def throughput(model, x, x_len, a, batch_size=256):
+    """ Rows / sec in batches of rows of similar length, the way predict.py scores a file """
+    order = np.argsort(x_len, kind='stable')
+    st = time()
+    for i in range(0, len(order), batch_size):
+        rows = order[i:i + batch_size]
+        model.predict(x[rows], x_len[rows], a[rows])
+    return len(order) / (time() - st)
+
+
+def layer_bytes(model):
+    """ Weight bytes without the embedding matrices, which the teacher and the student share """
+    return weight_bytes(model) - model.embedding_matrix.nbytes - model.aspect_embedding_matrix.nbytes
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('teacher', help='weights of the trained AspectLevelModel, exported by run.py')
+    parser.add_argument('output', help='where to export the student weights')
+    parser.add_argument('--unlabeled', default=None, help='unlabeled review sentences: text (one per line) or XML')
+    parser.add_argument('--cell', default='lstm', choices=['lstm', 'gru'])
+    parser.add_argument('--hidden-size', type=int, default=64)
+    parser.add_argument('--temperature', type=float, default=2.0)
+    parser.add_argument('--alpha', type=float, default=0.7, help='weight of the soft targets, 1 - alpha of the labels')
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--learning-rate', type=float, default=0.01)
+    parser.add_argument('--keep-prob', type=float, default=0.8, help='dropout keep probability of the inputs')
+    parser.add_argument('--l2-reg', type=float, default=0.01, help='l2 regularizer of the attention vector w')
+    parser.add_argument('--reg-lambda', type=float, default=0.0001, help='l2 penalty on all trainable variables')
+    parser.add_argument('--eval-fraction', type=float, default=0.1,
+                        help='share of the training rows held out at their end for the report')
+    parser.add_argument('--dev-size', type=int, default=None, help='rows held out instead of --eval-fraction')
+    parser.add_argument('--vocab-dir', default='../data/semeval14')
+    parser.add_argument('--threads', type=int, default=0, help='tensorflow intra-op threads (0: all cores)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    batch_size, input_len = 25, 80
+
+    teacher = NumpyAspectLevelModel.load(args.teacher)
+
+    # transfer set: the training rows but the held-out ones (hard labels kept), then the unlabeled pairs
+    df, sentences = read_model_data('../data/semeval14/rest_train_data.pkl')
+    held_out = held_out_size(df.shape[0], args.eval_fraction, args.dev_size)
+    df = df.head(df.shape[0] - held_out)
+    x = sentences[df['sentence'].values].astype(np.int64)
+    x_len = np.asarray(df['seq_len'], dtype=np.int64)
+    a = np.asarray(df['aspect'], dtype=np.int64)
+    y = polarity_array(df['polarity'])
+    hard_mask = np.ones(len(y), dtype=np.float32)
+    # the report compares teacher and student on the rows held out of the transfer set (the test split has no gold
+    # polarities); loaded now, so a split without labels fails before training rather than after
+    tx, tx_len, ta, ty = load_labelled_data('../data/semeval14/rest_train_data.pkl', held_out)
+    if args.unlabeled:
+        w2i, a2i = load_vocab(args.vocab_dir)
+        ux, ux_len, ua = unlabeled_rows(args.unlabeled, Predictor(teacher, w2i, a2i, input_len))
+        print("%d unlabeled (sentence, aspect) pairs from %s" % (len(ux_len), args.unlabeled))
+        x, x_len, a = np.concatenate([x, ux]), np.concatenate([x_len, ux_len]), np.concatenate([a, ua])
+        y = np.concatenate([y, np.zeros((len(ux_len), y.shape[1]), dtype=y.dtype)])
+        hard_mask = np.concatenate([hard_mask, np.zeros(len(ux_len), dtype=np.float32)])
+    soft = soft_targets(teacher, x, x_len, a, args.temperature)
+    print("%d rows in the transfer set" % len(x_len))
+
+    embedding, aspect_embedding, vocab_size, aspect_vocab_size = load_emb()
+    tf.set_random_seed(args.seed)
+    rng = np.random.RandomState(args.seed)
+    session_config = tf.ConfigProto(intra_op_parallelism_threads=args.threads)
+    with tf.Session(config=session_config) as session:
+        # same inputs as the teacher, so the student reads the same vocabularies and exports the same layout
+        student = AspectLevelModel(args.cell, hidden_size=args.hidden_size, vocab_size=vocab_size,
+                                   aspect_vocab_size=aspect_vocab_size,
+                                   embedding_size=embedding.shape[1],
+                                   aspect_embedding_size=aspect_embedding.shape[1],
+                                   input_length=input_len, batch_size=batch_size,
+                                   learning_rate=args.learning_rate, l2_reg=args.l2_reg,
+                                   reg_lambda=args.reg_lambda,
+                                   distillation_alpha=args.alpha, temperature=args.temperature)
+        session.run(tf.global_variables_initializer())
+        session.run([student.embedding_init, student.aspect_embedding_init],
+                    feed_dict={student.embedding_placeholder: embedding,
+                               student.aspect_embedding_placeholder: aspect_embedding})
+
+        print("Training")
+        for epoch in range(args.epochs):
+            # the graph has a fixed batch size: the last partial batch of every shuffle is left out
+            order = rng.permutation(len(x_len))
+            loss = []
+            for i in tqdm(range(0, len(order) - batch_size + 1, batch_size)):
+                rows = order[i:i + batch_size]
+                fd = {
+                    student.inputs: x[rows],
+                    student.inputs_length: x_len[rows],
+                    student.input_aspect: a[rows],
+                    student.targets: y[rows],
+                    student.soft_targets: soft[rows],
+                    student.hard_mask: hard_mask[rows],
+                    student.keep_prob1: args.keep_prob
+                }
+                _, l = session.run([student.train_op, student.loss], feed_dict=fd)
+                loss.append(l)
+            print("Epoch %d: loss %.4f" % (epoch + 1, np.mean(loss)))
+
+        out_dir = os.path.dirname(args.output)
+        if out_dir and not os.path.exists(out_dir):
+            os.makedirs(out_dir)
+        student.export_weights(session, args.output)
+        print("Exported the student to", args.output)
+
+    # report: the student through the same numpy entry point as the teacher
+    student = NumpyAspectLevelModel.load(args.output)
+    print("Accuracy and ms / batch on the %d labelled rows of the last %d of rest_train_data.pkl (train the teacher "
+          "with run.py --dev-size %d), rows / sec over the %d rows of the transfer set"
+          % (len(ty), held_out, held_out, len(x_len)))
+    print("%-8s %8s %10s %12s %12s %12s" % ('', 'hidden', 'accuracy', 'ms / batch', 'rows / sec', 'layers MB'))
+    results = []
+    for name, model in [('teacher', teacher), ('student', student)]:
+        acc, ms = evaluate(model, tx, tx_len, ta, ty, batch_size)
+        rps = throughput(model, x, x_len, a)
+        results.append((acc, ms, rps))
+        print("%-8s %8d %10.4f %12.3f %12.1f %12.2f" % (name, model.hidden_size, acc, ms, rps,
+                                                        layer_bytes(model) / 2.0 ** 20))
+    (t_acc, t_ms, t_rps), (s_acc, s_ms, s_rps) = results
+    print("accuracy gap %+.4f, latency x%.2f faster, throughput x%.2f" % (s_acc - t_acc, t_ms / s_ms, s_rps / t_rps))
@@ -1,3 +1,4 @@
+import numpy as np
 import tensorflow as tf
 
 
@@ -14,7 +15,12 @@ class AspectLevelModel():
                  input_length, batch_size,
                  bidirectional=False,
                  attention=False,
-                 debug=False):
+                 debug=False,
+                 learning_rate=0.01,
+                 l2_reg=0.01,
+                 reg_lambda=0.001,
+                 distillation_alpha=None,
+                 temperature=1.0):
         self.hidden_size = hidden_size  # d in paper
         self.aspect_vocab_size = aspect_vocab_size
         self.debug = debug
@@ -26,9 +32,15 @@ class AspectLevelModel():
         self.N = input_length
         self.batch_size = batch_size
 
-        self.l2_reg = 0.01
+        self.l2_reg = l2_reg
+        self.reg_lambda = reg_lambda
+        # with distillation_alpha the loss mixes soft targets of a teacher with the hard labels (see distill.py)
+        self.distillation_alpha = distillation_alpha
+        self.temperature = temperature
 
         self.class_size = 3
+        self.initial_learning_rate = learning_rate
+        self.cell_type = cell
         if cell == 'lstm':
             self.cell = tf.contrib.rnn.BasicLSTMCell(hidden_size)
         elif cell == 'gru':
@@ -171,9 +183,9 @@ class AspectLevelModel():
 
             Wh = tf.Variable(
                 tf.random_normal(shape=[self.hidden_size, self.hidden_size], stddev=1.0 / tf.sqrt(600.0)),
-                dtype=tf.float32)  # -> [d, d]
+                dtype=tf.float32, name='Wh')  # -> [d, d]
             Wv = tf.Variable(tf.random_normal(shape=[self.aspect_embedding_size, self.aspect_embedding_size],
-                                              stddev=1.0 / tf.sqrt(600.0)), dtype=tf.float32)  # -> [da, da]
+                                              stddev=1.0 / tf.sqrt(600.0)), dtype=tf.float32, name='Wv')  # -> [da, da]
 
             w = tf.get_variable(
                 name='w',
@@ -214,17 +226,19 @@ class AspectLevelModel():
 
             Wp = tf.Variable(
                 tf.random_normal(shape=[self.hidden_size, self.hidden_size], stddev=1.0 / tf.sqrt(600.0)),
-                dtype=tf.float32)
+                dtype=tf.float32, name='Wp')
 
             Wx = tf.Variable(
                 tf.random_normal(shape=[self.hidden_size, self.hidden_size], stddev=1.0 / tf.sqrt(600.0)),
-                dtype=tf.float32)
+                dtype=tf.float32, name='Wx')
 
             # -> ([batch_size, d x 1] x [d, d])  + ([batch_size, d] x [d, d]) = [batch_size, d]
             r_ = tf.reshape(r, [batch_size, d])
             print("r_: ", r_.get_shape())
 
-            h_star = tf.tanh(tf.add(tf.matmul(r_, Wp), tf.matmul(self.state.h, Wx)),
+            # LSTMStateTuple carries (c, h); the GRU state is h itself
+            last_h = self.state.h if isinstance(self.state, tf.contrib.rnn.LSTMStateTuple) else self.state
+            h_star = tf.tanh(tf.add(tf.matmul(r_, Wp), tf.matmul(last_h, Wx)),
                              name='sentence_representation')  # -> [1, d]
             h_star = tf.reshape(h_star, [batch_size, d])
 
@@ -232,15 +246,19 @@ class AspectLevelModel():
 
             Ws = tf.Variable(
                 tf.random_normal(shape=[self.hidden_size, self.class_size], stddev=1.0 / tf.sqrt(600.0)),
-                dtype=tf.float32)
+                dtype=tf.float32, name='Ws')
 
-            bs = tf.Variable(tf.zeros(shape=[1, self.class_size]))
+            bs = tf.Variable(tf.zeros(shape=[1, self.class_size]), name='bs')
+
+            # kept around so the trained weights can be exported for inference outside tensorflow
+            self.attention_weights = {'Wh': Wh, 'Wv': Wv, 'w': w, 'Wp': Wp, 'Wx': Wx, 'Ws': Ws, 'bs': bs}
 
             # Ws - > [d, c] , h* -> [batch_size, d]
             # [batch_size, d] x [d, c] = [batch_size, c]
             e = tf.add(tf.reshape(tf.matmul(h_star, Ws), [batch_size, self.class_size]),
                        tf.tile(bs, (batch_size, 1)))
             print("e: ", e.get_shape())
+            self.class_scores = e
             # y -> [batch_size, class_size]
             self.y = tf.nn.softmax(e)
             print("y: ", self.y.get_shape())
@@ -252,8 +270,64 @@ class AspectLevelModel():
             print("prediction_train: ", self.prediction_train.get_shape())
 
     def _init_optimizer(self):
-        reg_lambda = 0.001
+        reg_lambda = self.reg_lambda
         # self.loss = tf.reduce_mean(tf.nn.softmax_cross_entropy_with_logits(logits=self.logits_train, labels=self.targets))
-        self.loss = - tf.reduce_mean(tf.cast(self.targets, tf.float32) * tf.log(self.logits_train)) + tf.reduce_sum(
-            [reg_lambda * tf.nn.l2_loss(x) for x in tf.trainable_variables()])
-        self.train_op = tf.train.AdamOptimizer(0.01).minimize(self.loss)
+        if self.distillation_alpha is None:
+            self.loss = - tf.reduce_mean(tf.cast(self.targets, tf.float32) * tf.log(self.logits_train))
+        else:
+            self.loss = self._distillation_loss()
+        self.loss += tf.reduce_sum([reg_lambda * tf.nn.l2_loss(x) for x in tf.trainable_variables()])
+        # a variable rather than a constant so a plateau schedule can lower it, and checkpoints keep it
+        self.learning_rate = tf.Variable(self.initial_learning_rate, trainable=False, dtype=tf.float32,
+                                         name='learning_rate')
+        self.new_learning_rate = tf.placeholder(tf.float32, shape=(), name='new_learning_rate')
+        self.learning_rate_update = tf.assign(self.learning_rate, self.new_learning_rate)
+        self.optimizer = tf.train.AdamOptimizer(self.learning_rate)
+        # kept separate from the update so data-parallel training can average gradients across workers first
+        self.grads_and_vars = [(g, v) for g, v in self.optimizer.compute_gradients(self.loss) if g is not None]
+        self.train_op = self.optimizer.apply_gradients(self.grads_and_vars)
+
+    def _distillation_loss(self):
+        """
+        alpha x cross-entropy with the teacher's probabilities softened by the temperature T (times T^2, so the
+        gradients keep their size as T changes) + (1 - alpha) x cross-entropy with the hard labels, on the rows
+        where hard_mask is 1 (unlabeled text only has soft targets)
+        """
+        self.soft_targets = tf.placeholder(shape=(None, self.class_size), dtype=tf.float32, name='soft_targets')
+        self.hard_mask = tf.placeholder(shape=(None,), dtype=tf.float32, name='hard_mask')
+        T = self.temperature
+        soft = - tf.reduce_mean(tf.reduce_sum(self.soft_targets * tf.nn.log_softmax(self.class_scores / T), 1)) * T * T
+        hard = - tf.reduce_sum(tf.reduce_sum(tf.cast(self.targets, tf.float32) * tf.log(self.logits_train), 1) *
+                               self.hard_mask) / tf.maximum(tf.reduce_sum(self.hard_mask), 1.0)
+        return self.distillation_alpha * soft + (1 - self.distillation_alpha) * hard
+
+    def set_learning_rate(self, session, learning_rate):
+        session.run(self.learning_rate_update, feed_dict={self.new_learning_rate: learning_rate})
+
+    def get_weight_tensors(self):
+        """ Map of export name -> variable for everything the forward pass needs """
+        tensors = {
+            'embedding_matrix': self.embedding_matrix,
+            'aspect_embedding_matrix': self.aspect_embedding_matrix,
+        }
+        tensors.update(self.attention_weights)
+        # BasicLSTMCell -> rnn/basic_lstm_cell/{kernel,bias}
+        # GRUCell -> rnn/gru_cell/{gates,candidate}/{kernel,bias}
+        for v in tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='RNN/rnn/'):
+            name = v.op.name.split('/')
+            kind = 'kernel' if name[-1] in ('kernel', 'weights') else 'bias'
+            if name[-2] in ('gates', 'candidate'):
+                tensors['cell_%s_%s' % (name[-2], kind)] = v
+            else:
+                tensors['cell_%s' % kind] = v
+        return tensors
+
+    def export_weights(self, session, path):
+        """ Dump the trained weights to a .npz file readable by numpy_model.NumpyAspectLevelModel """
+        tensors = self.get_weight_tensors()
+        names = sorted(tensors.keys())
+        values = session.run([tensors[n] for n in names])
+        weights = dict(zip(names, values))
+        weights['cell'] = np.asarray(self.cell_type)
+        np.savez(path, **weights)
+        return path
@@ -0,0 +1,128 @@
+import numpy as np
+
+
+def sigmoid(x):
+    return 0.5 * (np.tanh(0.5 * x) + 1.0)
+
+
+def softmax(x, axis=-1):
+    e = np.exp(x - np.max(x, axis=axis, keepdims=True))
+    return e / np.sum(e, axis=axis, keepdims=True)
+
+
+def skipped(embeddings=None, aspect_embeddings=None):
+    """ Entries of exported weights that are not loaded: the cell name, and the matrices read from a store """
+    return (('cell',) + (('embedding_matrix',) if embeddings is not None else ()) +
+            (('aspect_embedding_matrix',) if aspect_embeddings is not None else ()))
+
+
+class NumpyAspectLevelModel():
+    """
+    Inference-only forward pass of AspectLevelModel written against numpy alone, so serving does not
+    need to import tensorflow. Weights come from AspectLevelModel.export_weights.
+    """
+
+    def __init__(self, weights, cell, dtype=np.float32, embeddings=None, aspect_embeddings=None):
+        self.dtype = np.dtype(dtype)
+        self.cell_type = cell
+        self.weights = {k: np.asarray(v, dtype=self.dtype) for k, v in weights.items()}
+        for k, v in self.weights.items():
+            setattr(self, k, v)
+        if embeddings is not None:
+            # rows shared with other processes and domains, see data_process_pipeline/embedding_store.py
+            self.embedding_matrix = embeddings
+        if aspect_embeddings is not None:
+            self.aspect_embedding_matrix = aspect_embeddings
+        self.hidden_size = self.Wh.shape[0]
+        self.class_size = self.Ws.shape[1]
+        if cell == 'lstm':
+            self.step = self._lstm_step
+        elif cell == 'gru':
+            self.step = self._gru_step
+        else:
+            raise ValueError("Unknown cell type: %s" % cell)
+
+    @classmethod
+    def load(cls, path, dtype=np.float32, embeddings=None, aspect_embeddings=None):
+        """
+        embeddings, aspect_embeddings -> embedding_store.DomainEmbedding used instead of the exported
+        embedding_matrix / aspect_embedding_matrix (EmbeddingStore.load_kwargs gives both)
+        """
+        with np.load(path) as f:
+            weights = {k: f[k] for k in f.files if k not in skipped(embeddings, aspect_embeddings)}
+            cell = str(f['cell'])
+        return cls(weights, cell, dtype=dtype, embeddings=embeddings, aspect_embeddings=aspect_embeddings)
+
+    def matmul(self, x, name):
+        """ Every dense layer goes through here so quantize.py can swap in int8 weights """
+        return np.dot(x, self.weights[name])
+
+    def _lstm_step(self, x_t, state):
+        # same gate layout as tf.contrib.rnn.BasicLSTMCell: i, j, f, o with forget_bias=1.0
+        c, h = state
+        z = self.matmul(np.concatenate([x_t, h], 1), 'cell_kernel') + self.cell_bias
+        i, j, f, o = np.split(z, 4, axis=1)
+        new_c = c * sigmoid(f + 1.0) + sigmoid(i) * np.tanh(j)
+        new_h = np.tanh(new_c) * sigmoid(o)
+        return new_h, (new_c, new_h)
+
+    def _gru_step(self, x_t, state):
+        # same layout as tf.contrib.rnn.GRUCell: gates -> r, u then candidate over [x, r * h]
+        h = state
+        g = sigmoid(self.matmul(np.concatenate([x_t, h], 1), 'cell_gates_kernel') + self.cell_gates_bias)
+        r, u = np.split(g, 2, axis=1)
+        c = np.tanh(self.matmul(np.concatenate([x_t, r * h], 1), 'cell_candidate_kernel') + self.cell_candidate_bias)
+        new_h = u * h + (1 - u) * c
+        return new_h, new_h
+
+    def _zero_state(self, batch_size):
+        h = np.zeros((batch_size, self.hidden_size), dtype=self.dtype)
+        if self.cell_type == 'lstm':
+            return h, h.copy()
+        return h
+
+    @staticmethod
+    def _last_h(state):
+        return state[1] if isinstance(state, tuple) else state
+
+    def rnn(self, inputs, inputs_length):
+        """ Mirrors tf.nn.dynamic_rnn: outputs past a row's length are zero and its state stops updating """
+        batch_size, N = inputs.shape[0], inputs.shape[1]
+        outputs = np.zeros((batch_size, N, self.hidden_size), dtype=self.dtype)
+        state = self._zero_state(batch_size)
+        steps = min(N, int(np.max(inputs_length))) if batch_size else 0
+        for t in range(steps):
+            live = (inputs_length > t)[:, None]
+            h, new_state = self.step(inputs[:, t, :], state)
+            outputs[:, t, :] = np.where(live, h, 0)
+            if isinstance(state, tuple):
+                state = tuple(np.where(live, n, s) for n, s in zip(new_state, state))
+            else:
+                state = np.where(live, new_state, state)
+        return outputs, state
+
+    def logits(self, x, x_len, a):
+        """ x -> [batch_size, N] word ids, x_len -> [batch_size], a -> [batch_size] aspect ids """
+        x = np.asarray(x)
+        x_len = np.asarray(x_len)
+        batch_size, N = x.shape
+        d = self.hidden_size
+
+        aspect = self.aspect_embedding_matrix[np.asarray(a)]  # -> [batch_size, da]
+        da = aspect.shape[1]
+        inputs = np.concatenate([self.embedding_matrix[x],
+                                 np.broadcast_to(aspect[:, None, :], (batch_size, N, da))], 2)
+        outputs, state = self.rnn(inputs, x_len)  # -> [batch_size, N, d]
+
+        a_ = self.matmul(outputs.reshape(-1, d), 'Wh').reshape(batch_size, N, d)
+        b = np.broadcast_to(self.matmul(aspect, 'Wv')[:, None, :], (batch_size, N, da))
+        M = np.tanh(np.concatenate([a_, b], 2)).reshape(batch_size * N, d + da)
+        # the graph applies the softmax over the trailing unit axis of [batch_size x N, 1]
+        alpha = softmax(np.dot(M, self.w)).reshape(batch_size, N, 1)
+        r = np.matmul(outputs.transpose(0, 2, 1), alpha).reshape(batch_size, d)
+
+        h_star = np.tanh(self.matmul(r, 'Wp') + self.matmul(self._last_h(state), 'Wx'))
+        return softmax(self.matmul(h_star, 'Ws') + self.bs)
+
+    def predict(self, x, x_len, a):
+        return np.argmax(self.logits(x, x_len, a), axis=-1)
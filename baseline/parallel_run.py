@@ -0,0 +1,219 @@
+"""
+Data-parallel CPU training: N local worker processes, each on its own shard of TrainData.
+Every step the workers send their gradients to this process, which averages them and sends the
+average back, so all replicas apply the same update and stay identical.
+
+    python parallel_run.py --workers 4 --epochs 10
+    python parallel_run.py --benchmark 1,2,4,8
+    python parallel_run.py --check-convergence 4
+"""
+import argparse
+import multiprocessing as mp
+import os
+from time import time
+
+import numpy as np
+import pandas as pd
+
+hidden_size = 300
+input_len = 80
+
+
+def steps_per_epoch(batch_size, num_workers):
+    """ Batches every shard can serve, so no worker runs out before the others """
+    rows = pd.read_pickle('../data/semeval14/rest_train_data.pkl').shape[0] - batch_size
+    return (rows // num_workers) // batch_size
+
+
+def worker(rank, num_workers, conn, config):
+    # tensorflow is only imported in the workers; the parent never holds a session or its thread pools
+    import tensorflow as tf
+
+    from data_loader import TrainData, load_emb
+    from model import AspectLevelModel
+
+    embedding, aspect_embedding, vocab_size, aspect_vocab_size = load_emb()
+    tf.reset_default_graph()
+    # own dropout masks per shard; the initial weights still come from worker 0
+    tf.set_random_seed(config['seed'] + rank)
+    session_config = tf.ConfigProto(intra_op_parallelism_threads=config['threads'],
+                                    inter_op_parallelism_threads=1)
+    with tf.Session(config=session_config) as session:
+        model = AspectLevelModel(config['cell'], hidden_size=hidden_size, vocab_size=vocab_size,
+                                 aspect_vocab_size=aspect_vocab_size,
+                                 embedding_size=300,
+                                 aspect_embedding_size=300,
+                                 debug=False, input_length=input_len, batch_size=config['batch_size'])
+        grads = [g for g, _ in model.grads_and_vars]
+        variables = [v for _, v in model.grads_and_vars]
+        averaged = [tf.placeholder(tf.float32, v.get_shape()) for v in variables]
+        # same optimizer instance, so the Adam slots are shared with model.train_op
+        apply_op = model.optimizer.apply_gradients(list(zip(averaged, variables)))
+        saver = tf.train.Saver()
+
+        session.run(tf.global_variables_initializer())
+        session.run([model.embedding_init, model.aspect_embedding_init],
+                    feed_dict={model.embedding_placeholder: embedding,
+                               model.aspect_embedding_placeholder: aspect_embedding})
+
+        # every replica starts from worker 0's initial weights
+        if rank == 0:
+            conn.send(session.run(variables))
+        for v, value in zip(variables, conn.recv()):
+            v.load(value, session)
+
+        for epoch in range(config['epochs']):
+            train_data = TrainData(batch_size=config['batch_size'], input_len=input_len,
+                                   shard=rank, num_shards=num_workers)
+            for step in range(config['steps']):
+                x, x_len, a, y = next(train_data)
+                fd = {
+                    model.inputs: x,
+                    model.inputs_length: x_len,
+                    model.input_aspect: a,
+                    model.targets: y,
+                    model.keep_prob1: config['keep_prob']
+                }
+                values = session.run([model.loss] + grads, feed_dict=fd)
+                conn.send((values[0], values[1:]))
+                session.run(apply_op, feed_dict=dict(zip(averaged, conn.recv())))
+
+        # replicas are identical, so only one of them writes the result
+        if rank == 0 and config['save']:
+            if not os.path.exists('saves'):
+                os.makedirs('saves')
+            saver.save(session, 'saves/model.ckpt')
+            model.export_weights(session, 'saves/weights.npz')
+        conn.send('done')
+
+
+def abort(procs):
+    for p in procs:
+        if p.is_alive():
+            p.terminate()
+    for p in procs:
+        p.join()
+
+
+def worker_died(rank, procs, timeout=1.0):
+    """ Terminates every worker and raises for the one that died """
+    procs[rank].join(timeout)
+    code = procs[rank].exitcode
+    abort(procs)
+    return RuntimeError("worker %d exited with code %s" % (rank, code))
+
+
+def receive(rank, conns, procs, timeout=1.0):
+    """
+    conns[rank].recv(), polling so that a worker that dies (OOM, tensorflow error) stops the run instead of
+    leaving the parent blocked forever
+    """
+    conn = conns[rank]
+    while not conn.poll(timeout):
+        # a worker that exits with 0 has finished; the one we wait for has not sent yet, so it died
+        dead = [r for r, p in enumerate(procs) if p.exitcode not in (None, 0) or (r == rank and not p.is_alive())]
+        if dead:
+            raise worker_died(dead[0], procs)
+    try:
+        return conn.recv()
+    except EOFError:
+        raise worker_died(rank, procs)
+
+
+def send(rank, conns, procs, value):
+    try:
+        conns[rank].send(value)
+    except (BrokenPipeError, EOFError, OSError):
+        raise worker_died(rank, procs)
+
+
+def train(num_workers, epochs=1, batch_size=25, steps=None, cell='lstm', keep_prob=0.5, save=True, seed=1):
+    """ Returns the averaged loss of every step and the training throughput in examples/sec """
+    if steps is None:
+        steps = steps_per_epoch(batch_size, num_workers)
+    config = {
+        'cell': cell,
+        'batch_size': batch_size,
+        'epochs': epochs,
+        'steps': steps,
+        'keep_prob': keep_prob,
+        'save': save,
+        'seed': seed,
+        'threads': max(1, mp.cpu_count() // num_workers),
+    }
+    ctx = mp.get_context('spawn')
+    conns, procs = [], []
+    for rank in range(num_workers):
+        parent_conn, child_conn = ctx.Pipe()
+        p = ctx.Process(target=worker, args=(rank, num_workers, child_conn, config))
+        p.start()
+        # only the worker holds its end, so the parent gets EOF rather than blocking when the worker dies
+        child_conn.close()
+        conns.append(parent_conn)
+        procs.append(p)
+
+    initial = receive(0, conns, procs)
+    for rank in range(num_workers):
+        send(rank, conns, procs, initial)
+
+    losses = []
+    st = time()
+    for _ in range(epochs * steps):
+        results = [receive(rank, conns, procs) for rank in range(num_workers)]
+        average = [np.mean(g, axis=0) for g in zip(*[grads for _, grads in results])]
+        for rank in range(num_workers):
+            send(rank, conns, procs, average)
+        losses.append(float(np.mean([l for l, _ in results])))
+    elapsed = time() - st
+
+    for rank in range(num_workers):
+        assert receive(rank, conns, procs) == 'done'
+    for p in procs:
+        p.join()
+    return losses, num_workers * batch_size * epochs * steps / elapsed
+
+
+def benchmark(worker_counts, batch_size=25, steps=20, cell='lstm'):
+    print("%8s %16s %10s" % ('workers', 'examples/sec', 'speedup'))
+    base = None
+    for n in worker_counts:
+        _, eps = train(n, epochs=1, batch_size=batch_size, steps=steps, cell=cell, save=False)
+        base = base or eps
+        print("%8d %16.1f %10.2f" % (n, eps, eps / base))
+
+
+def check_convergence(num_workers, batch_size=25, steps=50, cell='lstm', rtol=1e-3):
+    """
+    N workers with batch b see, step by step, the same rows as 1 worker with batch N * b,
+    so without dropout the two loss curves should match up to floating point summation order.
+    """
+    steps = min(steps, steps_per_epoch(num_workers * batch_size, 1))
+    single, _ = train(1, batch_size=num_workers * batch_size, steps=steps, cell=cell, keep_prob=1.0, save=False)
+    parallel, _ = train(num_workers, batch_size=batch_size, steps=steps, cell=cell, keep_prob=1.0, save=False)
+    diff = np.abs(np.asarray(single) - np.asarray(parallel)) / np.abs(np.asarray(single))
+    print("1 worker final loss %f, %d workers final loss %f, max relative diff %g" % (
+        single[-1], num_workers, parallel[-1], np.max(diff)))
+    return np.max(diff) <= rtol
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=max(1, mp.cpu_count() // 2))
+    parser.add_argument('--epochs', type=int, default=1000)
+    parser.add_argument('--batch-size', type=int, default=25)
+    parser.add_argument('--cell', default='lstm', choices=['lstm', 'gru'])
+    parser.add_argument('--benchmark', help='comma separated worker counts, e.g. 1,2,4,8')
+    parser.add_argument('--check-convergence', type=int, metavar='N',
+                        help='compare the 1-worker and N-worker loss curves')
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark([int(n) for n in args.benchmark.split(',')], batch_size=args.batch_size, cell=args.cell)
+    elif args.check_convergence:
+        ok = check_convergence(args.check_convergence, batch_size=args.batch_size, cell=args.cell)
+        print("Loss curves agree" if ok else "Loss curves diverge")
+    else:
+        st = time()
+        losses, eps = train(args.workers, epochs=args.epochs, batch_size=args.batch_size, cell=args.cell)
+        print("Training Time: ", time() - st, " seconds")
+        print("Final loss: %f, %.1f examples/sec on %d workers" % (losses[-1], eps, args.workers))
@@ -0,0 +1,235 @@
+"""
+Scores a SemEval 2014 XML file with exported weights (numpy_model, no tensorflow) and writes the predicted aspect
+category polarities back in the official format:
+
+    python predict.py saves/weights.npz \
+        ../data/raw_data/SemEval_14/ABSA_TestData_PhaseB/Restaurants_Test_Data_phaseB.xml predictions.xml
+
+The file is read, scored and written in chunks of sentences (constant memory). Within a chunk every
+(sentence, aspect category) pair is encoded like the training data and the pairs are scored in batches of similar
+length, so a batch only runs the LSTM for as many steps as its longest sentence; the predictions are written back in
+the input order. The official accuracy (semeval_base.Evaluate, task 4) is printed when the input or --gold has
+polarities, with the throughput in sentences/sec.
+"""
+import argparse
+import os
+import pickle
+import sys
+from collections import OrderedDict
+from time import time
+
+import numpy as np
+
+from cache import LRUCache, token_bytes, result_bytes, model_version
+from numpy_model import NumpyAspectLevelModel
+
+# the cleaning, encoding and XML code of the data pipeline (repository root)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_process_pipeline.semeval2014.preprocess import clean
+from data_process_pipeline.embedding_store import EmbeddingStore
+from data_process_pipeline.semeval_xml import read_2014, Writer2014
+
+polarities = ['negative', 'neutral', 'positive']
+
+
+def load_vocab(vocab_dir):
+    """
+    Word ids (the rows of text_vocab.vocab) and aspect ids (the sorted aspects of aspect_vector.pkl), as the
+    pipeline assigned them to the training data
+    """
+    w2i = {}
+    with open(os.path.join(vocab_dir, 'text_vocab.vocab')) as f:
+        for line in f:
+            i, word = line.rstrip('\n').split('\t')
+            w2i[word] = int(i)
+    with open(os.path.join(vocab_dir, 'aspect_vector.pkl'), 'rb') as f:
+        a2i = {aspect: i for i, aspect in enumerate(sorted(pickle.load(f).keys()))}
+    return w2i, a2i
+
+
+class Predictor():
+    """
+    Encodes (text, aspect) pairs like create_model_data and predicts their polarity in length-sorted batches.
+
+    With cache_bytes, the token ids of raw texts (a quarter of cache_bytes) and the probabilities of
+    (token ids, aspect, model version) are kept in LRU caches, so repeated sentences, or sentences that only differ
+    in what clean() normalizes away, are neither encoded nor scored again. Assigning a new model clears the results.
+    """
+
+    def __init__(self, model, w2i, a2i, input_len=80, batch_size=256, cache_bytes=0):
+        self.w2i = w2i
+        self.a2i = a2i
+        self.unk, self.pad = w2i['__UNK__'], w2i['__PAD__']
+        self.input_len = input_len
+        self.batch_size = batch_size
+        self.tokens = LRUCache(cache_bytes // 4, token_bytes) if cache_bytes else None
+        self.results = LRUCache(cache_bytes - cache_bytes // 4, result_bytes) if cache_bytes else None
+        self.model = model
+
+    @property
+    def model(self):
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
+        if self.results is not None:
+            self.version = model_version(model)
+            self.results.clear()
+
+    def cache_stats(self):
+        """ Counters of the token and result caches, None without cache """
+        if self.results is None:
+            return None
+        return {'tokens': self.tokens.stats(), 'results': self.results.stats()}
+
+    def token_ids(self, text):
+        """ Word ids of the whole cleaned text """
+        ids = self.tokens.get(text) if self.tokens is not None else None
+        if ids is None:
+            ids = tuple(self.w2i.get(w, self.unk) for w in clean(text))
+            if self.tokens is not None:
+                self.tokens.put(text, ids)
+        return ids
+
+    def encode_text(self, text):
+        """ Padded word ids and length; sentences longer than input_len are cut """
+        ids = list(self.token_ids(text)[:self.input_len])
+        return ids + [self.pad] * (self.input_len - len(ids)), len(ids)
+
+    def aspect_id(self, aspect):
+        aspect = 'miscellaneous' if aspect == 'anecdotes/miscellaneous' else aspect
+        return self.a2i[aspect] if aspect in self.a2i else self.a2i['__UNK__']
+
+    def probabilities(self, x, x_len, a):
+        """ Class probabilities per row; with the cache only rows not seen with this model are scored, once each """
+        x, x_len, a = np.asarray(x), np.asarray(x_len), np.asarray(a)
+        if self.results is None:
+            return self.score(x, x_len, a)
+        p = np.empty((len(x_len), len(polarities)), dtype=np.float64)
+        missing = OrderedDict()
+        for i in range(len(x_len)):
+            key = (x[i, :x_len[i]].astype(np.int32).tobytes(), int(a[i]), self.version)
+            if key in missing:
+                # a repeat within the call is scored once with the first, which counts it as a hit
+                missing[key].append(i)
+                self.results.hits += 1
+                continue
+            hit = self.results.get(key)
+            if hit is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                p[i] = hit
+        if missing:
+            first = [rows[0] for rows in missing.values()]
+            scored = self.score(x[first], x_len[first], a[first])
+            for (key, rows), row in zip(missing.items(), scored):
+                p[rows] = row
+                self.results.put(key, row.copy())
+        return p
+
+    def score(self, x, x_len, a):
+        """ Class probabilities per row, scored in batches of rows of similar length """
+        order = np.argsort(x_len, kind='stable')
+        p = np.empty((len(order), len(polarities)), dtype=np.float64)
+        for i in range(0, len(order), self.batch_size):
+            rows = order[i:i + self.batch_size]
+            p[rows] = self.model.logits(x[rows], x_len[rows], a[rows])
+        return p
+
+    def predict(self, x, x_len, a):
+        """ Class index per row """
+        return np.argmax(self.probabilities(x, x_len, a), axis=-1)
+
+    def predict_sentences(self, sentences):
+        """ sentences -> (text, [aspect, ...]) per sentence; returns the polarities of the aspects, per sentence """
+        x, x_len, a = [], [], []
+        for text, aspects in sentences:
+            if aspects:
+                ids, n = self.encode_text(text)
+                for aspect in aspects:
+                    x.append(ids)
+                    x_len.append(n)
+                    a.append(self.aspect_id(aspect))
+        p = iter(self.predict(np.asarray(x, dtype=np.int64).reshape(-1, self.input_len), x_len, a))
+        return [[polarities[next(p)] for _ in aspects] for _, aspects in sentences]
+
+
+def chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def score_file(predictor, test_path, save_path, gold_path=None, chunk_size=4096):
+    """ Writes the predictions of test_path to save_path; returns (correct, total, sentences, pairs, seconds) """
+    st = time()
+    gold = read_2014(gold_path) if gold_path else None
+    correct, total, n_sentences, n_pairs = 0, 0, 0, 0
+    with Writer2014(save_path) as out:
+        for chunk in chunks(read_2014(test_path), chunk_size):
+            predicted = predictor.predict_sentences([(text, [c for c, _ in categories or []])
+                                                     for _, text, _, categories in chunk])
+            for (id, text, terms, categories), ps in zip(chunk, predicted):
+                gold_categories = categories
+                if gold is not None:
+                    gold_id, _, _, gold_categories = next(gold)
+                    assert gold_id == id, "%s and %s are not in the same order" % (test_path, gold_path)
+                if gold_categories and all(g is not None for _, g in gold_categories):
+                    # as semeval_base.Evaluate: pairwise, and every prediction counts (conflict is never right)
+                    correct += sum(g == p for (_, g), p in zip(gold_categories, ps))
+                    total += len(ps)
+                if categories is not None:
+                    categories = [(c, p) for (c, _), p in zip(categories, ps)]
+                out.write(id, text, terms, categories)
+                n_pairs += len(ps)
+            n_sentences += len(chunk)
+    return correct, total, n_sentences, n_pairs, time() - st
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('weights', help='weights exported by run.py (or quantize.py with --int8)')
+    parser.add_argument('test', help='SemEval 2014 XML with aspect categories')
+    parser.add_argument('output', help='predictions, in the format of the input')
+    parser.add_argument('--gold', default=None, help='gold polarities for the accuracy, if the input has none')
+    parser.add_argument('--vocab-dir', default='../data/semeval14')
+    parser.add_argument('--int8', action='store_true', help='weights written by quantize.py')
+    parser.add_argument('--embedding-store', default=None,
+                        help='read the word embeddings from this shared store (embedding_store.py) instead')
+    parser.add_argument('--domain', default='semeval14', help='domain of the vocabulary in --embedding-store')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--input-len', type=int, default=80, help='the input length of the trained graph')
+    parser.add_argument('--cache-mb', type=float, default=0,
+                        help='cache token ids and results of repeated sentences in this many MB (0: no cache)')
+    parser.add_argument('--chunk-size', type=int, default=4096, help='sentences read, scored and written at a time')
+    args = parser.parse_args()
+
+    embeddings = EmbeddingStore(args.embedding_store).load_kwargs(args.domain) if args.embedding_store else {}
+    if args.int8:
+        from quantize import QuantizedAspectLevelModel
+        model = QuantizedAspectLevelModel.load(args.weights, **embeddings)
+    else:
+        model = NumpyAspectLevelModel.load(args.weights, **embeddings)
+    w2i, a2i = load_vocab(args.vocab_dir)
+    predictor = Predictor(model, w2i, a2i, args.input_len, args.batch_size, int(args.cache_mb * 2 ** 20))
+
+    correct, total, n_sentences, n_pairs, seconds = score_file(predictor, args.test, args.output, args.gold,
+                                                               args.chunk_size)
+    print("Wrote %s: %d sentences, %d aspect categories" % (args.output, n_sentences, n_pairs))
+    if total:
+        print('Accuracy = %f, #Correct/#All: %d/%d' % (correct / float(total), correct, total))
+    else:
+        print("No gold polarities, accuracy not computed (see --gold)")
+    print("%.1f sentences/sec, %.1f aspect categories/sec (%.2f seconds)" % (
+        n_sentences / seconds, n_pairs / seconds, seconds))
+    if predictor.cache_stats():
+        for name, stats in sorted(predictor.cache_stats().items()):
+            print("%s cache: %d entries, %.1f / %.1f MB, %d hits, %d misses (%.1f%%), %d evictions" % (
+                name, stats['entries'], stats['bytes'] / 2.0 ** 20, stats['max_bytes'] / 2.0 ** 20, stats['hits'],
+                stats['misses'], 100 * stats['hit_rate'], stats['evictions']))
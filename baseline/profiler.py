@@ -0,0 +1,84 @@
+import json
+import os
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import time
+
+PHASES = ['data', 'train', 'eval', 'log']
+
+
+class StepProfiler():
+    """
+    Wall time per training step, split into phases (data loading, the train session.run, evaluation
+    and logging). Every trace_every-th step also records a tensorflow timeline, written as a Chrome
+    trace (open in chrome://tracing). A disabled profiler costs one branch per phase.
+    """
+
+    def __init__(self, enabled=False, trace_every=0, trace_dir='profile'):
+        self.enabled = enabled
+        self.trace_every = trace_every
+        self.trace_dir = trace_dir
+        self.steps = []
+        self.epochs = []
+        self.current = OrderedDict((p, 0.0) for p in PHASES)
+        self.step = 0
+        self.run_metadata = None
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        st = time()
+        try:
+            yield
+        finally:
+            self.current[name] += time() - st
+
+    def run_kwargs(self):
+        """ Extra session.run arguments; non-empty only for sampled steps """
+        if not (self.enabled and self.trace_every and self.step % self.trace_every == 0):
+            return {}
+        import tensorflow as tf
+        self.run_metadata = tf.RunMetadata()
+        return {'options': tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+                'run_metadata': self.run_metadata}
+
+    def end_step(self):
+        if not self.enabled:
+            return
+        if self.run_metadata is not None:
+            self._write_trace()
+            self.run_metadata = None
+        self.steps.append(self.current)
+        self.current = OrderedDict((p, 0.0) for p in PHASES)
+        self.step += 1
+
+    def _write_trace(self):
+        from tensorflow.python.client import timeline
+        if not os.path.exists(self.trace_dir):
+            os.makedirs(self.trace_dir)
+        trace = timeline.Timeline(self.run_metadata.step_stats).generate_chrome_trace_format()
+        with open(os.path.join(self.trace_dir, 'timeline_step_%d.json' % self.step), 'w') as f:
+            f.write(trace)
+
+    def end_epoch(self, epoch):
+        """ Prints the per-phase table for the steps since the last call and returns it """
+        if not self.enabled or not self.steps:
+            return None
+        steps, self.steps = self.steps, []
+        totals = OrderedDict((p, sum(s[p] for s in steps)) for p in PHASES)
+        total = sum(totals.values())
+        print("Epoch %d: %d steps, %.2f seconds" % (epoch, len(steps), total))
+        print("%8s %12s %14s %8s" % ('phase', 'total (s)', 'per step (ms)', '%'))
+        for p, t in totals.items():
+            print("%8s %12.3f %14.3f %8.1f" % (p, t, 1000.0 * t / len(steps), 100.0 * t / total if total else 0.0))
+        summary = {'epoch': epoch, 'steps': len(steps), 'seconds': totals}
+        self.epochs.append(summary)
+        return summary
+
+    def save(self, path):
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            json.dump(self.epochs, f, indent=2)
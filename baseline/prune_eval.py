@@ -0,0 +1,89 @@
+"""
+Accuracy a trained model gives up when the vocabulary is pruned (data_process_pipeline/prune.py), without
+retraining: the words a --min-count / --max-vocab / --coverage setting drops are mapped to __UNK__, as
+predict.Predictor and create_model_data would encode them with the pruned text_vocab.vocab, and the exported weights
+are scored before and after with the embedding MB the setting saves.
+
+    python prune_eval.py saves/weights.npz --coverage 0.99 0.995 0.999 --min-count 2 3 [--eval-fraction 0.1]
+
+Accuracy is measured on the labelled rows held out at the end of rest_train_data.pkl, --eval-fraction of them
+(default 10%) or --dev-size rows: the test split built from the phase B XML has no gold polarities. Train the model
+with run.py --dev-size of the number of rows printed, so it has not seen them. Word counts are taken
+from the encoded train and test splits like get_vocab counts them. A model retrained on the
+pruned vocabulary also learns an __UNK__ vector that stands for those words, so this is the cost before retraining.
+"""
+import argparse
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+
+from data_loader import read_model_data, load_labelled_data, held_out_size
+from numpy_model import NumpyAspectLevelModel
+from predict import load_vocab
+from quantize import evaluate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_process_pipeline.prune import keep_words, special_words
+
+
+def token_counts(paths):
+    """ Occurrences of every word id in the rows of the encoded splits (each aspect row counts its sentence) """
+    counts = Counter()
+    for path in paths:
+        df, sentences = read_model_data(path)
+        for s, n in zip(df['sentence'].values, df['seq_len'].values):
+            counts.update(sentences[s][:n].tolist())
+    return counts
+
+
+def remap_pruned(vocab_size, counts, unk, keep, **prune):
+    """ Lookup array from word id to word id with the ids a setting prunes sent to unk, and the kept count """
+    kept = keep_words([(i, counts[i]) for i in range(vocab_size)], keep=keep, **prune)
+    remap = np.full(vocab_size, unk, dtype=np.int64)
+    remap[kept] = kept
+    return remap, len(kept)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('weights', help='weights exported by run.py')
+    parser.add_argument('--vocab-dir', default='../data/semeval14')
+    parser.add_argument('--train', default='../data/semeval14/rest_train_data.pkl',
+                        help='counted, and the rows held out at its end are scored')
+    parser.add_argument('--test', default='../data/semeval14/rest_test_data.pkl', help='only counted')
+    parser.add_argument('--eval-fraction', type=float, default=0.1,
+                        help='share of the --train rows held out at their end and scored')
+    parser.add_argument('--dev-size', type=int, default=None, help='rows held out instead of --eval-fraction')
+    parser.add_argument('--min-count', type=int, nargs='*', default=[], help='settings to try')
+    parser.add_argument('--max-vocab', type=int, nargs='*', default=[])
+    parser.add_argument('--coverage', type=float, nargs='*', default=[])
+    args = parser.parse_args()
+
+    model = NumpyAspectLevelModel.load(args.weights)
+    w2i, _ = load_vocab(args.vocab_dir)
+    vocab_size, dim = model.embedding_matrix.shape
+    unk = w2i['__UNK__']
+    keep = [w2i[w] for w in special_words if w in w2i]
+    counts = token_counts([args.train, args.test])
+    tokens = float(sum(counts.values()))
+    held_out = held_out_size(read_model_data(args.train)[0].shape[0], args.eval_fraction, args.dev_size)
+    x, x_len, a, y = load_labelled_data(args.train, held_out)
+    accuracy, _ = evaluate(model, x, x_len, a, y)
+    print("Accuracy on the %d labelled rows of the last %d of %s (train with run.py --dev-size %d)"
+          % (len(y), held_out, args.train, held_out))
+
+    settings = [('min-count %d' % v, {'min_count': v}) for v in args.min_count] + \
+               [('max-vocab %d' % v, {'max_size': v}) for v in args.max_vocab] + \
+               [('coverage %g' % v, {'coverage': v}) for v in args.coverage]
+    print("%-18s %10s %14s %12s %10s %10s" % ('', 'words', 'embedding MB', '__UNK__ %', 'accuracy', 'delta'))
+    print("%-18s %10d %14.2f %12.2f %10.4f" % ('full', vocab_size, vocab_size * dim * 4 / 2.0 ** 20,
+                                               100 * counts[unk] / tokens, accuracy))
+    for name, prune in settings:
+        remap, words = remap_pruned(vocab_size, counts, unk, keep, **prune)
+        unk_tokens = sum(c for i, c in counts.items() if remap[i] == unk)
+        pruned_accuracy, _ = evaluate(model, remap[x], x_len, a, y)
+        print("%-18s %10d %14.2f %12.2f %10.4f %+10.4f" % (name, words, words * dim * 4 / 2.0 ** 20,
+                                                          100 * unk_tokens / tokens, pruned_accuracy,
+                                                          pruned_accuracy - accuracy))
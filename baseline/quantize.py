@@ -0,0 +1,129 @@
+import sys
+from time import time
+
+import numpy as np
+
+from numpy_model import NumpyAspectLevelModel, skipped
+
+# dense layers that dominate per-token compute; the attention vector w and the biases stay in float
+QUANTIZED = ['cell_kernel', 'cell_gates_kernel', 'cell_candidate_kernel', 'Wh', 'Wv', 'Wp', 'Wx', 'Ws']
+
+
+def quantize_per_channel(W):
+    """ Symmetric int8 with one scale per output column """
+    scale = np.max(np.abs(W), axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.round(W / scale), -127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+class CalibratingAspectLevelModel(NumpyAspectLevelModel):
+    """ Float forward pass that records the largest input magnitude seen by every quantized layer """
+
+    def __init__(self, weights, cell, dtype=np.float32):
+        NumpyAspectLevelModel.__init__(self, weights, cell, dtype=dtype)
+        self.input_max = {}
+
+    def matmul(self, x, name):
+        if name in QUANTIZED:
+            self.input_max[name] = max(self.input_max.get(name, 0.0), float(np.max(np.abs(x))) if x.size else 0.0)
+        return NumpyAspectLevelModel.matmul(self, x, name)
+
+
+class QuantizedAspectLevelModel(NumpyAspectLevelModel):
+    """
+    Int8 weights (per-channel scales) and int8 activations (static scales from calibration).
+    numpy has no int8 GEMM, so the int8 operands are multiplied with float32 BLAS: every product and
+    partial sum is an integer below 2^24 for these layer widths, so the result equals an int32 accumulation.
+    """
+
+    def __init__(self, weights, cell, scales, dtype=np.float32, embeddings=None, aspect_embeddings=None):
+        # weights holds the int8 values of the quantized layers; they are kept as floats for BLAS
+        NumpyAspectLevelModel.__init__(self, weights, cell, dtype=dtype, embeddings=embeddings,
+                                       aspect_embeddings=aspect_embeddings)
+        self.scales = {name: ((scale * input_scale).astype(self.dtype), self.dtype.type(input_scale))
+                       for name, (scale, input_scale) in scales.items()}
+        self.int8_bytes = sum(weights[name].size + scale.nbytes for name, (scale, _) in scales.items())
+
+    def matmul(self, x, name):
+        if name not in self.scales:
+            return NumpyAspectLevelModel.matmul(self, x, name)
+        out_scale, input_scale = self.scales[name]
+        x_q = np.clip(np.round(x / input_scale), -127, 127)
+        return np.dot(x_q, self.weights[name]) * out_scale
+
+    @classmethod
+    def load(cls, path, dtype=np.float32, embeddings=None, aspect_embeddings=None):
+        with np.load(path) as f:
+            cell = str(f['cell'])
+            skip = skipped(embeddings, aspect_embeddings)
+            weights = {k: f[k] for k in f.files if k not in skip and '__' not in k}
+            scales = {k: (f[k + '__scale'], f[k + '__input_scale']) for k in weights if weights[k].dtype == np.int8}
+        return cls(weights, cell, scales, dtype=dtype, embeddings=embeddings, aspect_embeddings=aspect_embeddings)
+
+
+def calibrate(model, batches):
+    """ batches -> iterable of (x, x_len, a, ...) training batches """
+    calibrating = CalibratingAspectLevelModel(model.weights, model.cell_type, dtype=np.float32)
+    for batch in batches:
+        calibrating.logits(batch[0], batch[1], batch[2])
+    return calibrating.input_max
+
+
+def quantize_weights(weights_path, save_path, batches):
+    model = NumpyAspectLevelModel.load(weights_path)
+    input_max = calibrate(model, batches)
+    out = {'cell': np.asarray(model.cell_type)}
+    for name, W in model.weights.items():
+        if name in QUANTIZED:
+            q, scale = quantize_per_channel(W)
+            out[name] = q
+            out[name + '__scale'] = scale
+            out[name + '__input_scale'] = np.float32(max(input_max.get(name, 0.0), 1e-8) / 127.0)
+        else:
+            out[name] = W
+    np.savez(save_path, **out)
+    return save_path
+
+
+def weight_bytes(model):
+    if isinstance(model, QuantizedAspectLevelModel):
+        return model.int8_bytes + sum(w.nbytes for k, w in model.weights.items() if k not in model.scales)
+    return sum(w.nbytes for w in model.weights.values())
+
+
+def evaluate(model, x, x_len, a, y, batch_size=25):
+    correct, st = 0, time()
+    for i in range(0, len(y), batch_size):
+        p = model.predict(x[i:i + batch_size], x_len[i:i + batch_size], a[i:i + batch_size])
+        correct += int(np.sum(p == y[i:i + batch_size]))
+    elapsed = time() - st
+    return correct / float(len(y)), 1000.0 * elapsed / max(1, (len(y) + batch_size - 1) // batch_size)
+
+
+if __name__ == '__main__':
+    from data_loader import TrainData, load_labelled_data
+
+    weights_path = sys.argv[1] if len(sys.argv) > 1 else 'saves/weights.npz'
+    save_path = sys.argv[2] if len(sys.argv) > 2 else 'saves/weights_int8.npz'
+    # rows held out at the end of the training data, as run.py --dev-size (default: one batch)
+    dev_size = int(sys.argv[3]) if len(sys.argv) > 3 else 25
+    calibration_batches = 20
+
+    train_data = TrainData(batch_size=25, input_len=80, dev_size=dev_size)
+    batches = [next(train_data) for _ in range(calibration_batches)]
+    quantize_weights(weights_path, save_path, batches)
+    print("Calibrated on %d training batches, wrote %s" % (calibration_batches, save_path))
+
+    # the test split has no gold polarities: the held-out training rows
+    x, x_len, a, y = load_labelled_data('../data/semeval14/rest_train_data.pkl', dev_size)
+    print("Evaluated on the last %d rows of rest_train_data.pkl" % len(y))
+    float_model = NumpyAspectLevelModel.load(weights_path)
+    int8_model = QuantizedAspectLevelModel.load(save_path)
+    float_acc, float_ms = evaluate(float_model, x, x_len, a, y)
+    int8_acc, int8_ms = evaluate(int8_model, x, x_len, a, y)
+    print("%-8s %10s %14s %14s" % ('', 'accuracy', 'ms / batch', 'weight MB'))
+    for name, acc, ms, model in [('float32', float_acc, float_ms, float_model),
+                                 ('int8', int8_acc, int8_ms, int8_model)]:
+        print("%-8s %10.4f %14.3f %14.2f" % (name, acc, ms, weight_bytes(model) / 2.0 ** 20))
+    print("delta    %+10.4f %+14.3f" % (int8_acc - float_acc, int8_ms - float_ms))
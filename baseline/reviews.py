@@ -0,0 +1,233 @@
+"""
+Aspect category polarities of whole reviews with exported weights (numpy_model, no tensorflow):
+
+    from reviews import ReviewPredictor
+    predictor = ReviewPredictor(NumpyAspectLevelModel.load('saves/weights.npz'), w2i, a2i,
+                                detector=NumpyJointModel.load('../saves/joint_weights_2014.npz'))
+    for review in predictor.predict_reviews([('r1', 'The pasta was great. Our waiter was rude.', None)]):
+        review['aspects']   # {'food': {'polarity': 'positive', ...}, 'service': {...}}
+
+An aspect is scored only in the sentences that mention it, and a review's polarity of an aspect is aggregated over
+those sentences alone. Which sentences mention which aspects is, per review:
+- given per sentence: a list of aspect lists, one per sentence (with the review as a list of sentences)
+- detected: with aspects None (every category) or a list of candidates, a detector (jmt_absa_sa NumpyJointModel
+  trained on the same vocabulary, --dataset 2014) gives every sentence the candidates it detects with probability
+  >= threshold in any of its chunks. Without a detector, aspects None is an error and a list is scored in every
+  sentence, as asked.
+
+Reviews are split into sentences, and sentences longer than the model input into chunks of input_len tokens. The
+(chunk, aspect) pairs of all reviews of a chunk of reviews are scored together in length-sorted batches (one
+Predictor call), then the probabilities are averaged back: over the chunks of a sentence (weighted by their
+length), then over the sentences of a review that mention the aspect.
+
+From the command line, a text file (one review per line) or a SemEval 2016 XML file (sentences grouped by review)
+is written as JSON lines, one review per line:
+
+    python reviews.py saves/weights.npz reviews.txt reviews.jsonl --detector ../saves/joint_weights_2014.npz \
+        [--threshold 0.5] [--aspects food,service]
+    python reviews.py saves/weights.npz reviews.txt reviews.jsonl --aspects food,service   # every sentence
+"""
+import argparse
+import json
+import os
+import re
+import sys
+from itertools import groupby
+from time import time
+
+import numpy as np
+
+from numpy_model import NumpyAspectLevelModel
+from predict import Predictor, load_vocab, chunks, polarities
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from data_process_pipeline.semeval2014.create_model_data import split_tokens
+from data_process_pipeline.embedding_store import EmbeddingStore
+from data_process_pipeline.semeval_xml import read_2016
+
+# end of a sentence: ., ! or ? (possibly closed by a quote or bracket) before whitespace, or a line break
+sentence_end = re.compile(r'(?<=[.!?])\s+|(?<=[.!?]["\')\]])\s+|\s*\n+\s*')
+
+
+def split_review(text):
+    """ Sentences of a review """
+    return [s.strip() for s in sentence_end.split(text) if s and s.strip()]
+
+
+class ReviewPredictor(Predictor):
+    """ Predictor over whole reviews, see the module docstring """
+
+    def __init__(self, model, w2i, a2i, input_len=80, batch_size=256, cache_bytes=0, detector=None, threshold=0.5):
+        super().__init__(model, w2i, a2i, input_len, batch_size, cache_bytes)
+        self.detector = detector
+        self.threshold = threshold
+
+    def aspects(self):
+        """ Every aspect category the model knows """
+        return sorted(aspect for aspect in self.a2i if aspect != '__UNK__')
+
+    def encode_chunks(self, text):
+        """ Padded word ids and length of every chunk of input_len tokens of a sentence """
+        ids = list(self.token_ids(text))
+        return [(chunk + [self.pad] * (self.input_len - len(chunk)), len(chunk))
+                for chunk in split_tokens(ids, self.input_len)]
+
+    def detect(self, texts, candidates):
+        """ Per sentence the candidates the detector gives a probability >= threshold in any of its chunks """
+        x, x_len, owner = [], [], []
+        for s, text in enumerate(texts):
+            for ids, n in self.encode_chunks(text):
+                if n:
+                    x.append(ids)
+                    x_len.append(n)
+                    owner.append(s)
+        x, x_len = np.asarray(x, dtype=np.int64).reshape(-1, self.input_len), np.asarray(x_len, dtype=np.int64)
+        categories = ['miscellaneous' if c == 'anecdotes/miscellaneous' else c for c in self.detector.categories]
+        found = [set() for _ in texts]
+        order = np.argsort(x_len, kind='stable')
+        for i in range(0, len(order), self.batch_size):
+            rows = order[i:i + self.batch_size]
+            category_probs, _ = self.detector.forward(x[rows], x_len[rows])
+            for r, probs in zip(rows, category_probs):
+                found[owner[r]].update(categories[c] for c in np.flatnonzero(probs >= self.threshold))
+        return [[aspect for aspect in candidates if aspect in f] for f in found]
+
+    def sentence_aspects(self, split, aspects):
+        """ The aspects of every sentence of a review, see the module docstring """
+        if aspects and isinstance(aspects[0], (list, tuple)):
+            if len(aspects) != len(split):
+                raise ValueError("%d aspect lists for %d sentences" % (len(aspects), len(split)))
+            return [list(a) for a in aspects]
+        if self.detector is not None:
+            return self.detect(split, self.aspects() if aspects is None else aspects)
+        if aspects is None:
+            raise ValueError("No aspects given and no detector: give the aspects of every sentence, or a detector")
+        return [aspects] * len(split)
+
+    def sentence_probabilities(self, sentences):
+        """
+        sentences -> (text, [aspect, ...]); returns per sentence an array [aspects, 3] of class probabilities,
+        every pair of every sentence scored in one call
+        """
+        x, x_len, a, weight, owner = [], [], [], [], []
+        for s, (text, aspects) in enumerate(sentences):
+            encoded = self.encode_chunks(text) if aspects else []
+            for k, aspect in enumerate(aspects):
+                for ids, n in encoded:
+                    x.append(ids)
+                    x_len.append(n)
+                    a.append(self.aspect_id(aspect))
+                    weight.append(max(n, 1))
+                    owner.append((s, k))
+        p = self.probabilities(np.asarray(x, dtype=np.int64).reshape(-1, self.input_len), x_len, a)
+        totals = [np.zeros((len(aspects), len(polarities))) for _, aspects in sentences]
+        weights = [np.zeros((len(aspects), 1)) for _, aspects in sentences]
+        for (s, k), w, row in zip(owner, weight, p):
+            totals[s][k] += w * row
+            weights[s][k] += w
+        return [t / np.maximum(w, 1) for t, w in zip(totals, weights)]
+
+    def predict_reviews(self, reviews, chunk_size=1024):
+        """
+        reviews -> iterable of (review_id, text or [sentence, ...], aspects), aspects None for every category, a
+        list of aspects or a list of aspect lists, one per sentence (see the module docstring). Yields per review a
+        dict with the polarity of the aspects of each sentence and, per aspect, the mean probabilities over the
+        sentences that mention it, the polarity they give and the sentence count of each polarity
+        """
+        for chunk in chunks(reviews, chunk_size):
+            sentences, spans = [], []
+            for _, text, aspects in chunk:
+                split = split_review(text) if isinstance(text, str) else list(text)
+                aspects = list(aspects) if aspects is not None else None
+                spans.append((len(sentences), len(sentences) + len(split)))
+                sentences.extend(zip(split, self.sentence_aspects(split, aspects)))
+            probabilities = self.sentence_probabilities(sentences)
+            for (review_id, _, _), (start, end) in zip(chunk, spans):
+                review = {'review_id': review_id, 'sentences': [], 'aspects': {}}
+                scored = {}  # aspect -> probabilities of the sentences that mention it
+                for (sentence, aspects), p in zip(sentences[start:end], probabilities[start:end]):
+                    review['sentences'].append({'text': sentence, 'aspects': {
+                        aspect: polarities[int(np.argmax(p[k]))] for k, aspect in enumerate(aspects)}})
+                    for k, aspect in enumerate(aspects):
+                        scored.setdefault(aspect, []).append(p[k])
+                for aspect, p in scored.items():
+                    p = np.asarray(p)  # -> [sentences, 3]
+                    mean = p.mean(0)
+                    counts = np.bincount(np.argmax(p, -1), minlength=len(polarities))
+                    review['aspects'][aspect] = {
+                        'polarity': polarities[int(np.argmax(mean))],
+                        'probabilities': dict(zip(polarities, np.round(mean, 4).tolist())),
+                        'sentences': dict(zip(polarities, counts.tolist()))}
+                yield review
+
+
+def read_reviews(path):
+    """ (review_id, text or sentences) per review of a text file (one review per line) or SemEval 2016 XML """
+    if path.endswith('.xml'):
+        for review_id, sentences in groupby(read_2016(path), key=lambda s: s[0]):
+            yield review_id, [text for _, _, text, _ in sentences]
+    else:
+        with open(path, encoding='utf-8') as f:
+            for i, line in enumerate(f):
+                if line.strip():
+                    yield str(i), line.strip()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('weights', help='weights exported by run.py (or quantize.py with --int8)')
+    parser.add_argument('reviews', help='one review per line, or SemEval 2016 XML')
+    parser.add_argument('output', help='JSON lines, one review per line')
+    parser.add_argument('--aspects', default=None,
+                        help='comma separated aspect categories: the candidates of --detector (default: all), or '
+                             'without it the aspects scored in every sentence')
+    parser.add_argument('--detector', default=None,
+                        help='NumpyJointModel weights (jmt_absa_sa, --dataset 2014) that detect the aspects of '
+                             'every sentence')
+    parser.add_argument('--threshold', type=float, default=0.5, help='category probability of --detector')
+    parser.add_argument('--vocab-dir', default='../data/semeval14')
+    parser.add_argument('--int8', action='store_true', help='weights written by quantize.py')
+    parser.add_argument('--embedding-store', default=None,
+                        help='read the word embeddings from this shared store (embedding_store.py) instead')
+    parser.add_argument('--domain', default='semeval14', help='domain of the vocabulary in --embedding-store')
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--input-len', type=int, default=80, help='the input length of the trained graph')
+    parser.add_argument('--cache-mb', type=float, default=0,
+                        help='cache token ids and results of repeated sentences in this many MB (0: no cache)')
+    parser.add_argument('--chunk-size', type=int, default=1024, help='reviews read, scored and written at a time')
+    args = parser.parse_args()
+    if not args.aspects and not args.detector:
+        parser.error("give a --detector for the aspects of every sentence, or --aspects to score in every sentence")
+
+    embeddings = EmbeddingStore(args.embedding_store).load_kwargs(args.domain) if args.embedding_store else {}
+    if args.int8:
+        from quantize import QuantizedAspectLevelModel
+        model = QuantizedAspectLevelModel.load(args.weights, **embeddings)
+    else:
+        model = NumpyAspectLevelModel.load(args.weights, **embeddings)
+    w2i, a2i = load_vocab(args.vocab_dir)
+    detector = None
+    if args.detector:
+        from jmt_absa_sa.numpy_model import NumpyJointModel
+        detector = NumpyJointModel.load(args.detector, embeddings=embeddings.get('embeddings'))
+    predictor = ReviewPredictor(model, w2i, a2i, args.input_len, args.batch_size, int(args.cache_mb * 2 ** 20),
+                                detector, args.threshold)
+    aspects = args.aspects.split(',') if args.aspects else None
+
+    st = time()
+    n_reviews, n_sentences = 0, 0
+    with open(args.output, 'w', encoding='utf-8') as out:
+        for review in predictor.predict_reviews(((review_id, text, aspects)
+                                                 for review_id, text in read_reviews(args.reviews)),
+                                                args.chunk_size):
+            out.write(json.dumps(review) + '\n')
+            n_reviews += 1
+            n_sentences += len(review['sentences'])
+    seconds = time() - st
+    print("Wrote %s: %d reviews, %d sentences (%.1f reviews/sec, %.1f sentences/sec)" % (
+        args.output, n_reviews, n_sentences, n_reviews / seconds, n_sentences / seconds))
+    if predictor.cache_stats():
+        for name, stats in sorted(predictor.cache_stats().items()):
+            print("%s cache: %d entries, %.1f / %.1f MB, %d hits, %d misses (%.1f%%), %d evictions" % (
+                name, stats['entries'], stats['bytes'] / 2.0 ** 20, stats['max_bytes'] / 2.0 ** 20, stats['hits'],
+                stats['misses'], 100 * stats['hit_rate'], stats['evictions']))
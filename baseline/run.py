@@ -1,86 +1,159 @@
-import pickle
+import argparse
+import json
+import os
 from time import time
 
 import numpy as np
 import tensorflow as tf
 from tqdm import tqdm
 
-from data_loader import TrainData, EvalData
+from callbacks import EarlyStopping, ReduceLROnPlateau
+from data_loader import TrainData, EvalData, DevData, load_emb
 from model import AspectLevelModel
+from checkpoint import CheckpointManager
+from profiler import StepProfiler
 from prepare_data import get_w2i, get_a2i
 
 
-def get_emb(word, h):
-    if word in h:
-        return h[word]
-    else:
-        return h['__UNK__']
+def accuracy(predictions, labels):
+    diff = []
+    for y, y_ in zip(labels, predictions):
+        diff.append(1.00 * np.sum(np.argmax(y) == np.argmax(y_)))
+    # print "Diff: ", diff
+    return (sum(diff) / len(diff))
 
 
-def load_emb():
-    emb = []
-    a_emb = []
-    with open('../data/semeval14/text_vocab.vocab', 'r') as f:
-        with open('../data/semeval14/text_vector.pkl', 'rb') as pkl_file:
-            h = pickle.load(pkl_file)
-            lines = f.readlines()
+def evaluate(session, model, dev_data):
+    """ Accuracy and mean loss over one full pass of dev_data """
+    correct, loss, total = 0.0, 0.0, 0
+    for x, x_len, a, y, n in dev_data:
+        fd = {
+            model.inputs: x,
+            model.inputs_length: x_len,
+            model.input_aspect: a,
+            model.targets: y,
+            model.keep_prob1: 1.0
+        }
+        inference, l = session.run([model.logits_train, model.loss], fd)
+        correct += accuracy(inference[:n], y[:n]) * n
+        loss += l * n
+        total += n
+    return correct / total, loss / total
 
-            for line in lines:
-                i, word = line.strip().split('\t')
-                emb.append(get_emb(word, h))
-            emb = np.asarray(emb)
 
-    with open('../data/semeval14/aspect_vocab.vocab', 'r') as f:
-        with open('../data/semeval14/aspect_vector.pkl', 'rb') as pkl_file:
-            h = pickle.load(pkl_file)
-            lines = f.readlines()
+def write_metrics(path, record):
+    if path:
+        with open(path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
 
-            for line in lines:
-                i, word = line.strip().split('\t')
-                a_emb.append(get_emb(word, h))
-            # print len(a_emb), len(a_emb[0])
-            a_emb = np.asarray(a_emb)
-            # print a_emb.shape
-    return emb, a_emb, emb.shape[0], a_emb.shape[0]
+
+def id_words(i2w):
+    """ i2w (ids as ints or strings) as an array of words indexed by id; ids without a word read '__UNK__' """
+    ids = {int(i): w for i, w in i2w.items()}
+    words = np.full(max(ids) + 1 if ids else 0, '__UNK__', dtype=object)
+    words[list(ids.keys())] = list(ids.values())
+    return words
 
 
 def convert_ids_sent(ids, i2w):
-    sent = []
-    for x in ids:
-        if str(x) in i2w:
-            sent.append(i2w[str(x)])
-        else:
-            sent.append('__UNK__')
-    # print id
-    return sent
+    """ Words of a sequence of ids; i2w is a dict or, to avoid rebuilding it every call, id_words(i2w) """
+    words = i2w if isinstance(i2w, np.ndarray) else id_words(i2w)
+    ids = np.asarray(ids, dtype=np.int64)
+    sent = np.full(ids.shape, '__UNK__', dtype=object)
+    known = (ids >= 0) & (ids < len(words))
+    sent[known] = words[ids[known]]
+    return list(sent)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', action='store_true',
+                        help='time data loading, training, evaluation and logging for every step')
+    parser.add_argument('--trace-every', type=int, default=0,
+                        help='with --profile, write a Chrome trace of every n-th train step to profile/')
+    parser.add_argument('--resume', action='store_true', help='continue from the latest checkpoint')
+    parser.add_argument('--checkpoint-dir', default=None, help='defaults to <save-dir>/checkpoints')
+    parser.add_argument('--checkpoint-every-steps', type=int, default=500)
+    parser.add_argument('--checkpoint-every-secs', type=int, default=600)
+    parser.add_argument('--keep-last', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cell', default='lstm', choices=['lstm', 'gru'])
+    parser.add_argument('--hidden-size', type=int, default=300)
+    parser.add_argument('--keep-prob', type=float, default=0.5, help='dropout keep probability of the inputs')
+    parser.add_argument('--l2-reg', type=float, default=0.01, help='l2 regularizer of the attention vector w')
+    parser.add_argument('--reg-lambda', type=float, default=0.001, help='l2 penalty on all trainable variables')
+    parser.add_argument('--threads', type=int, default=0, help='tensorflow intra-op threads (0: all cores)')
+    parser.add_argument('--save-dir', default='saves')
+    parser.add_argument('--metrics-file', default=None,
+                        help='append one json line of dev metrics per epoch, and a final summary line')
+    parser.add_argument('--epochs', type=int, default=1000)
+    parser.add_argument('--learning-rate', type=float, default=0.01)
+    parser.add_argument('--dev-size', type=int, default=None,
+                        help='rows held out from the end of the training data for the full-pass dev evaluation')
+    parser.add_argument('--monitor', default='accuracy', choices=['accuracy', 'loss'],
+                        help='dev metric for early stopping, the learning rate schedule and the best checkpoint')
+    parser.add_argument('--early-stopping-patience', type=int, default=0,
+                        help='stop after this many epochs without dev improvement (0 disables early stopping)')
+    parser.add_argument('--min-delta', type=float, default=0.0)
+    parser.add_argument('--reduce-lr-patience', type=int, default=0,
+                        help='multiply the learning rate by --lr-factor after this many epochs without dev '
+                             'improvement (0 disables the schedule)')
+    parser.add_argument('--lr-factor', type=float, default=0.5)
+    parser.add_argument('--min-lr', type=float, default=1e-5)
+    args = parser.parse_args()
+    args.checkpoint_dir = args.checkpoint_dir or os.path.join(args.save_dir, 'checkpoints')
+    profiler = StepProfiler(enabled=args.profile, trace_every=args.trace_every)
+
+    resume_state = CheckpointManager.latest_state(args.checkpoint_dir) if args.resume else None
+
     w2i, i2w = get_w2i()
     print('Len i2w', len(i2w))
+    words = id_words(i2w)
     a2i, i2a = get_a2i()
     embedding, aspect_embedding, vocab_size, aspect_vocab_size = load_emb()
     tf.reset_default_graph()
-    tf.set_random_seed(1)
-    resume_from_checkpoint = False
-    with tf.Session() as session:
-        hidden_size = 300
+    # tensorflow cannot restore the state of its random ops, so a resumed run derives its seed from the step
+    # it resumes at: the dropout masks do not replay those already used, and the resumed run is reproducible
+    tf.set_random_seed(args.seed + (resume_state['step'] if resume_state else 0))
+    session_config = tf.ConfigProto(intra_op_parallelism_threads=args.threads)
+    with tf.Session(config=session_config) as session:
+        hidden_size = args.hidden_size
         batch_size = 25
         # infered from the dataset
         input_len = 80
-        model = AspectLevelModel('lstm', hidden_size=hidden_size, vocab_size=vocab_size,
+        model = AspectLevelModel(args.cell, hidden_size=hidden_size, vocab_size=vocab_size,
                                  aspect_vocab_size=aspect_vocab_size,
                                  embedding_size=300,
                                  aspect_embedding_size=300,
-                                 debug=False, input_length=input_len, batch_size=batch_size)
+                                 debug=False, input_length=input_len, batch_size=batch_size,
+                                 learning_rate=args.learning_rate, l2_reg=args.l2_reg,
+                                 reg_lambda=args.reg_lambda)
 
-        saver = tf.train.Saver()
+        mode = 'max' if args.monitor == 'accuracy' else 'min'
+        early_stopping = EarlyStopping(mode, args.min_delta, args.early_stopping_patience) \
+            if args.early_stopping_patience else None
+        lr_schedule = ReduceLROnPlateau(mode, args.min_delta, args.reduce_lr_patience, args.lr_factor,
+                                        args.min_lr) if args.reduce_lr_patience else None
 
-        if resume_from_checkpoint:
-            saver = tf.train.import_meta_graph('saves/model.ckpt.meta')
-            saver.restore(session, tf.train.latest_checkpoint('./saves'))
-        else:
-            session.run(tf.global_variables_initializer())
+        session.run(tf.global_variables_initializer())
+        # the embedding matrices are fixed and reloaded from disk below, so they are left out of checkpoints
+        checkpoints = CheckpointManager(session,
+                                        [v for v in tf.global_variables() if
+                                         v not in (model.embedding_matrix, model.aspect_embedding_matrix)],
+                                        directory=args.checkpoint_dir, keep_last=args.keep_last,
+                                        every_steps=args.checkpoint_every_steps,
+                                        every_seconds=args.checkpoint_every_secs,
+                                        higher_is_better=mode == 'max')
+        start_epoch, start_batch, step = 0, 0, 0
+        if resume_state:
+            resume_state = checkpoints.restore()
+            start_epoch, start_batch, step = resume_state['epoch'], resume_state['batch'], resume_state['step']
+            print("Resuming from step %d (epoch %d, batch %d)" % (step, start_epoch + 1, start_batch))
+            if early_stopping and resume_state.get('early_stopping'):
+                early_stopping.load_state_dict(resume_state['early_stopping'])
+            if lr_schedule and resume_state.get('lr_schedule'):
+                lr_schedule.load_state_dict(resume_state['lr_schedule'])
+        state = {'epoch': start_epoch, 'batch': start_batch, 'seed': args.seed}
         session.run(tf.local_variables_initializer())
         session.run([model.embedding_init, model.aspect_embedding_init],
                     feed_dict={model.embedding_placeholder: embedding,
@@ -90,15 +163,21 @@ if __name__ == '__main__':
         try:
             print("Training")
 
-            for epoch in range(1000):
+            stop_reason = "reached %d epochs" % args.epochs
+            # a run resumed at or past --epochs trains no epoch; it stopped after the last one it had done
+            epoch = start_epoch - 1
+            for epoch in range(start_epoch, args.epochs):
                 # print "Epoch: ", epoch
-                train_data = TrainData(batch_size=batch_size, input_len=input_len)
+                train_data = TrainData(batch_size=batch_size, input_len=input_len, dev_size=args.dev_size)
                 # test_data = TestData(batch_size=batch_size, input_len=input_len)
                 test_data = EvalData(batch_size=batch_size, input_len=input_len)
-                tq = tqdm(range(140))
+                first_batch = start_batch if epoch == start_epoch else 0
+                train_data.i = first_batch * batch_size
+                tq = tqdm(range(first_batch, 140))
                 for batch in tq:
 
-                    x, x_len, a, y = next(train_data)
+                    with profiler.phase('data'):
+                        x, x_len, a, y = next(train_data)
 
                     if x.shape[0] < batch_size:
                         # print "Training complete!"
@@ -111,53 +190,96 @@ if __name__ == '__main__':
                         model.inputs_length: x_len,
                         model.input_aspect: a,
                         model.targets: y,
-                        model.keep_prob1: 0.5
+                        model.keep_prob1: args.keep_prob
                     }
-                    _, l = session.run([model.train_op, model.loss], feed_dict=fd)
+                    with profiler.phase('train'):
+                        _, l = session.run([model.train_op, model.loss], feed_dict=fd, **profiler.run_kwargs())
                     loss.append(l)
+                    step += 1
+                    state = {'epoch': epoch, 'batch': batch + 1, 'seed': args.seed,
+                             'early_stopping': early_stopping.state_dict() if early_stopping else None,
+                             'lr_schedule': lr_schedule.state_dict() if lr_schedule else None}
+                    checkpoints.maybe_save(step, state)
 
                     if batch % 10 == 0:
-                        minibatch_loss = session.run([model.loss], fd)
+                        # the loss of the train step above; no second forward pass over the same feed
+                        minibatch_loss = l
 
-                        x, x_len, a, y = next(test_data)
+                        with profiler.phase('eval'):
+                            x, x_len, a, y = next(test_data)
                         if x.shape[0] < batch_size:
                             print("No more data to test with")
+                            profiler.end_step()
                             continue
 
-
-                        def accuracy(predictions, labels):
-                            diff = []
-                            for y, y_ in zip(labels, predictions):
-                                diff.append(1.00 * np.sum(np.argmax(y) == np.argmax(y_)))
-                            # print "Diff: ", diff
-                            return (sum(diff) / len(diff))
-
-
                         fd = {
                             model.inputs: np.asarray(x),
                             model.inputs_length: np.asarray(x_len),
                             model.input_aspect: np.asarray(a),
                             model.keep_prob1: 1.0
                         }
-                        inference = session.run(model.logits_train, fd)
-                        tq.set_description("Epoch:%d,  Minibatch loss: %s, Accuracy: %s" % (
-                            epoch + 1, minibatch_loss[0], accuracy(inference, y)))
-                        input = fd[model.inputs]
-                        input_aspect = fd[model.input_aspect]
-                        # print "Review: ", x[:2], input.shape
-                        c, d = batch_size - 2, batch_size
-                        # print "Len: ", x_len[c:d]
-                        m = [' '.join(convert_ids_sent(x1, i2w)) for x1 in x[c:d]]
-                        # print "Review: ", input.shape  # ,convert_ids_sent(input, i2w)
-                        # for n in m:
-                        # print "\n", n
-                        # print "Aspect: ", [i2a[str(i)] for i in input_aspect[c:d]]
-                        # print "Class", [a for a in inference[c:d]]
+                        with profiler.phase('eval'):
+                            inference = session.run(model.logits_train, fd)
+                        eval_accuracy = accuracy(inference, y)
+                        with profiler.phase('log'):
+                            tq.set_description("Epoch:%d,  Minibatch loss: %s, Accuracy: %s" % (
+                                epoch + 1, minibatch_loss, eval_accuracy))
+                            input = fd[model.inputs]
+                            input_aspect = fd[model.input_aspect]
+                            # print "Review: ", x[:2], input.shape
+                            c, d = batch_size - 2, batch_size
+                            # print "Len: ", x_len[c:d]
+                            m = [' '.join(convert_ids_sent(x1, words)) for x1 in x[c:d]]
+                            # print "Review: ", input.shape  # ,convert_ids_sent(input, i2w)
+                            # for n in m:
+                            # print "\n", n
+                            # print "Aspect: ", [i2a[str(i)] for i in input_aspect[c:d]]
+                            # print "Class", [a for a in inference[c:d]]
+                    profiler.end_step()
+                profiler.end_epoch(epoch + 1)
+
+                with profiler.phase('eval'):
+                    dev_accuracy, dev_loss = evaluate(session, model, DevData(batch_size, input_len, args.dev_size))
+                dev_metric = dev_accuracy if args.monitor == 'accuracy' else dev_loss
+                print("Epoch:%d, dev accuracy: %f, dev loss: %f" % (epoch + 1, dev_accuracy, dev_loss))
+                write_metrics(args.metrics_file, {'epoch': epoch + 1, 'step': step, 'dev_accuracy': dev_accuracy,
+                                                  'dev_loss': dev_loss,
+                                                  'learning_rate': float(session.run(model.learning_rate))})
+                if lr_schedule:
+                    lr = float(session.run(model.learning_rate))
+                    new_lr = lr_schedule.step(dev_metric, lr)
+                    if new_lr != lr:
+                        print("Dev %s plateaued, learning rate %g -> %g" % (args.monitor, lr, new_lr))
+                        model.set_learning_rate(session, new_lr)
+                stop = early_stopping.step(dev_metric) if early_stopping else False
+                state = dict(state, epoch=epoch + 1, batch=0,
+                             early_stopping=early_stopping.state_dict() if early_stopping else None,
+                             lr_schedule=lr_schedule.state_dict() if lr_schedule else None)
+                checkpoints.save_if_best(step, dev_metric, state)
+                if stop:
+                    stop_reason = "early stopping on dev %s: %s" % (args.monitor, early_stopping.stop_reason)
+                    break
             print("Training complete!")
+            print("Stopped after epoch %d: %s" % (epoch + 1, stop_reason))
             print("Training Time: ", time() - st, " seconds")
         except KeyboardInterrupt:
             print("Training Time: ", time() - st, " seconds")
             print("Training Interrupted")
+            stop_reason = "interrupted"
+
+        if step:
+            checkpoints.save(step, state)
+        checkpoints.close()
+
+        # weights for numpy_model.NumpyAspectLevelModel, which serves without tensorflow
+        if not os.path.exists(args.save_dir):
+            os.makedirs(args.save_dir)
+        model.export_weights(session, os.path.join(args.save_dir, 'weights.npz'))
+        write_metrics(args.metrics_file, {'final': True, 'stop_reason': stop_reason, 'steps': step,
+                                          'best_dev_%s' % args.monitor: checkpoints.best_metric,
+                                          'seconds': time() - st})
+        if args.profile:
+            profiler.save('profile/summary.json')
 
         import matplotlib.pyplot as plt
 
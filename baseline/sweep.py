@@ -0,0 +1,218 @@
+"""
+Hyperparameter sweep over run.py. Trials run concurrently as separate processes, each pinned to its own
+set of cores, and are cached by a hash of their config: re-running a sweep skips every finished trial.
+
+    python sweep.py sweep.json --parallel 4
+
+sweep.json holds either a grid or a random search over run.py options, e.g.
+    {"name": "lstm_vs_gru", "grid": {"cell": ["lstm", "gru"], "learning_rate": [0.01, 0.001]},
+     "fixed": {"epochs": 30, "early_stopping_patience": 5}}
+    {"name": "random", "random": {"hidden_size": [100, 200, 300],
+                                  "learning_rate": {"min": 1e-4, "max": 1e-1, "log": true},
+                                  "keep_prob": {"min": 0.3, "max": 0.9}},
+     "trials": 20, "seed": 1}
+A trial is stopped early (median rule) once, after min_epochs, its best dev metric so far is worse than the
+median of the other trials' best at the same epoch.
+"""
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from time import sleep, time
+
+
+def expand(spec):
+    """ List of trial configs (dicts of run.py options) described by the spec """
+    fixed = spec.get('fixed', {})
+    if 'grid' in spec:
+        keys = sorted(spec['grid'])
+        return [dict(fixed, **dict(zip(keys, values))) for values in
+                itertools.product(*[spec['grid'][k] for k in keys])]
+    rng = random.Random(spec.get('seed', 1))
+    trials = []
+    for _ in range(spec.get('trials', 10)):
+        config = dict(fixed)
+        for k in sorted(spec['random']):
+            v = spec['random'][k]
+            if isinstance(v, list):
+                config[k] = rng.choice(v)
+            elif v.get('log'):
+                config[k] = math.exp(rng.uniform(math.log(v['min']), math.log(v['max'])))
+            else:
+                config[k] = rng.uniform(v['min'], v['max'])
+            if isinstance(v, dict) and v.get('int'):
+                config[k] = int(round(config[k]))
+        trials.append(config)
+    return trials
+
+
+def config_hash(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def read_metrics(path):
+    if not os.path.exists(path):
+        return [], None
+    epochs, final = [], None
+    with open(path) as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            record = json.loads(line)
+            if record.get('final'):
+                final = record
+            else:
+                epochs.append(record)
+    return epochs, final
+
+
+class Sweep():
+    def __init__(self, spec, parallel=1, threads_per_trial=None, poll_seconds=5.0):
+        self.name = spec.get('name', 'sweep')
+        self.trials = expand(spec)
+        self.directory = os.path.join('sweeps', self.name)
+        self.monitor = spec.get('fixed', {}).get('monitor', 'accuracy')
+        self.metric = 'dev_' + self.monitor
+        self.min_epochs = spec.get('min_epochs', 3)
+        self.parallel = parallel
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+        per_trial = threads_per_trial or max(1, len(cores) // parallel)
+        self.slots = Queue()
+        for i in range(parallel):
+            start = (i * per_trial) % len(cores)
+            self.slots.put((cores[start:] + cores[:start])[:per_trial])
+        self.poll_seconds = poll_seconds
+        self.lock = threading.Lock()
+        # epoch -> best dev metric so far of every trial that got there, for the median rule
+        self.curves = {}
+
+    def _better(self, a, b):
+        return a > b if self.monitor == 'accuracy' else a < b
+
+    def _record_curve(self, key, epochs):
+        best = None
+        with self.lock:
+            for e in epochs:
+                v = e[self.metric]
+                best = v if best is None or self._better(v, best) else best
+                self.curves.setdefault(e['epoch'], {})[key] = best
+
+    def _losing(self, key, epochs):
+        """ Median stopping rule """
+        if len(epochs) < self.min_epochs:
+            return False
+        epoch = epochs[-1]['epoch']
+        values = [e[self.metric] for e in epochs]
+        best = max(values) if self.monitor == 'accuracy' else min(values)
+        with self.lock:
+            others = sorted(v for k, v in self.curves.get(epoch, {}).items() if k != key)
+        if len(others) < 2:
+            return False
+        median = others[len(others) // 2]
+        return self._better(median, best)
+
+    def run_trial(self, config):
+        key = config_hash(config)
+        trial_dir = os.path.join(self.directory, 'trials', key)
+        result_path = os.path.join(trial_dir, 'result.json')
+        if os.path.exists(result_path):
+            with open(result_path) as f:
+                result = json.load(f)
+            self._record_curve(key, read_metrics(os.path.join(trial_dir, 'metrics.jsonl'))[0])
+            print("[%s] cached: %s" % (key, result['status']))
+            return result
+
+        if not os.path.exists(trial_dir):
+            os.makedirs(trial_dir)
+        metrics_path = os.path.join(trial_dir, 'metrics.jsonl')
+        if os.path.exists(metrics_path):
+            os.remove(metrics_path)
+        cores = self.slots.get()
+        try:
+            cmd = [sys.executable, 'run.py', '--save-dir', trial_dir, '--metrics-file', metrics_path,
+                   '--threads', str(len(cores))]
+            for k, v in sorted(config.items()):
+                if isinstance(v, bool):
+                    if v:
+                        cmd.append('--' + k.replace('_', '-'))
+                else:
+                    cmd += ['--' + k.replace('_', '-'), str(v)]
+            env = dict(os.environ, OMP_NUM_THREADS=str(len(cores)))
+            preexec = (lambda: os.sched_setaffinity(0, cores)) if hasattr(os, 'sched_setaffinity') else None
+            st = time()
+            print("[%s] start on cores %s: %s" % (key, cores, config))
+            with open(os.path.join(trial_dir, 'log.txt'), 'w') as log:
+                proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, env=env, preexec_fn=preexec)
+                status = None
+                while proc.poll() is None:
+                    sleep(self.poll_seconds)
+                    epochs, _ = read_metrics(metrics_path)
+                    self._record_curve(key, epochs)
+                    if status is None and self._losing(key, epochs):
+                        # SIGINT lets run.py save its checkpoint and write its final metrics line
+                        status = 'pruned'
+                        proc.send_signal(signal.SIGINT)
+            epochs, final = read_metrics(metrics_path)
+            self._record_curve(key, epochs)
+        finally:
+            self.slots.put(cores)
+
+        values = [e[self.metric] for e in epochs]
+        result = {
+            'trial': key,
+            'status': status or ('finished' if proc.returncode == 0 else 'failed'),
+            'config': config,
+            'epochs_run': len(epochs),
+            'best_' + self.metric: (max(values) if self.monitor == 'accuracy' else min(values)) if values else None,
+            'stop_reason': final['stop_reason'] if final else None,
+            'seconds': time() - st,
+        }
+        # failed trials are not cached, so the next run retries them
+        if result['status'] != 'failed':
+            with open(result_path, 'w') as f:
+                json.dump(result, f, indent=2)
+        print("[%s] %s: best %s %s" % (key, result['status'], self.metric, result['best_' + self.metric]))
+        return result
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            results = list(pool.map(self.run_trial, self.trials))
+        self.write_results(results)
+        return results
+
+    def write_results(self, results):
+        metric = 'best_' + self.metric
+        results = sorted([r for r in results if r[metric] is not None], key=lambda r: r[metric],
+                         reverse=self.monitor == 'accuracy') + [r for r in results if r[metric] is None]
+        with open(os.path.join(self.directory, 'results.json'), 'w') as f:
+            json.dump(results, f, indent=2)
+        keys = sorted(set(k for r in results for k in r['config']))
+        columns = ['trial', 'status', metric, 'epochs_run', 'seconds', 'stop_reason']
+        with open(os.path.join(self.directory, 'results.csv'), 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(columns + keys)
+            for r in results:
+                writer.writerow([r[c] for c in columns] + [r['config'].get(k) for k in keys])
+        print("Results in %s" % os.path.join(self.directory, 'results.csv'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('spec', help='json sweep specification')
+    parser.add_argument('--parallel', type=int, default=2, help='trials running at the same time')
+    parser.add_argument('--threads-per-trial', type=int, default=None,
+                        help='cores pinned to each trial (default: all cores split evenly)')
+    args = parser.parse_args()
+    with open(args.spec) as f:
+        spec = json.load(f)
+    Sweep(spec, parallel=args.parallel, threads_per_trial=args.threads_per_trial).run()
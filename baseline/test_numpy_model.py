@@ -0,0 +1,129 @@
+"""
+numpy_model.NumpyAspectLevelModel against a per-sentence numpy reference of the graph in model.py (always runs) and
+against the tensorflow graph itself, for both cells (skipped when tensorflow cannot be imported):
+
+    python -m pytest baseline/test_numpy_model.py
+"""
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from numpy_model import NumpyAspectLevelModel
+
+vocab_size, aspect_vocab_size, emb, hidden, N = 50, 6, 16, 12, 7
+
+
+def random_weights(cell, rng):
+    d = hidden
+    shapes = {'embedding_matrix': (vocab_size, emb), 'aspect_embedding_matrix': (aspect_vocab_size, emb),
+              'Wh': (d, d), 'Wv': (emb, emb), 'w': (d + emb, 1), 'Wp': (d, d), 'Wx': (d, d), 'Ws': (d, 3),
+              'bs': (1, 3)}
+    if cell == 'lstm':
+        shapes.update({'cell_kernel': (2 * emb + d, 4 * d), 'cell_bias': (4 * d,)})
+    else:
+        shapes.update({'cell_gates_kernel': (2 * emb + d, 2 * d), 'cell_gates_bias': (2 * d,),
+                       'cell_candidate_kernel': (2 * emb + d, d), 'cell_candidate_bias': (d,)})
+    return {k: rng.uniform(-0.5, 0.5, s) for k, s in shapes.items()}
+
+
+def inputs(rng, batch_size=5):
+    x = rng.randint(0, vocab_size, (batch_size, N))
+    x_len = np.asarray([7, 3, 5, 1, 6][:batch_size])
+    a = rng.randint(0, aspect_vocab_size, batch_size)
+    return x, x_len, a
+
+
+def reference_logits(W, cell, x, x_len, a):
+    """ One sentence and one time step at a time, in float64 """
+    def sig(z):
+        return 1.0 / (1.0 + np.exp(-z))
+
+    d = hidden
+    out = []
+    for words, n, aspect_id in zip(x, x_len, a):
+        aspect = W['aspect_embedding_matrix'][aspect_id]
+        h, c = np.zeros(d), np.zeros(d)
+        outputs = np.zeros((N, d))
+        for t in range(n):
+            v = np.concatenate([W['embedding_matrix'][words[t]], aspect, h])
+            if cell == 'lstm':
+                i, j, f, o = np.split(v.dot(W['cell_kernel']) + W['cell_bias'], 4)
+                c = c * sig(f + 1.0) + sig(i) * np.tanh(j)
+                h = np.tanh(c) * sig(o)
+            else:
+                r, u = np.split(sig(v.dot(W['cell_gates_kernel']) + W['cell_gates_bias']), 2)
+                v = np.concatenate([W['embedding_matrix'][words[t]], aspect, r * h])
+                h = u * h + (1 - u) * np.tanh(v.dot(W['cell_candidate_kernel']) + W['cell_candidate_bias'])
+            outputs[t] = h
+        # model.py takes the softmax of the [N, 1] scores over their unit axis, so every step weighs 1
+        M = np.tanh(np.concatenate([outputs.dot(W['Wh']), np.tile(aspect.dot(W['Wv']), (N, 1))], 1))
+        scores = M.dot(W['w'])
+        alpha = np.exp(scores - scores.max(1, keepdims=True))
+        alpha /= alpha.sum(1, keepdims=True)
+        r = outputs.T.dot(alpha)[:, 0]
+        h_star = np.tanh(r.dot(W['Wp']) + h.dot(W['Wx']))
+        z = h_star.dot(W['Ws']) + W['bs'][0]
+        out.append(np.exp(z - z.max()) / np.exp(z - z.max()).sum())
+    return np.asarray(out)
+
+
+@pytest.mark.parametrize('cell', ['lstm', 'gru'])
+def test_matches_reference(cell):
+    rng = np.random.RandomState(0)
+    weights = random_weights(cell, rng)
+    x, x_len, a = inputs(rng)
+    expected = reference_logits(weights, cell, x, x_len, a)
+    assert np.allclose(NumpyAspectLevelModel(weights, cell, dtype=np.float64).logits(x, x_len, a), expected,
+                       atol=1e-10)
+    assert np.allclose(NumpyAspectLevelModel(weights, cell).logits(x, x_len, a), expected, atol=1e-5)
+
+
+@pytest.mark.parametrize('cell', ['lstm', 'gru'])
+def test_padding_and_batching(cell):
+    """ Word ids past a sentence's length do not count, and a sentence scores the same alone as in a batch """
+    rng = np.random.RandomState(1)
+    model = NumpyAspectLevelModel(random_weights(cell, rng), cell, dtype=np.float64)
+    x, x_len, a = inputs(rng)
+    batch = model.logits(x, x_len, a)
+    padded = x.copy()
+    for row, n in zip(padded, x_len):
+        row[n:] = 0
+    assert np.allclose(model.logits(padded, x_len, a), batch, atol=1e-12)
+    for i in range(len(x_len)):
+        assert np.allclose(model.logits(x[i:i + 1], x_len[i:i + 1], a[i:i + 1])[0], batch[i], atol=1e-12)
+
+
+@pytest.mark.parametrize('cell', ['lstm', 'gru'])
+def test_matches_tensorflow(cell):
+    tf = pytest.importorskip('tensorflow')
+    from model import AspectLevelModel
+
+    rng = np.random.RandomState(1)
+    embedding = rng.uniform(-1, 1, (vocab_size, emb)).astype(np.float32)
+    aspect_embedding = rng.uniform(-1, 1, (aspect_vocab_size, emb)).astype(np.float32)
+    x, x_len, a = inputs(rng, batch_size=4)
+
+    tf.reset_default_graph()
+    tf.set_random_seed(1)
+    with tf.Session() as session:
+        model = AspectLevelModel(cell, hidden_size=hidden, vocab_size=vocab_size,
+                                 aspect_vocab_size=aspect_vocab_size,
+                                 embedding_size=emb, aspect_embedding_size=emb,
+                                 input_length=N, batch_size=len(x_len))
+        session.run(tf.global_variables_initializer())
+        session.run([model.embedding_init, model.aspect_embedding_init],
+                    feed_dict={model.embedding_placeholder: embedding,
+                               model.aspect_embedding_placeholder: aspect_embedding})
+        expected = session.run(model.logits_train, {model.inputs: x,
+                                                    model.inputs_length: x_len,
+                                                    model.input_aspect: a,
+                                                    model.keep_prob1: 1.0})
+        path = model.export_weights(session, os.path.join(tempfile.mkdtemp(), 'weights.npz'))
+
+    for dtype in [np.float32, np.float64]:
+        got = NumpyAspectLevelModel.load(path, dtype=dtype).logits(x, x_len, a)
+        assert np.allclose(got, expected, atol=1e-5), (cell, np.dtype(dtype).name)
@@ -0,0 +1,330 @@
+"""
+Offline CPU benchmarks for the data pipeline, the loaders, training and inference.
+
+Run from the repository root:
+    python -m benchmarks.benchmark                      # writes benchmarks/results.json
+    python -m benchmarks.benchmark --quick              # smaller sizes, for a fast check
+    python -m benchmarks.benchmark --save-baseline      # stores the results as benchmarks/baseline.json
+Every run is compared against benchmarks/baseline.json when it exists; results more than --tolerance
+worse than the baseline are reported as regressions and the exit status is 1. So is it when a benchmark raises, or
+when a metric of the baseline is missing from the run (unless --only left its benchmark out).
+
+Nothing needs the network or the GoogleNews vectors: text comes from the bundled SemEval XML, and the
+vocabularies, embeddings and model weights are random. Benchmarks whose dependencies are missing
+(e.g. tensorflow for the training steps) are reported as skipped.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# baseline modules import each other as top-level modules (they are run from inside baseline/)
+sys.path.insert(0, os.path.join(root, 'baseline'))
+
+raw_2014_path = os.path.join(root, 'data/raw_data/SemEval_14')
+raw_2016_path = os.path.join(root, 'data/raw_data/SemEval_16')
+restaurants_2014 = raw_2014_path + '/SemEval14-ABSA-TrainData_v2/Restaurants_Train_v2.xml'
+restaurants_2016 = raw_2016_path + '/ABSA16_Restaurants_Train_SB1_v2.xml'
+
+BENCHMARKS = []
+
+
+def benchmark(fn):
+    BENCHMARKS.append(fn)
+    return fn
+
+
+def measure(fn, repeat=3):
+    """ Best of repeat runs, in seconds """
+    best = None
+    for _ in range(repeat):
+        st = perf_counter()
+        fn()
+        t = perf_counter() - st
+        best = t if best is None or t < best else best
+    return best
+
+
+def result(value, unit, higher_is_better=True, **extra):
+    return dict(extra, value=value, unit=unit, higher_is_better=higher_is_better)
+
+
+@contextlib.contextmanager
+def quiet():
+    """ The pipeline prints whole DataFrames; keep them out of the benchmark output """
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        yield
+
+
+def raw_sentences():
+    from data_process_pipeline.semeval2014.prepare_2014_data import get_restaurants_train_data
+    with quiet():
+        return get_restaurants_train_data(restaurants_2014)
+
+
+def synthetic_frame(cleaned, n, seed=1):
+    rng = random.Random(seed)
+    rows = [rng.randrange(len(cleaned)) for _ in range(n)]
+    return pd.DataFrame({'text': [cleaned['text'][i] for i in rows],
+                         'aspect': [cleaned['aspect'][i] for i in rows],
+                         'polarity': [cleaned['polarity'][i] for i in rows]})
+
+
+@benchmark
+def xml_ingest(ctx):
+    from data_process_pipeline.semeval2014.prepare_2014_data import get_restaurants_train_data
+    from data_process_pipeline.semeval2016.prepare_2016_data import get_data
+    out = {}
+    with quiet():
+        rows = [0]
+        t = measure(lambda: rows.__setitem__(0, get_restaurants_train_data(restaurants_2014).shape[0]), 1)
+        out['xml_ingest_2014_rows_per_sec'] = result(rows[0] / t, 'rows/s', rows=rows[0])
+        t = measure(lambda: rows.__setitem__(0, get_data(restaurants_2016).shape[0]), 1)
+        out['xml_ingest_2016_rows_per_sec'] = result(rows[0] / t, 'rows/s', rows=rows[0])
+    return out
+
+
+@benchmark
+def clean_throughput(ctx):
+    from data_process_pipeline.semeval2014.preprocess import clean
+    texts = list(ctx['raw']['text'])[:ctx['clean_sentences']]
+    t = measure(lambda: [clean(s) for s in texts])
+    return {'clean_sentences_per_sec': result(len(texts) / t, 'sentences/s', sentences=len(texts))}
+
+
+@benchmark
+def vocab_scaling(ctx):
+    from data_process_pipeline.semeval2014.load_pp_data import get_vocab
+    out, sizes, times = {}, ctx['vocab_sizes'], []
+    for n in sizes:
+        a = synthetic_frame(ctx['cleaned'], n, seed=1)
+        b = synthetic_frame(ctx['cleaned'], n // 4, seed=2)
+        times.append(measure(lambda: get_vocab(a, b), 1))
+        out['get_vocab_%d_rows_sec' % n] = result(times[-1], 's', higher_is_better=False)
+    # slope of log(time) against log(rows): ~1 is linear, ~2 quadratic
+    out['get_vocab_scaling_exponent'] = result(float(np.polyfit(np.log(sizes), np.log(times), 1)[0]),
+                                               'exponent', higher_is_better=False)
+    return out
+
+
+@benchmark
+def encode_train_data(ctx):
+    from data_process_pipeline.semeval2014.create_model_data import create_train_data
+    words = sorted(set(w for t in ctx['cleaned']['text'] for w in t) | {'__UNK__', '__PAD__'})
+    aspects = sorted(set('miscellaneous' if a == 'anecdotes/miscellaneous' else a
+                         for a in ctx['cleaned']['aspect'] if a))
+    w2i = {w: i for i, w in enumerate(words)}
+    a2i = {a: i for i, a in enumerate(aspects)}
+    frame = ctx['cleaned'][ctx['cleaned']['aspect'].notnull()].reset_index(drop=True)
+    frame = frame[frame['text'].map(len) <= 80].reset_index(drop=True)
+    with tempfile.TemporaryDirectory() as d, quiet():
+        t = measure(lambda: create_train_data(frame.copy(), None, None, w2i, a2i, d), 1)
+    return {'create_train_data_rows_per_sec': result(frame.shape[0] / t, 'rows/s', rows=frame.shape[0])}
+
+
+def synthetic_train_pickle(path, rows, vocab_size, aspect_vocab_size, max_len=80, seed=1):
+    """ Same layout as create_model_data.save_model_data: ~2 aspect rows per distinct sentence """
+    rng = np.random.RandomState(seed)
+    n_sentences = max(rows // 2, 1)
+    lens = rng.randint(3, 40, n_sentences)
+    sentences = np.ones((n_sentences, max_len), dtype=np.int32)
+    for i, l in enumerate(lens):
+        sentences[i, :l] = rng.randint(2, vocab_size, l)
+    sentence = rng.randint(0, n_sentences, rows)
+    polarity = [list(np.eye(3, dtype=int)[rng.randint(3)]) for _ in range(rows)]
+    pd.DataFrame({'sentence': sentence, 'aspect': rng.randint(0, aspect_vocab_size, rows), 'polarity': polarity,
+                  'seq_len': lens[sentence], 'max_len': max_len}).to_pickle(path)
+    np.save(path[:-len('.pkl')] + '_sentences.npy', sentences)
+
+
+@benchmark
+def batch_assembly(ctx):
+    from data_loader import TrainData
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'train.pkl')
+        synthetic_train_pickle(path, ctx['train_rows'], 5000, 6)
+
+        def epoch():
+            data = TrainData(batch_size=25, input_len=80, path=path)
+            for _ in range((ctx['train_rows'] - 25) // 25):
+                next(data)
+
+        t = measure(epoch)
+    return {'train_data_batches_per_sec': result(((ctx['train_rows'] - 25) // 25) / t, 'batches/s')}
+
+
+@benchmark
+def train_steps(ctx):
+    import tensorflow as tf
+    from model import AspectLevelModel
+
+    rng = np.random.RandomState(1)
+    vocab_size, aspect_vocab_size, batch_size, N = 5000, 6, 25, 80
+    out = {}
+    for cell in ['lstm', 'gru']:
+        tf.reset_default_graph()
+        tf.set_random_seed(1)
+        with tf.Session() as session, quiet():
+            model = AspectLevelModel(cell, hidden_size=300, vocab_size=vocab_size,
+                                     aspect_vocab_size=aspect_vocab_size, embedding_size=300,
+                                     aspect_embedding_size=300, input_length=N, batch_size=batch_size)
+            session.run(tf.global_variables_initializer())
+            session.run([model.embedding_init, model.aspect_embedding_init],
+                        feed_dict={model.embedding_placeholder: rng.uniform(-1, 1, (vocab_size, 300)),
+                                   model.aspect_embedding_placeholder: rng.uniform(-1, 1, (aspect_vocab_size, 300))})
+            x_len = rng.randint(3, 40, batch_size)
+            fd = {model.inputs: rng.randint(0, vocab_size, (batch_size, N)),
+                  model.inputs_length: x_len,
+                  model.input_aspect: rng.randint(0, aspect_vocab_size, batch_size),
+                  model.targets: np.eye(3, dtype=np.int32)[rng.randint(3, size=batch_size)],
+                  model.keep_prob1: 0.5}
+            session.run(model.train_op, fd)
+            steps = ctx['train_steps']
+            t = measure(lambda: [session.run(model.train_op, fd) for _ in range(steps)], 1)
+        out['train_%s_steps_per_sec' % cell] = result(steps / t, 'steps/s', batch_size=batch_size)
+    return out
+
+
+def random_weights(cell, hidden_size=300, emb=300, vocab_size=5000, aspect_vocab_size=6, seed=1):
+    rng = np.random.RandomState(seed)
+    d = hidden_size
+    shapes = {'embedding_matrix': (vocab_size, emb), 'aspect_embedding_matrix': (aspect_vocab_size, emb),
+              'Wh': (d, d), 'Wv': (emb, emb), 'w': (d + emb, 1), 'Wp': (d, d), 'Wx': (d, d), 'Ws': (d, 3),
+              'bs': (1, 3)}
+    if cell == 'lstm':
+        shapes.update({'cell_kernel': (2 * emb + d, 4 * d), 'cell_bias': (4 * d,)})
+    else:
+        shapes.update({'cell_gates_kernel': (2 * emb + d, 2 * d), 'cell_gates_bias': (2 * d,),
+                       'cell_candidate_kernel': (2 * emb + d, d), 'cell_candidate_bias': (d,)})
+    return {k: rng.normal(0, 0.05, s).astype(np.float32) for k, s in shapes.items()}
+
+
+@benchmark
+def inference_latency(ctx):
+    from numpy_model import NumpyAspectLevelModel
+    rng = np.random.RandomState(1)
+    out = {}
+    for cell in ['lstm', 'gru']:
+        model = NumpyAspectLevelModel(random_weights(cell), cell)
+        for batch_size in [1, 25, 100]:
+            x = rng.randint(0, 5000, (batch_size, 80))
+            x_len = rng.randint(3, 40, batch_size)
+            a = rng.randint(0, 6, batch_size)
+            model.logits(x, x_len, a)
+            times = []
+            for _ in range(ctx['latency_repeats']):
+                st = perf_counter()
+                model.logits(x, x_len, a)
+                times.append(perf_counter() - st)
+            p50, p95 = np.percentile(times, [50, 95]) * 1000.0
+            out['inference_%s_batch%d_p50_ms' % (cell, batch_size)] = result(p50, 'ms', higher_is_better=False,
+                                                                             p95=p95)
+            out['inference_%s_batch%d_per_sec' % (cell, batch_size)] = result(batch_size / (p50 / 1000.0),
+                                                                              'examples/s')
+    return out
+
+
+def compare(results, baseline, tolerance, only=None):
+    """
+    Names of the results more than tolerance worse than the baseline, and of the baseline metrics the run did not
+    produce (a failed or skipped benchmark); with only, metrics of the other benchmarks are not expected
+    """
+    regressions = []
+    missing = sorted(name for name, r in baseline.items() if name not in results and
+                     (only is None or r.get('benchmark') in only))
+    print("%-42s %14s %14s %9s" % ('benchmark', 'baseline', 'current', 'change'))
+    for name, r in sorted(results.items()):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]['value'], r['value']
+        change = (new - old) / old if old else 0.0
+        worse = -change if r['higher_is_better'] else change
+        flag = ' REGRESSION' if worse > tolerance else ''
+        if flag:
+            regressions.append(name)
+        print("%-42s %14.4g %14.4g %+8.1f%%%s" % (name, old, new, 100.0 * change, flag))
+    for name in missing:
+        print("%-42s %14.4g %14s %9s MISSING" % (name, baseline[name]['value'], '-', ''))
+    return regressions, missing
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--quick', action='store_true')
+    parser.add_argument('--only', default=None, help='comma separated benchmark names')
+    parser.add_argument('--output', default=os.path.join(root, 'benchmarks/results.json'))
+    parser.add_argument('--baseline', default=os.path.join(root, 'benchmarks/baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='relative slowdown reported as regression')
+    args = parser.parse_args()
+
+    ctx = {
+        'clean_sentences': 500 if args.quick else 3000,
+        'vocab_sizes': [250, 500, 1000] if args.quick else [1000, 2000, 4000, 8000],
+        'train_rows': 1000 if args.quick else 10000,
+        'train_steps': 5 if args.quick else 50,
+        'latency_repeats': 10 if args.quick else 100,
+    }
+    from data_process_pipeline.semeval2014.preprocess import clean
+    ctx['raw'] = raw_sentences()
+    ctx['cleaned'] = ctx['raw'].copy()
+    ctx['cleaned']['text'] = ctx['cleaned']['text'].apply(clean)
+
+    only = args.only.split(',') if args.only else None
+    results, skipped, failed = {}, {}, {}
+    for fn in BENCHMARKS:
+        if only and fn.__name__ not in only:
+            continue
+        try:
+            out = fn(ctx)
+        except ImportError as e:
+            skipped[fn.__name__] = 'missing dependency: %s' % e
+            print("%-24s skipped (%s)" % (fn.__name__, skipped[fn.__name__]))
+            continue
+        except Exception as e:
+            # the other benchmarks still run, but the run fails
+            failed[fn.__name__] = repr(e)
+            print("%-24s FAILED (%r)" % (fn.__name__, e))
+            continue
+        for name, r in sorted(out.items()):
+            r['benchmark'] = fn.__name__
+            print("%-42s %14.4g %s" % (name, r['value'], r['unit']))
+        results.update(out)
+
+    report = {'machine': {'python': platform.python_version(), 'platform': platform.platform(),
+                          'processor': platform.processor(), 'cpus': os.cpu_count()},
+              'quick': args.quick, 'results': results, 'skipped': skipped,
+              'failed': failed}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("Results written to %s" % args.output)
+
+    status = 0
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print("Baseline written to %s" % args.baseline)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('quick') != args.quick:
+            print("Baseline was recorded with quick=%s; not comparable" % baseline.get('quick'))
+        else:
+            regressions, missing = compare(results, baseline['results'], args.tolerance, only)
+            if regressions or missing:
+                print("%d regressions, %d baseline metrics missing" % (len(regressions), len(missing)))
+                status = 1
+    if failed:
+        print("%d benchmarks failed: %s" % (len(failed), ', '.join(sorted(failed))))
+        status = 1
+    sys.exit(status)
@@ -25,7 +25,9 @@ __maintainer__ = "John Pavlopoulos"
 __email__ = "annis@aueb.gr"
 
 try:
-    import xml.etree.ElementTree as ET, getopt, logging, sys, random, re, copy
+    import xml.etree.ElementTree as ET, getopt, logging, sys, random, re, heapq, os, hashlib, multiprocessing
+    import cPickle as pickle
+    from itertools import izip, imap
     from xml.sax.saxutils import escape
 except:
     sys.exit('Some package is missing... Perhaps <re>?')
@@ -94,8 +96,98 @@ def dice(t1, t2, stopwords=[]):
     return 2. * len(t1.intersection(t2)) / (len(t1) + len(t2))
 
 
-class Category:
+class DiceIndex:
+    '''Inverted index (token -> sentences) over tokenized texts, for k-nearest neighbours by the Dice coefficient.
+    Only sentences sharing a token with the query are scored; the result is the same as ranking every text with dice().'''
+
+    def __init__(self, texts, stopwords=[]):
+        self.stopwords = stopwords
+        self.tokens = [self.tokenize(t) for t in texts]
+        self.postings = {}
+        for i, t in enumerate(self.tokens):
+            for w in t: self.postings.setdefault(w, []).append(i)
+
+    def tokenize(self, t):
+        return set([w for w in t.split() if (w not in self.stopwords)])
+
+    def top_k(self, text, k=5, subset=None):
+        '''Indices of the k texts closest to text, best first; only among subset if given.
+        Ties go to whichever comes first in subset (default: the lower index), as in freq_rank() over a dict of
+        all the scores, so subset must list the indices in the iteration order of such a dict (see dict_order).'''
+        query = self.tokenize(text)
+        ids = xrange(len(self.tokens)) if subset is None else subset
+        if not query:
+            # every score is 0; dice() of two empty texts divides by zero, and this keeps that old behaviour
+            if any(not self.tokens[i] for i in ids):
+                raise ZeroDivisionError('float division by zero')
+            return list(ids)[:k]
+        rank = None if subset is None else dict((i, n) for n, i in enumerate(subset))
+        common = {}
+        for w in query:
+            for i in self.postings.get(w, ()):
+                if rank is None or i in rank:
+                    common[i] = common.get(i, 0) + 1
+        scored = [(-2. * c / (len(query) + len(self.tokens[i])), i if rank is None else rank[i], i) for i, c in
+                  common.iteritems()]
+        topk = [i for _, _, i in heapq.nsmallest(k, scored)]
+        # texts sharing no token score 0 and come next, in tie order
+        for i in ids:
+            if len(topk) >= k: break
+            if i not in common: topk.append(i)
+        return topk
+
+
+class AhoCorasick:
+    '''Aho-Corasick automaton: every occurrence of a set of (non-empty) patterns in a text, in one pass over the text.'''
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.goto, self.fail, self.out = [{}], [0], [[]]
+        for n, p in enumerate(patterns):
+            state = 0
+            for ch in p:
+                if ch not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[state][ch] = len(self.goto) - 1
+                state = self.goto[state][ch]
+            self.out[state].append(n)
+        # breadth first, so the failure state of a node is complete before its children need it
+        queue = list(self.goto[0].values())
+        # dictionary suffix link: nearest state along the failure chain that ends a pattern
+        self.next_out = [0] * len(self.goto)
+        for state in queue:
+            for ch, child in self.goto[state].iteritems():
+                queue.append(child)
+                f = self.fail[state]
+                while f and ch not in self.goto[f]: f = self.fail[f]
+                self.fail[child] = self.goto[f].get(ch, 0)
+                self.next_out[child] = self.fail[child] if self.out[self.fail[child]] else self.next_out[self.fail[child]]
+
+    def find_all(self, text):
+        '''(pattern index, start) of every occurrence, overlapping ones included, ordered by end position.'''
+        found = []
+        state = 0
+        goto, fail, out, next_out, patterns = self.goto, self.fail, self.out, self.next_out, self.patterns
+        for end, ch in enumerate(text, 1):
+            while state and ch not in goto[state]: state = fail[state]
+            state = goto[state].get(ch, 0)
+            s = state
+            while s:
+                for n in out[s]: found.append((n, end - len(patterns[n])))
+                s = next_out[s]
+        return found
+
+
+def dict_order(indices):
+    '''The order in which a dict keyed by these indices iterates them (not sorted once they are sparse).'''
+    return dict([(i, None) for i in indices]).keys()
+
+
+class Category(object):
     '''Category objects contain the term and polarity (i.e., pos, neg, neu, conflict) of the category (e.g., food, price, etc.) of a sentence.'''
+    __slots__ = ('term', 'polarity')
 
     def __init__(self, term='', polarity=''):
         self.term = term
@@ -111,8 +203,9 @@ class Category:
         self.polarity = polarity
 
 
-class Aspect:
+class Aspect(object):
     '''Aspect objects contain the term (e.g., battery life) and polarity (i.e., pos, neg, neu, conflict) of an aspect.'''
+    __slots__ = ('term', 'polarity', 'offsets')
 
     def __init__(self, term, polarity, offsets):
         self.term = term
@@ -130,9 +223,10 @@ class Aspect:
         self.polarity = polarity
 
 
-class Instance:
+class Instance(object):
     '''An instance is a sentence, modeled out of XML (pre-specified format, based on the 4th task of SemEval 2014).
     It contains the text, the aspect terms, and any aspect categories.'''
+    __slots__ = ('text', 'id', 'aspect_terms', 'aspect_categories')
 
     def __init__(self, element):
         self.text = element.find('text').text
@@ -144,6 +238,15 @@ class Instance:
                                   for e in es if
                                   es is not None]
 
+    def predict(self, aspect_terms=None, aspect_categories=None):
+        '''A prediction for this sentence, sharing its text and id, and its term/category lists unless new ones are given.
+        The shared annotations are never modified: taggers pass new lists (of new objects) for what they predict.'''
+        p = Instance.__new__(Instance)
+        p.text, p.id = self.text, self.id
+        p.aspect_terms = self.aspect_terms if aspect_terms is None else aspect_terms
+        p.aspect_categories = self.aspect_categories if aspect_categories is None else aspect_categories
+        return p
+
     def get_aspect_terms(self):
         return [a.term.lower() for a in self.aspect_terms]
 
@@ -163,11 +266,18 @@ class Corpus:
     '''A corpus contains instances, and is useful for training algorithms or splitting to train/test files.'''
 
     def __init__(self, elements):
-        self.corpus = [Instance(e) for e in elements]
+        # XML elements, or Instances (e.g., the parts of a split)
+        self.corpus = [e if isinstance(e, Instance) else Instance(e) for e in elements]
         self.size = len(self.corpus)
         self.aspect_terms_fd = fd([a for i in self.corpus for a in i.get_aspect_terms()])
         self.top_aspect_terms = freq_rank(self.aspect_terms_fd)
         self.texts = [t.text for t in self.corpus]
+        self._dice_index = None
+
+    def dice_index(self):
+        '''The DiceIndex of the texts (built once, on first use).'''
+        if self._dice_index is None: self._dice_index = DiceIndex(self.texts, stopwords)
+        return self._dice_index
 
     def echo(self):
         print '%d instances\n%d distinct aspect terms' % (len(self.corpus), len(self.top_aspect_terms))
@@ -179,31 +289,58 @@ class Corpus:
 
     def split(self, threshold=0.8, shuffle=False):
         '''Split to train/test, based on a threshold. Turn on shuffling for randomizing the elements beforehand.'''
-        clone = copy.deepcopy(self.corpus)
+        # instances are not modified after parsing, so both parts share them with the corpus
+        clone = list(self.corpus)
         if shuffle: random.shuffle(clone)
         train = clone[:int(threshold * self.size)]
         test = clone[int(threshold * self.size):]
         return train, test
 
     def write_out(self, filename, instances, short=True):
-        with open(filename, 'w') as o:
-            o.write('<sentences>\n')
-            for i in instances:
-                o.write('\t<sentence id="%s">\n' % (i.id))
-                o.write('\t\t<text>%s</text>\n' % fix(i.text))
-                o.write('\t\t<aspectTerms>\n')
-                if not short:
-                    for a in i.aspect_terms:
-                        o.write('\t\t\t<aspectTerm term="%s" polarity="%s" from="%s" to="%s"/>\n' % (
-                            fix(a.term), a.polarity, a.offsets['from'], a.offsets['to']))
-                o.write('\t\t</aspectTerms>\n')
-                o.write('\t\t<aspectCategories>\n')
-                if not short:
-                    for c in i.aspect_categories:
-                        o.write('\t\t\t<aspectCategory category="%s" polarity="%s"/>\n' % (fix(c.term), c.polarity))
-                o.write('\t\t</aspectCategories>\n')
-                o.write('\t</sentence>\n')
-            o.write('</sentences>')
+        with SentenceWriter(filename, short) as o:
+            for i in instances: o.write(i)
+
+
+class SentenceWriter():
+    '''Write instances to a SemEval '14 XML file one by one (e.g., while they are tagged), through a large buffer.
+    short=True leaves out the aspect terms and categories.'''
+
+    def __init__(self, filename, short=True, buffering=1 << 20):
+        self.o = open(filename, 'w', buffering)
+        self.short = short
+        self.o.write('<sentences>\n')
+
+    def write(self, i):
+        lines = ['\t<sentence id="%s">\n' % (i.id), '\t\t<text>%s</text>\n' % fix(i.text), '\t\t<aspectTerms>\n']
+        if not self.short:
+            lines.extend(['\t\t\t<aspectTerm term="%s" polarity="%s" from="%s" to="%s"/>\n' % (
+                fix(a.term), a.polarity, a.offsets['from'], a.offsets['to']) for a in i.aspect_terms])
+        lines.append('\t\t</aspectTerms>\n\t\t<aspectCategories>\n')
+        if not self.short:
+            lines.extend(['\t\t\t<aspectCategory category="%s" polarity="%s"/>\n' % (fix(c.term), c.polarity)
+                          for c in i.aspect_categories])
+        lines.append('\t\t</aspectCategories>\n\t</sentence>\n')
+        self.o.write(''.join(lines))
+
+    def close(self):
+        self.o.write('</sentences>')
+        self.o.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_instances(filename):
+    '''Stream the Instances of a SemEval '14 XML file; each sentence element is dropped once read (constant memory).'''
+    context = ET.iterparse(filename, events=('start', 'end'))
+    _, root = next(context)
+    for event, e in context:
+        if event == 'end' and e.tag == 'sentence':
+            yield Instance(e)
+            root.clear()
 
 
 class BaselineAspectExtractor():
@@ -212,6 +349,9 @@ class BaselineAspectExtractor():
 
     def __init__(self, corpus):
         self.candidates = [a.lower() for a in corpus.top_aspect_terms]
+        # tag() used to scan for every candidate in turn (in this order); one automaton finds them all at once
+        self.order = list(set(self.candidates))
+        self.matcher = AhoCorasick([' ' + c + ' ' for c in self.order])
 
     def find_offsets_quickly(self, term, text):
         start = 0
@@ -225,16 +365,25 @@ class BaselineAspectExtractor():
         offsets = [(i, i + len(term)) for i in list(self.find_offsets_quickly(term, text))]
         return offsets
 
+    def find_terms(self, text):
+        '''(term, from, to) of every candidate in the text surrounded by spaces, the same as find_offsets() of
+        ' term ' for each candidate in self.order: non-overlapping occurrences of each term, left to right.'''
+        occurrences = {}
+        for n, start in self.matcher.find_all(text):
+            starts = occurrences.setdefault(n, [])
+            if not starts or start >= starts[-1] + len(self.matcher.patterns[n]): starts.append(start)
+        terms = []
+        for n in sorted(occurrences):
+            c = self.order[n]
+            terms.extend((c, start + 1, start + 1 + len(c)) for start in occurrences[n])
+        return terms
+
     def tag(self, test_instances):
         clones = []
         for i in test_instances:
-            i_ = copy.deepcopy(i)
-            i_.aspect_terms = []
-            for c in set(self.candidates):
-                if c in i_.text:
-                    offsets = self.find_offsets(' ' + c + ' ', i.text)
-                    for start, end in offsets: i_.add_aspect_term(term=c,
-                                                                  offsets={'from': str(start + 1), 'to': str(end - 1)})
+            i_ = i.predict(aspect_terms=[])
+            for c, start, end in self.find_terms(i.text):
+                i_.add_aspect_term(term=c, offsets={'from': str(start), 'to': str(end)})
             clones.append(i_)
         return clones
 
@@ -248,9 +397,7 @@ class BaselineCategoryDetector():
 
     # Fetch k-neighbors (i.e., similar texts), using the Dice coefficient, and vote for #categories and category values
     def fetch_k_nn(self, text, k=5, multi=False):
-        neighbors = dict([(i, dice(text, n, stopwords)) for i, n in enumerate(self.corpus.texts)])
-        ranked = freq_rank(neighbors)
-        topk = [self.corpus.corpus[i] for i in ranked[:k]]
+        topk = [self.corpus.corpus[i] for i in self.corpus.dice_index().top_k(text, k)]
         num_of_cats = 1 if not multi else int(sum([len(i.aspect_categories) for i in topk]) / float(k))
         cats = freq_rank(fd([c for i in topk for c in i.get_aspect_categories()]))
         categories = [cats[i] for i in range(num_of_cats)]
@@ -259,9 +406,7 @@ class BaselineCategoryDetector():
     def tag(self, test_instances):
         clones = []
         for i in test_instances:
-            i_ = copy.deepcopy(i)
-            i_.aspect_categories = [Category(term=c) for c in self.fetch_k_nn(i.text)]
-            clones.append(i_)
+            clones.append(i.predict(aspect_categories=[Category(term=c) for c in self.fetch_k_nn(i.text)]))
         return clones
 
 
@@ -275,12 +420,9 @@ class BaselineStageI():
     def tag(self, test_instances):
         clones = []
         for i in test_instances:
-            i_ = copy.deepcopy(i)
-            i_.aspect_categories, i_.aspect_terms = [], []
-            for a in set(self.b1.candidates):
-                offsets = self.b1.find_offsets(' ' + a + ' ', i_.text)
-                for start, end in offsets:
-                    i_.add_aspect_term(term=a, offsets={'from': str(start + 1), 'to': str(end - 1)})
+            i_ = i.predict(aspect_terms=[], aspect_categories=[])
+            for a, start, end in self.b1.find_terms(i_.text):
+                i_.add_aspect_term(term=a, offsets={'from': str(start), 'to': str(end)})
             for c in self.b2.fetch_k_nn(i_.text):
                 i_.aspect_categories.append(Category(term=c))
             clones.append(i_)
@@ -297,13 +439,17 @@ class BaselineAspectPolarityEstimator():
         self.corpus = corpus
         self.fd = fd2([(a.term, a.polarity) for i in self.corpus.corpus for a in i.aspect_terms])
         self.major = freq_rank(fd([a.polarity for i in self.corpus.corpus for a in i.aspect_terms]))[0]
+        # aspect term -> indices of the train sentences that have it
+        self.term_sentences = {}
+        for n, i in enumerate(self.corpus.corpus):
+            for a in set(i.get_aspect_terms()): self.term_sentences.setdefault(a, []).append(n)
+        # ties between neighbours were broken by the order of a dict of the scores; keep that order
+        self.term_sentences = dict((a, dict_order(ns)) for a, ns in self.term_sentences.iteritems())
 
     # Fetch k-neighbors (i.e., similar texts), using the Dice coefficient, and vote for aspect's polarity
     def k_nn(self, text, aspect, k=5):
-        neighbors = dict([(i, dice(text, next.text, stopwords)) for i, next in enumerate(self.corpus.corpus) if
-                          aspect in next.get_aspect_terms()])
-        ranked = freq_rank(neighbors)
-        topk = [self.corpus.corpus[i] for i in ranked[:k]]
+        subset = self.term_sentences.get(aspect, [])
+        topk = [self.corpus.corpus[i] for i in self.corpus.dice_index().top_k(text, k, subset)]
         return freq_rank(fd([a.polarity for i in topk for a in i.aspect_terms]))
 
     def majority(self, text, aspect):
@@ -319,9 +465,8 @@ class BaselineAspectPolarityEstimator():
     def tag(self, test_instances):
         clones = []
         for i in test_instances:
-            i_ = copy.deepcopy(i)
-            for j in i_.aspect_terms: j.polarity = self.majority(i_.text, j.term)
-            clones.append(i_)
+            clones.append(i.predict(
+                aspect_terms=[Aspect(j.term, self.majority(i.text, j.term), j.offsets) for j in i.aspect_terms]))
         return clones
 
 
@@ -337,19 +482,14 @@ class BaselineAspectCategoryPolarityEstimator():
 
     # Fetch k-neighbors (i.e., similar texts), using the Dice coefficient, and vote for aspect's polarity
     def k_nn(self, text, k=5):
-        neighbors = dict([(i, dice(text, next.text, stopwords)) for i, next in enumerate(self.corpus.corpus)])
-        ranked = freq_rank(neighbors)
-        topk = [self.corpus.corpus[i] for i in ranked[:k]]
+        topk = [self.corpus.corpus[i] for i in self.corpus.dice_index().top_k(text, k)]
         return freq_rank(fd([c.polarity for i in topk for c in i.aspect_categories]))
 
     def tag(self, test_instances):
         clones = []
         for i in test_instances:
-            i_ = copy.deepcopy(i)
-            polarity = self.k_nn(i_.text)[0]
-            for j in i_.aspect_categories:
-                j.polarity = polarity
-            clones.append(i_)
+            polarity = self.k_nn(i.text)[0]
+            clones.append(i.predict(aspect_categories=[Category(j.term, polarity) for j in i.aspect_categories]))
         return clones
 
 
@@ -366,76 +506,170 @@ class BaselineStageII():
     def tag(self, test_instances):
         clones = []
         for i in test_instances:
-            i_ = copy.deepcopy(i)
-            for j in i_.aspect_terms: j.polarity = self.b3.majority(i_.text, j.term)
-            for j in i_.aspect_categories: j.polarity = self.b4.majority(i_.text)
-            clones.append(i_)
+            clones.append(i.predict(
+                aspect_terms=[Aspect(j.term, self.b3.majority(i.text, j.term), j.offsets) for j in i.aspect_terms],
+                aspect_categories=[Category(j.term, self.b4.majority(i.text)) for j in i.aspect_categories]))
         return clones
 
 
+# The tagger and test instances of a ShardedTagger run, set before the pool forks so the workers share them.
+_shared = {}
+
+
+def _tag_shard(shard):
+    '''Tag the instances [start:end] in a worker, and store the result in the shard's cache file (if any).'''
+    k, start, end, path = shard
+    predicted = _shared['tagger'].tag(_shared['instances'][start:end])
+    if path:
+        with open(path + '.tmp', 'wb') as o: pickle.dump(predicted, o, pickle.HIGHEST_PROTOCOL)
+        os.rename(path + '.tmp', path)
+    return k, predicted
+
+
+def file_digest(*filenames):
+    '''md5 of the files' contents, e.g., to tell the runs of a ShardedTagger cache apart.'''
+    h = hashlib.md5()
+    for filename in filenames:
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), ''): h.update(block)
+    return h.hexdigest()
+
+
+class ShardedTagger():
+    '''Tag with any of the baselines above in a pool of processes.
+    The test instances are split in shards, which forked workers tag with the (read-only) trained baseline of the parent;
+    the predictions are merged in the original order. With a cache directory, every shard is stored as soon as it is
+    tagged, and a run with the same key resumes from the shards that are there.'''
+
+    def __init__(self, tagger, jobs=None, shards=None, cache=None, key=''):
+        self.tagger = tagger
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.shards = shards or 4 * self.jobs
+        self.cache = cache
+        self.key = key
+
+    def shard_paths(self, test_instances):
+        if not self.cache: return [None] * self.shards
+        h = hashlib.md5(self.key)
+        h.update(self.tagger.__class__.__name__)
+        h.update(repr([(i.id, i.text) for i in test_instances]))
+        folder = os.path.join(self.cache, '%s-%d' % (h.hexdigest(), self.shards))
+        if not os.path.exists(folder): os.makedirs(folder)
+        return [os.path.join(folder, 'shard-%04d.pkl' % k) for k in range(self.shards)]
+
+    def tag(self, test_instances):
+        n = len(test_instances)
+        paths = self.shard_paths(test_instances)
+        parts, todo = [None] * self.shards, []
+        for k, path in enumerate(paths):
+            if path and os.path.exists(path):
+                with open(path, 'rb') as f: parts[k] = pickle.load(f)
+            else:
+                todo.append((k, k * n // self.shards, (k + 1) * n // self.shards, path))
+        if todo: logger.info('tagging %d of %d shards with %d processes', len(todo), self.shards, self.jobs)
+        if self.jobs == 1 or sys.platform == 'win32':
+            # no fork on windows: tag in this process (the shards are still cached)
+            _shared.update(tagger=self.tagger, instances=test_instances)
+            for shard in todo:
+                k, parts[k] = _tag_shard(shard)
+        elif todo:
+            _shared.update(tagger=self.tagger, instances=test_instances)
+            pool = multiprocessing.Pool(min(self.jobs, len(todo)))
+            try:
+                results = pool.imap_unordered(_tag_shard, todo)
+                # a timeout keeps the wait interruptible by Ctrl-C
+                for _ in todo:
+                    k, part = results.next(timeout=1 << 30)
+                    parts[k] = part
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        _shared.clear()
+        return [i for part in parts for i in part]
+
+
+def record(instance):
+    '''What Evaluate scores of a sentence: (term offsets, categories, term polarities, category polarities).
+    Records pass through, so the evaluation streams may mix Instances and records.'''
+    if isinstance(instance, tuple): return instance
+    return ([(a.offsets['from'], a.offsets['to']) for a in instance.aspect_terms], instance.get_aspect_categories(),
+            [a.polarity for a in instance.aspect_terms], [c.polarity for c in instance.aspect_categories])
+
+
+def read_records(filename):
+    '''Stream the records of the sentences of an XML file (see read_instances()).'''
+    return imap(record, read_instances(filename))
+
+
 class Evaluate():
-    '''Evaluation methods, per subtask of the 4th task of SemEval '14.'''
+    '''Evaluation methods, per subtask of the 4th task of SemEval '14.
+    correct and predicted are Instances or records (see record()) in matching order: lists, or streams such as
+    read_records(); all the subtasks are counted in the first pass, so a stream is read once.'''
 
     def __init__(self, correct, predicted):
-        self.size = len(correct)
         self.correct = correct
         self.predicted = predicted
-
-    # Aspect Extraction (no offsets considered)
-    def aspect_extraction(self, b=1):
-        common, relevant, retrieved = 0., 0., 0.
-        for i in range(self.size):
-            cor = [a.offsets for a in self.correct[i].aspect_terms]
-            pre = [a.offsets for a in self.predicted[i].aspect_terms]
-            common += len([a for a in pre if a in cor])
-            retrieved += len(pre)
-            relevant += len(cor)
+        self._counts = None
+
+    def counts(self):
+        if self._counts is None:
+            n = dict.fromkeys(['terms', 'terms_retrieved', 'terms_relevant', 'categories', 'categories_retrieved',
+                               'categories_relevant', 'term_polarities', 'term_polarities_all', 'category_polarities',
+                               'category_polarities_all'], 0.)
+            for cor, pre in izip(imap(record, self.correct), imap(record, self.predicted)):
+                # offsets and categories are matched as sets (not by scanning the gold list for each prediction)
+                offsets, categories = set(cor[0]), set(pre[1])
+                n['terms'] += sum([1 for o in pre[0] if o in offsets])
+                n['terms_retrieved'] += len(pre[0])
+                n['terms_relevant'] += len(cor[0])
+                # Use set to avoid duplicates (i.e., two times the same category)
+                n['categories'] += len(categories.intersection(cor[1]))
+                n['categories_retrieved'] += len(categories)
+                n['categories_relevant'] += len(cor[1])
+                n['term_polarities'] += sum([1 for p, c in izip(pre[2], cor[2]) if p == c])
+                n['term_polarities_all'] += len(pre[2])
+                n['category_polarities'] += sum([1 for p, c in izip(pre[3], cor[3]) if p == c])
+                n['category_polarities_all'] += len(pre[3])
+            self._counts = n
+        return self._counts
+
+    def f_scores(self, common, retrieved, relevant, b=1):
         p = common / retrieved if retrieved > 0 else 0.
         r = common / relevant
         f1 = (1 + (b ** 2)) * p * r / ((p * b ** 2) + r) if p > 0 and r > 0 else 0.
         return p, r, f1, common, retrieved, relevant
 
+    # Aspect Extraction (no offsets considered)
+    def aspect_extraction(self, b=1):
+        n = self.counts()
+        return self.f_scores(n['terms'], n['terms_retrieved'], n['terms_relevant'], b)
+
     # Aspect Category Detection
     def category_detection(self, b=1):
-        common, relevant, retrieved = 0., 0., 0.
-        for i in range(self.size):
-            cor = self.correct[i].get_aspect_categories()
-            # Use set to avoid duplicates (i.e., two times the same category)
-            pre = set(self.predicted[i].get_aspect_categories())
-            common += len([c for c in pre if c in cor])
-            retrieved += len(pre)
-            relevant += len(cor)
-        p = common / retrieved if retrieved > 0 else 0.
-        r = common / relevant
-        f1 = (1 + b ** 2) * p * r / ((p * b ** 2) + r) if p > 0 and r > 0 else 0.
-        return p, r, f1, common, retrieved, relevant
+        n = self.counts()
+        return self.f_scores(n['categories'], n['categories_retrieved'], n['categories_relevant'], b)
 
     def aspect_polarity_estimation(self, b=1):
-        common, relevant, retrieved = 0., 0., 0.
-        for i in range(self.size):
-            cor = [a.polarity for a in self.correct[i].aspect_terms]
-            pre = [a.polarity for a in self.predicted[i].aspect_terms]
-            common += sum([1 for j in range(len(pre)) if pre[j] == cor[j]])
-            retrieved += len(pre)
-        acc = common / retrieved
-        return acc, common, retrieved
+        n = self.counts()
+        return n['term_polarities'] / n['term_polarities_all'], n['term_polarities'], n['term_polarities_all']
 
     def aspect_category_polarity_estimation(self, b=1):
-        common, relevant, retrieved = 0., 0., 0.
-        for i in range(self.size):
-            cor = [a.polarity for a in self.correct[i].aspect_categories]
-            pre = [a.polarity for a in self.predicted[i].aspect_categories]
-            common += sum([1 for j in range(len(pre)) if pre[j] == cor[j]])
-            retrieved += len(pre)
-        acc = common / retrieved
-        return acc, common, retrieved
+        n = self.counts()
+        return (n['category_polarities'] / n['category_polarities_all'], n['category_polarities'],
+                n['category_polarities_all'])
 
 
 def main(argv=None):
     # Parse the input
-    opts, args = getopt.getopt(argv, "hg:dt:om:k:", ["help", "grammar", "train=", "task=", "test="])
+    opts, args = getopt.getopt(argv, "hg:dt:om:k:j:",
+                               ["help", "grammar", "train=", "task=", "test=", "jobs=", "shards=", "cache=",
+                                "score="])
     trainfile, testfile, task = None, None, 1
-    use_msg = 'Use as:\n">>> python baselines.py --train file.xml --task 1|2|3|4(|5|6)"\n\nThis will parse a train set, examine whether is valid, split to train and test (80/20 %), write the new train, test and unseen test files, perform ABSA for task 1, 2, 3, or 4 (5 and 6 perform jointly tasks 1 & 2, and 3 & 4, respectively), and write out a file with the predictions.'
+    jobs, shards, cache, scorefile = 1, None, None, None
+    use_msg = 'Use as:\n">>> python baselines.py --train file.xml --task 1|2|3|4(|5|6)"\n\nThis will parse a train set, examine whether is valid, split to train and test (80/20 %), write the new train, test and unseen test files, perform ABSA for task 1, 2, 3, or 4 (5 and 6 perform jointly tasks 1 & 2, and 3 & 4, respectively), and write out a file with the predictions.\n\nAdd "--jobs N" to tag in N processes (0: one per core), "--shards M" to split the test sentences in M shards (default: 4N), and "--cache dir" to store the tagged shards, so that an interrupted run resumes.\n\nTo only score a file of predictions, use "--test gold.xml --score predicted.xml --task 1|2|3|4|5|6".'
     if len(opts) == 0: sys.exit(use_msg)
     for opt, arg in opts:
         if opt in ("-h", "--help"):
@@ -446,6 +680,29 @@ def main(argv=None):
             task = int(arg)
         elif opt in ('-k', "--test"):
             testfile = arg
+        elif opt in ('-j', "--jobs"):
+            jobs = int(arg)
+        elif opt == "--shards":
+            shards = int(arg)
+        elif opt == "--cache":
+            cache = arg
+        elif opt == "--score":
+            scorefile = arg
+
+    if scorefile:
+        # Only score the predictions of --score against the gold file of --test, reading both as streams.
+        scores = Evaluate(read_records(testfile), read_records(scorefile))
+        if task in (1, 5):
+            print 'Task 1: P = %f -- R = %f -- F1 = %f (#correct: %d, #retrieved: %d, #relevant: %d)' % (
+                scores.aspect_extraction())
+        if task in (2, 5):
+            print 'Task 2: P = %f -- R = %f -- F1 = %f (#correct: %d, #retrieved: %d, #relevant: %d)' % (
+                scores.category_detection())
+        if task in (3, 6):
+            print 'Task 3: Accuracy = %f (#Correct/#All: %d/%d)' % scores.aspect_polarity_estimation()
+        if task in (4, 6):
+            print 'Task 4: Accuracy = %f (#Correct/#All: %d/%d)' % scores.aspect_category_polarity_estimation()
+        return
 
     # Examine if the file is in proper XML format for further use.
     print 'Validating the file...'
@@ -465,40 +722,50 @@ def main(argv=None):
         seen = Corpus(ET.parse(testfile).getroot().findall('sentence'))
     else:
         train, seen = corpus.split()
-        # Store train/test files and clean up the test files (no aspect terms or categories are present); then, parse back the files back.
+        # Store train/test files; the corpora are made of the same instances, without parsing the files back.
         corpus.write_out('%s--train.xml' % domain_name, train, short=False)
-        traincorpus = Corpus(ET.parse('%s--train.xml' % domain_name).getroot().findall('sentence'))
+        traincorpus = Corpus(train)
         corpus.write_out('%s--test.gold.xml' % domain_name, seen, short=False)
-        seen = Corpus(ET.parse('%s--test.gold.xml' % domain_name).getroot().findall('sentence'))
+        seen = Corpus(seen)
 
+    # Clean up the test files (no aspect terms or categories are present), in memory as well.
     corpus.write_out('%s--test.xml' % domain_name, seen.corpus)
-    unseen = Corpus(ET.parse('%s--test.xml' % domain_name).getroot().findall('sentence'))
+    unseen = Corpus([i.predict(aspect_terms=[], aspect_categories=[]) for i in seen.corpus])
+
+    # -j N tags in N processes (0: one per core), --cache DIR keeps the tagged shards to resume an interrupted run
+    if jobs != 1 or cache:
+        key = '%d:%s' % (task, file_digest(*[f for f in (trainfile, testfile) if f]))
+        sharded = lambda b: ShardedTagger(b, jobs, shards, cache, key)
+        # build the shared index before the workers fork
+        traincorpus.dice_index()
+    else:
+        sharded = lambda b: b
 
     # Perform the tasks, asked by the user and print the files with the predicted responses.
     if task == 1:
         b1 = BaselineAspectExtractor(traincorpus)
         print 'Extracting aspect terms...'
-        predicted = b1.tag(unseen.corpus)
+        predicted = sharded(b1).tag(unseen.corpus)
         corpus.write_out('%s--test.predicted-aspect.xml' % domain_name, predicted, short=False)
         print 'P = %f -- R = %f -- F1 = %f (#correct: %d, #retrieved: %d, #relevant: %d)' % Evaluate(seen.corpus,
                                                                                                      predicted).aspect_extraction()
     if task == 2:
         print 'Detecting aspect categories...'
         b2 = BaselineCategoryDetector(traincorpus)
-        predicted = b2.tag(unseen.corpus)
+        predicted = sharded(b2).tag(unseen.corpus)
         print 'P = %f -- R = %f -- F1 = %f (#correct: %d, #retrieved: %d, #relevant: %d)' % Evaluate(seen.corpus,
                                                                                                      predicted).category_detection()
         corpus.write_out('%s--test.predicted-category.xml' % domain_name, predicted, short=False)
     if task == 3:
         print 'Estimating aspect term polarity...'
         b3 = BaselineAspectPolarityEstimator(traincorpus)
-        predicted = b3.tag(seen.corpus)
+        predicted = sharded(b3).tag(seen.corpus)
         corpus.write_out('%s--test.predicted-aspectPolar.xml' % domain_name, predicted, short=False)
         print 'Accuracy = %f, #Correct/#All: %d/%d' % Evaluate(seen.corpus, predicted).aspect_polarity_estimation()
     if task == 4:
         print 'Estimating aspect category polarity...'
         b4 = BaselineAspectCategoryPolarityEstimator(traincorpus)
-        predicted = b4.tag(seen.corpus)
+        predicted = sharded(b4).tag(seen.corpus)
         print 'Accuracy = %f, #Correct/#All: %d/%d' % Evaluate(seen.corpus,
                                                                predicted).aspect_category_polarity_estimation()
         corpus.write_out('%s--test.predicted-categoryPolar.xml' % domain_name, predicted, short=False)
@@ -508,7 +775,7 @@ def main(argv=None):
         b1 = BaselineAspectExtractor(traincorpus)
         b2 = BaselineCategoryDetector(traincorpus)
         b12 = BaselineStageI(b1, b2)
-        predicted = b12.tag(unseen.corpus)
+        predicted = sharded(b12).tag(unseen.corpus)
         corpus.write_out('%s--test.predicted-stageI.xml' % domain_name, predicted, short=False)
         print 'Task 1: P = %f -- R = %f -- F1 = %f (#correct: %d, #retrieved: %d, #relevant: %d)' % Evaluate(
             seen.corpus, predicted).aspect_extraction()
@@ -520,7 +787,7 @@ def main(argv=None):
         b3 = BaselineAspectPolarityEstimator(traincorpus)
         b4 = BaselineAspectCategoryPolarityEstimator(traincorpus)
         b34 = BaselineStageII(b3, b4)
-        predicted = b34.tag(seen.corpus)
+        predicted = sharded(b34).tag(seen.corpus)
         corpus.write_out('%s--test.predicted-stageII.xml' % domain_name, predicted, short=False)
         print 'Task 3: Accuracy = %f (#Correct/#All: %d/%d)' % Evaluate(seen.corpus,
                                                                         predicted).aspect_polarity_estimation()
@@ -0,0 +1,180 @@
+"""
+One embedding matrix for every domain (SemEval 2014, 2016 restaurants, 2016 laptops, ...), stored once and
+memory-mapped read-only, so any number of worker processes and domain models share a single physical copy through
+the page cache.
+
+Build it from the vocabularies and vectors the pipelines wrote (from the repository root):
+
+    $ python -m data_process_pipeline.embedding_store data/embeddings data/semeval14 data/semeval16/restaurants \
+        data/semeval16/laptop
+
+A word gets one row for all domains. Only when a domain's vector of a word differs from the stored one (the random
+__UNK__ / __PAD__ / '.' vectors every pipeline run draws) does it get a row of its own, so each domain still sees
+exactly the vectors its models were trained with. Every domain keeps its own word ids: a small int32 array maps
+them to rows of the store.
+
+The aspect embedding matrix of the 2014 models is as large as the text one (aspect_vocab.vocab is written from the
+text vocabulary, and every word without an aspect vector gets the __UNK__ row), so a domain with aspect_vocab.vocab
+and aspect_vector.pkl gets a second remap for it; its few distinct rows are shared with the text rows.
+
+    embeddings.npy               float32 [rows, dim]
+    vocab.vocab                  row, word
+    remap_<domain>.npy           int32 [domain vocabulary size], row of every word id of the domain
+    remap_<domain>_aspect.npy    int32 [domain aspect vocabulary size], row of every aspect id
+    manifest.json                dim, rows, version (digest of the rows) and the domains
+
+What stays private to each process and domain model is the remaps (4 bytes per word) and the layers that are not
+embeddings (about 5.5 MB in float32 for the default LSTM with hidden size 300).
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+
+def domain_name(vocab_dir, store_dir):
+    """ semeval16/laptop for data/semeval16/laptop next to data/embeddings """
+    return os.path.relpath(vocab_dir, os.path.dirname(os.path.abspath(store_dir))).replace(os.sep, '/')
+
+
+def remap_file(domain, aspect=False):
+    return 'remap_%s%s.npy' % (domain.replace('/', '_'), '_aspect' if aspect else '')
+
+
+def read_vocab(vocab_dir, name='text_vocab.vocab'):
+    """ Words of text_vocab.vocab (or name) in id order """
+    with open(os.path.join(vocab_dir, name)) as f:
+        words = dict(line.rstrip('\n').split('\t') for line in f)
+    return [words[str(i)] for i in range(len(words))]
+
+
+def build_store(store_dir, domains):
+    """
+    domains -> {name: vocab_dir} with text_vocab.vocab and text_vector.pkl in each (and aspect_vocab.vocab and
+    aspect_vector.pkl for the aspect matrix); words without a vector get the domain's __UNK__ vector, as
+    data_loader.load_emb gives them
+    """
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+    rows, words, index = [], [], {}
+    manifest = {'domains': {}}
+
+    def add(vocab_dir, vocab_name, vector_name):
+        with open(os.path.join(vocab_dir, vector_name), 'rb') as f:
+            vectors = pickle.load(f)
+        vocab = read_vocab(vocab_dir, vocab_name)
+        remap = np.empty(len(vocab), dtype=np.int32)
+        for i, word in enumerate(vocab):
+            key = word if word in vectors else '__UNK__'
+            vector = np.asarray(vectors[key], dtype=np.float32)
+            row = index.get((key, vector.tobytes()))
+            if row is None:
+                row = index[(key, vector.tobytes())] = len(rows)
+                rows.append(vector)
+                words.append(key)
+            remap[i] = row
+        return remap
+
+    total = 0
+    for name, vocab_dir in sorted(domains.items()):
+        remap = add(vocab_dir, 'text_vocab.vocab', 'text_vector.pkl')
+        np.save(os.path.join(store_dir, remap_file(name)), remap)
+        manifest['domains'][name] = {'source': vocab_dir, 'vocab_size': len(remap), 'remap': remap_file(name)}
+        total += len(remap)
+        if all(os.path.exists(os.path.join(vocab_dir, f)) for f in ['aspect_vocab.vocab', 'aspect_vector.pkl']):
+            aspect_remap = add(vocab_dir, 'aspect_vocab.vocab', 'aspect_vector.pkl')
+            np.save(os.path.join(store_dir, remap_file(name, aspect=True)), aspect_remap)
+            manifest['domains'][name].update(aspect_vocab_size=len(aspect_remap),
+                                             aspect_remap=remap_file(name, aspect=True))
+            total += len(aspect_remap)
+            print("%s: %d words, %d aspect rows" % (name, len(remap), len(aspect_remap)))
+        else:
+            print("%s: %d words" % (name, len(remap)))
+
+    matrix = np.asarray(rows, dtype=np.float32)
+    np.save(os.path.join(store_dir, 'embeddings.npy'), matrix)
+    with open(os.path.join(store_dir, 'vocab.vocab'), 'w') as f:
+        for i, word in enumerate(words):
+            f.write('%d\t%s\n' % (i, word))
+    manifest.update(dim=int(matrix.shape[1]), rows=int(matrix.shape[0]),
+                    version=hashlib.md5(matrix.tobytes()).hexdigest())
+    with open(os.path.join(store_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    # total: rows of the text and aspect matrices of every domain, were each a private copy
+    print("%d rows for %d domain matrix rows (%.1f MB instead of %.1f MB)" % (
+        matrix.shape[0], total, matrix.nbytes / 2.0 ** 20, total * matrix.shape[1] * 4 / 2.0 ** 20))
+    return manifest
+
+
+class EmbeddingStore():
+    """ The store, memory-mapped read-only """
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.version = self.manifest['version']
+        self.matrix = np.load(os.path.join(store_dir, 'embeddings.npy'), mmap_mode='r')
+
+    def domains(self):
+        return sorted(self.manifest['domains'])
+
+    def domain(self, name, aspect=False):
+        """ The text (or with aspect, the aspect) embedding matrix of a domain """
+        if name not in self.manifest['domains']:
+            raise KeyError("No domain %s in %s (has %s)" % (name, self.store_dir, ', '.join(self.domains())))
+        entry = self.manifest['domains'][name]
+        if aspect and 'aspect_remap' not in entry:
+            raise KeyError("No aspect embeddings for domain %s in %s" % (name, self.store_dir))
+        remap = np.load(os.path.join(self.store_dir, entry['aspect_remap' if aspect else 'remap']))
+        return DomainEmbedding(self.matrix, remap, '%s/%s%s' % (self.version, name, '/aspect' if aspect else ''))
+
+    def load_kwargs(self, name):
+        """ embeddings= (and aspect_embeddings= when the store has them) for NumpyAspectLevelModel.load """
+        kwargs = {'embeddings': self.domain(name)}
+        if 'aspect_remap' in self.manifest['domains'].get(name, {}):
+            kwargs['aspect_embeddings'] = self.domain(name, aspect=True)
+        return kwargs
+
+
+class DomainEmbedding():
+    """
+    The embedding matrix of one domain, indexed by the domain's word ids like the matrix itself
+    (embedding[x] for any int array x); the rows are read from the shared store
+    """
+
+    def __init__(self, matrix, remap, version):
+        self.matrix = matrix
+        self.remap = remap
+        self.version = version
+        self.shape = (len(remap), matrix.shape[1])
+        self.dtype = matrix.dtype
+
+    def __len__(self):
+        return len(self.remap)
+
+    def __getitem__(self, ids):
+        return self.matrix[self.remap[ids]]
+
+    @property
+    def nbytes(self):
+        """ Private memory of the view, the rows are shared """
+        return self.remap.nbytes
+
+    def array(self):
+        """ The domain matrix as a private array, e.g. to feed AspectLevelModel.embedding_placeholder """
+        return np.asarray(self.matrix[self.remap])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('store', help='directory of the store')
+    parser.add_argument('domains', nargs='+',
+                        help='vocabulary directories of the pipelines (name=dir to name the domain, the default '
+                             'name is the path relative to the parent of the store)')
+    args = parser.parse_args()
+    domains = dict(d.split('=', 1) if '=' in d else (domain_name(d, args.store), d) for d in args.domains)
+    build_store(args.store, domains)
@@ -0,0 +1,72 @@
+"""
+Frequency pruning of the text vocabulary. run.py (2014 and 2016) keeps every word that has a word2vec vector, so
+the embedding matrix grows with every typo and one-off name of the corpus; with --min-count, --max-vocab or
+--coverage it keeps only the most frequent words:
+
+    $ python run.py --coverage 0.995          # the words of 99.5% of the tokens that have a vector
+    $ python run.py --min-count 2 --max-vocab 20000
+
+A pruned word is simply not in text_vector.pkl / text_vocab.vocab, so it is __UNK__ everywhere the vocabulary is
+read: create_model_data when the splits are encoded, predict.Predictor and reviews.py when serving, and the
+embedding store. The 'prune' stage of the run report has the words, embedding MB and __UNK__ token share before and
+after; baseline/prune_eval.py measures the accuracy a trained model loses when the pruned words become __UNK__.
+
+vocab.py, which extends the vocabulary with a new batch of reviews, sees a pruned word as new: give it the same
+--min-count so it keeps the batch's words by the same rule (--max-vocab and --coverage are only applied here).
+"""
+import numpy as np
+
+# always kept, whatever their count (get_vectors gives them random vectors)
+special_words = ('__UNK__', '__PAD__', '.')
+
+
+def keep_words(counts, min_count=1, max_size=None, coverage=None, keep=special_words):
+    """
+    counts -> (word, count) pairs. The words left after pruning, most frequent first: at least min_count
+    occurrences, at most max_size words (those of keep included) and only as many as it takes to cover the
+    coverage fraction of the tokens in counts. The words of keep are always kept.
+    """
+    counts = sorted(counts, key=lambda wc: -wc[1])  # stable: ties stay in the order of counts
+    kept = list(keep)
+    total = float(sum(c for w, c in counts if w not in keep))
+    covered = 0
+    for word, count in counts:
+        if word in keep:
+            continue
+        if count < min_count or (max_size is not None and len(kept) >= max_size):
+            break
+        if coverage is not None and total and covered / total >= coverage:
+            break
+        kept.append(word)
+        covered += count
+    return kept
+
+
+def prune_vectors(text_vector, text_vocab, min_count=1, max_size=None, coverage=None):
+    """
+    text_vector -> {word: vector} of get_vectors, text_vocab -> (word, count) pairs of get_vocab. Prunes among
+    the words that have a vector (the others are __UNK__ anyway); returns the pruned text_vector and its stats.
+    """
+    counts = [(w, c) for w, c in text_vocab if w in text_vector]
+    words = set(keep_words(counts, min_count, max_size, coverage, [w for w in special_words if w in text_vector]))
+    pruned = {w: v for w, v in text_vector.items() if w in words}
+    return pruned, prune_stats(text_vocab, text_vector, pruned)
+
+
+def prune_stats(text_vocab, before, after, dim=None):
+    """ Vocabulary size, float32 embedding MB and share of the tokens that are __UNK__, before and after """
+    dim = dim or len(next(iter(before.values())))
+    tokens = float(sum(c for _, c in text_vocab)) or 1.0
+    stats = {}
+    for name, vocab in [('before', before), ('after', after)]:
+        stats['words_' + name] = len(vocab)
+        stats['embedding_mb_' + name] = round(len(vocab) * dim * np.dtype(np.float32).itemsize / 2.0 ** 20, 3)
+        stats['unk_tokens_' + name] = round(sum(c for w, c in text_vocab if w not in vocab) / tokens, 5)
+    return stats
+
+
+def print_stats(stats):
+    print("%-8s %10s %14s %12s" % ('', 'words', 'embedding MB', '__UNK__ %'))
+    for name in ['before', 'after']:
+        print("%-8s %10d %14.2f %12.2f" % (name, stats['words_' + name], stats['embedding_mb_' + name],
+                                           100 * stats['unk_tokens_' + name]))
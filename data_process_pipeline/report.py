@@ -0,0 +1,105 @@
+import json
+import os
+import sys
+from collections import OrderedDict
+from contextlib import contextmanager
+from time import perf_counter, process_time, strftime
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def _proc_status_kb(key):
+    """ VmHWM / VmRSS from /proc/self/status (Linux), in kB """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1])
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """ Resets the kernel's peak RSS counter so the next reading is the peak of one stage (Linux >= 4.0) """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+def _peak_rss_mb():
+    kb = _proc_status_kb('VmHWM')
+    if kb is None and resource is not None:
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            kb //= 1024
+    return kb / 1024.0 if kb is not None else None
+
+
+class StageReport():
+    """
+    Wall time, CPU time, peak RSS and row counts per pipeline stage (ingest, clean, vocab, vectors, encode,
+    write), saved as a json run report. With quiet=True everything the stages print (whole DataFrames and
+    vocabularies) is discarded; the summary table is still printed.
+
+    Peak RSS is per stage where the kernel allows resetting it, otherwise the process peak so far
+    (peak_rss_per_stage in the report says which).
+    """
+
+    def __init__(self, name, quiet=False):
+        self.name = name
+        self.quiet = quiet
+        self.stages = OrderedDict()
+        self.started = strftime('%Y-%m-%d %H:%M:%S')
+        self.per_stage_peak = True
+        self.st = perf_counter()
+        self.cpu_st = process_time()
+
+    @contextmanager
+    def stage(self, name):
+        """ Yields the stage record; set record['rows'] to report a row count. Repeated names accumulate """
+        record = self.stages.setdefault(name, OrderedDict(
+            [('wall_seconds', 0.0), ('cpu_seconds', 0.0), ('peak_rss_mb', None), ('rows', None)]))
+        self.per_stage_peak = _reset_peak_rss() and self.per_stage_peak
+        st, cpu_st = perf_counter(), process_time()
+        try:
+            if self.quiet:
+                with open(os.devnull, 'w') as devnull:
+                    stdout, stderr = sys.stdout, sys.stderr
+                    sys.stdout, sys.stderr = devnull, devnull
+                    try:
+                        yield record
+                    finally:
+                        sys.stdout, sys.stderr = stdout, stderr
+            else:
+                yield record
+        finally:
+            record['wall_seconds'] += perf_counter() - st
+            record['cpu_seconds'] += process_time() - cpu_st
+            peak = _peak_rss_mb()
+            if peak is not None:
+                record['peak_rss_mb'] = max(record['peak_rss_mb'] or 0.0, peak)
+
+    def summary(self):
+        print("%-10s %10s %10s %14s %12s" % ('stage', 'wall (s)', 'cpu (s)', 'peak rss (MB)', 'rows'))
+        for name, r in self.stages.items():
+            print("%-10s %10.2f %10.2f %14s %12s" % (
+                name, r['wall_seconds'], r['cpu_seconds'],
+                '-' if r['peak_rss_mb'] is None else '%.1f' % r['peak_rss_mb'], '-' if r['rows'] is None else r['rows']))
+        print("%-10s %10.2f %10.2f" % ('total', perf_counter() - self.st, process_time() - self.cpu_st))
+
+    def save(self, path):
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        report = OrderedDict([
+            ('name', self.name), ('started', self.started), ('argv', sys.argv),
+            ('wall_seconds', perf_counter() - self.st), ('cpu_seconds', process_time() - self.cpu_st),
+            ('peak_rss_per_stage', self.per_stage_peak), ('stages', self.stages)])
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
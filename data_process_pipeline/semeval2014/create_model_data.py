@@ -1,7 +1,10 @@
 # this file contains logic to create data that is required for training
 
+import numpy as np
 import pandas as pd
 
+from data_process_pipeline.semeval2014.preprocess import split_sentences
+
 
 # convert a sentence into sentence of word ids
 def convert_sent_ids_with_pad(text, w2i, l, max_len):
@@ -20,6 +23,11 @@ def convert_sent_ids_with_pad(text, w2i, l, max_len):
     return id
 
 
+def split_tokens(text, max_len):
+    """ Tokens of a sentence in chunks of at most max_len, for serving sentences longer than the model input """
+    return [text[i:i + max_len] for i in range(0, len(text), max_len)] or [text]
+
+
 def get_w2i():
     w2i = {}
     i2w = {}
@@ -45,68 +53,76 @@ def get_a2i():
     return a2i, i2a
 
 
-def create_train_data(a, i2w, i2a, w2i, a2i, save_path):
+def sentences_path(path):
+    """ rest_train_data.pkl -> rest_train_data_sentences.npy """
+    return path[:-len('.pkl')] + '_sentences.npy'
+
+
+def save_model_data(a, sentences, save_path, name):
+    a.to_csv(save_path + '/' + name + '.tsv', sep="\t")
+    a.to_pickle(save_path + '/' + name + '.pkl')
+    np.save(sentences_path(save_path + '/' + name + '.pkl'), sentences)
+
+
+def encode_sentences(a, w2i, max_len):
+    """
+    Per-aspect rows pointing (column 'sentence') into an int32 matrix holding the padded word ids of every
+    distinct sentence once; the rows keep seq_len and max_len but not the text. Training sentences are not cut:
+    one longer than max_len is an error.
+    """
+    rows, sentences = split_sentences(a)
+    too_long = [len(t) for t in sentences if len(t) > max_len]
+    if too_long:
+        raise ValueError("%d sentences are longer than max_len %d (up to %d words)" % (len(too_long), max_len,
+                                                                                       max(too_long)))
+    ids = np.empty((len(sentences), max_len), dtype=np.int32)
+    for i, t in enumerate(sentences):
+        ids[i] = convert_sent_ids_with_pad(t, w2i, len(t), max_len)
+    lens = np.asarray([len(t) for t in sentences], dtype=np.int64)
+    rows['seq_len'] = lens[rows['sentence'].values]
+    rows['max_len'] = max_len
+    return rows, ids
+
+
+def aspect_ids(a, a2i):
+    return [a2i['miscellaneous' if asp == 'anecdotes/miscellaneous' else asp] for asp in a['aspect']]
+
+
+polarity_vectors = {'negative': [1, 0, 0], 'neutral': [0, 1, 0], 'positive': [0, 0, 1]}
+
+
+def create_train_data(a, i2w, i2a, w2i, a2i, save_path=None):
+    """ Encoded rows and sentence ids, see encode_sentences """
     a = a[a.polarity != 'conflict']
     # shuffle dataset
     a = a.sample(frac=1).reset_index(drop=True)
-    lens = []
-    for t in a['text']:
-        lens.append(len(t))
     max_len = 80
-    a.loc[:, 'seq_len'] = pd.Series(lens, index=a.index)
-    a.loc[:, 'max_len'] = pd.Series([max_len] * len(lens), index=a.index)
-    # print a
-    print(a['text'][8])
-    print(a['polarity'][8])
-    print(a['aspect'][8])
-    print(a['seq_len'][8])
-    print(a['max_len'][8])
-    for i, data in a.iterrows():
-
-        a.set_value(i, 'text', convert_sent_ids_with_pad(data['text'], w2i, data['seq_len'], data['max_len']))
-        asp = data['aspect']
-        if asp == 'anecdotes/miscellaneous':
-            asp = 'miscellaneous'
-        a.set_value(i, 'aspect', a2i[asp])
-        p = data['polarity']
-        if p == 'negative':
-            a.set_value(i, 'polarity', [1, 0, 0])
-        elif p == 'positive':
-            a.set_value(i, 'polarity', [0, 0, 1])
-        elif p == 'neutral':
-            a.set_value(i, 'polarity', [0, 1, 0])
+    a, sentences = encode_sentences(a, w2i, max_len)
+    a['aspect'] = aspect_ids(a, a2i)
+    a['polarity'] = [polarity_vectors[p] for p in a['polarity']]
 
     print(a)
-    print("\n\n", a['text'][8])
+    print("%d rows, %d distinct sentences" % (a.shape[0], sentences.shape[0]))
+    print("\n\n", sentences[a['sentence'][8]])
     print(a['polarity'][8])
     print(a['aspect'][8])
-    a.to_csv(save_path + '/rest_train_data.tsv', "\t")
-    a.to_pickle(save_path + '/rest_train_data.pkl')
+    if save_path is not None:
+        save_model_data(a, sentences, save_path, 'rest_train_data')
+    return a, sentences
 
 
-def create_test_data(a, i2w, i2a, w2i, a2i, save_path):
+def create_test_data(a, i2w, i2a, w2i, a2i, save_path=None):
+    """ Encoded rows and sentence ids, see encode_sentences """
     # shuffle dataset
     a = a.sample(frac=1).reset_index(drop=True)
-    lens = []
-    for t in a['text']:
-        lens.append(len(t))
     max_len = 80
-    a.loc[:, 'seq_len'] = pd.Series(lens, index=a.index)
-    a.loc[:, 'max_len'] = pd.Series([max_len] * len(lens), index=a.index)
-    # print a
-    print(a['text'][8])
-    print(a['aspect'][8])
-    print(a['seq_len'][8])
-    print(a['max_len'][8])
-    for i, data in a.iterrows():
-        a.set_value(i, 'text', convert_sent_ids_with_pad(data['text'], w2i, data['seq_len'], data['max_len']))
-        asp = data['aspect']
-        if asp == 'anecdotes/miscellaneous':
-            asp = 'miscellaneous'
-        a.set_value(i, 'aspect', a2i[asp])
+    a, sentences = encode_sentences(a, w2i, max_len)
+    a['aspect'] = aspect_ids(a, a2i)
 
     print(a)
-    print("\n\n", a['text'][8])
+    print("%d rows, %d distinct sentences" % (a.shape[0], sentences.shape[0]))
+    print("\n\n", sentences[a['sentence'][8]])
     print(a['aspect'][8])
-    a.to_csv(save_path + '/rest_test_data.tsv', "\t")
-    a.to_pickle(save_path + '/rest_test_data.pkl')
+    if save_path is not None:
+        save_model_data(a, sentences, save_path, 'rest_test_data')
+    return a, sentences
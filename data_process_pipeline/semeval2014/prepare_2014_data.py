@@ -4,6 +4,8 @@ from pprint import pprint
 import pandas as pd
 from tqdm import tqdm
 
+from data_process_pipeline.semeval_xml import read_2014
+
 
 def get_laptop_data(path):
     laptop_df = pd.DataFrame(columns=('sentence_id', 'text', 'aspect', 'polarity', 'value_from', 'value_to'))
@@ -37,62 +39,23 @@ def get_laptop_data(path):
     return laptop_df
 
 
-def get_restaurants_train_data(path):
-    restaurants_df = pd.DataFrame(
-        columns=('sentence_id', 'text', 'aspect', 'polarity'))
-    e = xml.etree.ElementTree.parse(path).getroot()
-
-    pprint(e)
-    sentences = e.findall('sentence')
-    i = 0
-    for sentence in tqdm(sentences):
-        # print '\n'
-        id = sentence.get('id')
-        text = sentence.find('text').text
-        # print text
-        aspects = sentence.findall('aspectCategories')
-        if len(aspects) == 0:
-            a, p = None, None
-            restaurants_df.loc[i] = [id, text, a, p]
-            i += 1
+def get_restaurants_data(path):
+    """ One row per aspect category of each sentence (one row of None for a sentence without categories) """
+    rows = []
+    for id, text, _, categories in tqdm(read_2014(path)):
+        if categories is None:
+            rows.append([id, text, None, None])
         else:
-            for aspect in aspects[0].findall('aspectCategory'):
-                a = aspect.get('category')
-                p = aspect.get('polarity')
-                restaurants_df.loc[i] = [id, text, a, p]
-                i += 1
-
-    # pprint(restaurants_df)
-    return restaurants_df
+            rows.extend([id, text, a, p] for a, p in categories)
+    return pd.DataFrame(rows, columns=('sentence_id', 'text', 'aspect', 'polarity'))
 
 
-def get_restaurants_test_data(path):
-    restaurants_df = pd.DataFrame(
-        columns=('sentence_id', 'text', 'aspect', 'polarity'))
-    e = xml.etree.ElementTree.parse(path).getroot()
-    # e = xml.etree.ElementTree.parse('raw_data/SemEval14-ABSA-TrainData_v2/restaurants-trial.xml').getroot()
+def get_restaurants_train_data(path):
+    return get_restaurants_data(path)
 
-    sentences = e.findall('sentence')
-    i = 0
-    for sentence in tqdm(sentences):
-        # print '\n'
-        id = sentence.get('id')
-        text = sentence.find('text').text
-        # print text
-        aspects = sentence.findall('aspectCategories')
-        if len(aspects) == 0:
-            a, p = None, None
-            restaurants_df.loc[i] = [id, text, a, p]
-            i += 1
-        else:
-            for aspect in aspects[0].findall('aspectCategory'):
-                a = aspect.get('category')
-                p = aspect.get('polarity')
-                restaurants_df.loc[i] = [id, text, a, p]
-                i += 1
 
-    # pprint(restaurants_df)
-    return restaurants_df
+def get_restaurants_test_data(path):
+    return get_restaurants_data(path)
 
 
 if __name__ == '__main__':
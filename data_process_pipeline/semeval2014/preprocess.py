@@ -134,4 +134,24 @@ def clean(s):
     s = re.sub('\s{2,}', ' ', s)
     tokenizer = nltk.tokenize.TreebankWordTokenizer()
     s = tokenizer.tokenize(s)
-    return s
\ No newline at end of file
+    return s
+
+
+def clean_unique(a):
+    """ clean() once per distinct sentence; rows of the same sentence (one per aspect) share its token list """
+    tokens = {}
+    for text in a['text']:
+        if text not in tokens:
+            tokens[text] = clean(text)
+    return a['text'].map(tokens)
+
+
+def split_sentences(a):
+    """
+    Per-aspect rows without the text, plus the distinct sentences (token lists) in order of first appearance;
+    the rows' 'sentence' column indexes into them
+    """
+    codes, sentences = pd.factorize(a['text'].map(tuple))
+    rows = a.drop(columns='text')
+    rows['sentence'] = codes
+    return rows, [list(s) for s in sentences]
@@ -1,27 +1,52 @@
+import argparse
+import os
 import pickle
 
-from data_process_pipeline.semeval2014.create_model_data import create_train_data, create_test_data
-from data_process_pipeline.semeval2014.load_pp_data import get_vocab, get_vectors
+from data_process_pipeline.prune import prune_vectors, print_stats
+from data_process_pipeline.report import StageReport
+from data_process_pipeline.semeval2014.create_model_data import create_train_data, create_test_data, save_model_data
+from data_process_pipeline.semeval2014.load_pp_data import get_vocab, get_vectors, google_news_path
 from data_process_pipeline.semeval2014.prepare_2014_data import get_restaurants_train_data, get_restaurants_test_data
-from data_process_pipeline.semeval2014.preprocess import clean
+from data_process_pipeline.semeval2014.preprocess import clean_unique
 
 raw_2014_path = '../../data/raw_data/SemEval_14'
 p_2014_path = '../../data/semeval14'
 
 if __name__ == '__main__':
-    # prepare data
-    restaurants_train_data = get_restaurants_train_data(
-        raw_2014_path + '/SemEval14-ABSA-TrainData_v2/Restaurants_Train_v2.xml')
-    print(restaurants_train_data.groupby('polarity').count())
-    restaurants_train_data.to_csv(p_2014_path + '/rest_train_data_raw.tsv', '\t')
-
-    restaurants_test_data = get_restaurants_test_data(
-        raw_2014_path + '/ABSA_TestData_PhaseB/Restaurants_Test_Data_phaseB.xml')
-
-    restaurants_test_data.to_csv(p_2014_path + '/rest_test_data_raw.tsv', "\t")
+    # the defaults process the real data; point them at data_process_pipeline/synthetic.py output to load test
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--train', default=raw_2014_path + '/SemEval14-ABSA-TrainData_v2/Restaurants_Train_v2.xml')
+    parser.add_argument('--test', default=raw_2014_path + '/ABSA_TestData_PhaseB/Restaurants_Test_Data_phaseB.xml')
+    parser.add_argument('--w2v', default=google_news_path)
+    parser.add_argument('--out-dir', default=p_2014_path)
+    parser.add_argument('--quiet', action='store_true', help='drop the debug prints of the stages')
+    parser.add_argument('--report', default=None, help='json run report (default: <out-dir>/run_report.json)')
+    parser.add_argument('--min-count', type=int, default=1, help='drop the words seen fewer times (they are __UNK__)')
+    parser.add_argument('--max-vocab', type=int, default=None, help='keep at most this many most frequent words')
+    parser.add_argument('--coverage', type=float, default=None,
+                        help='keep the most frequent words up to this fraction of the tokens, e.g. 0.995')
+    args = parser.parse_args()
+    p_2014_path = args.out_dir
+    if not os.path.exists(p_2014_path):
+        os.makedirs(p_2014_path)
+    report = StageReport('semeval2014', quiet=args.quiet)
 
-    restaurants_train_data['text'] = restaurants_train_data['text'].apply(clean)
-    restaurants_test_data['text'] = restaurants_test_data['text'].apply(clean)
+    # prepare data
+    with report.stage('ingest') as stage:
+        restaurants_train_data = get_restaurants_train_data(args.train)
+        print(restaurants_train_data.groupby('polarity').count())
+        restaurants_test_data = get_restaurants_test_data(args.test)
+        stage['rows'] = restaurants_train_data.shape[0] + restaurants_test_data.shape[0]
+
+    with report.stage('write') as stage:
+        restaurants_train_data.to_csv(p_2014_path + '/rest_train_data_raw.tsv', '\t')
+        restaurants_test_data.to_csv(p_2014_path + '/rest_test_data_raw.tsv', "\t")
+
+    with report.stage('clean') as stage:
+        # one clean() per distinct sentence, not per aspect row
+        restaurants_train_data['text'] = clean_unique(restaurants_train_data)
+        restaurants_test_data['text'] = clean_unique(restaurants_test_data)
+        stage['rows'] = restaurants_train_data.shape[0] + restaurants_test_data.shape[0]
 
     # save pre-processed data as pickle file
     #restaurants_train_data.to_pickle(p_2014_path + '/restaurants_train_data_processed.pkl')
@@ -35,55 +60,77 @@ if __name__ == '__main__':
     # print(restaurants_test_data)
 
     # load vocab and get vectors
-    text_vocab, aspect_vocab = get_vocab(restaurants_train_data, restaurants_test_data)
-    print(text_vocab)
-    print(len(text_vocab))
-    for i, word in enumerate(sorted(text_vocab)):
-        print(i, word)
+    with report.stage('vocab') as stage:
+        text_vocab, aspect_vocab = get_vocab(restaurants_train_data, restaurants_test_data)
+        print(text_vocab)
+        print(len(text_vocab))
+        for i, word in enumerate(sorted(text_vocab)):
+            print(i, word)
+        stage['rows'] = len(text_vocab)
 
 
     def get_vec(text_vocab, aspect_vocab):
 
-        # contains all the words
-        with open(p_2014_path + '/all_text_vocab.vocab', 'w') as f:
-            for i, word in enumerate(sorted(text_vocab)):
-                f.write('%d\t%s\n' % (i, word[0]))
-
-        print(aspect_vocab)
-        print(len(aspect_vocab))
-        with open(p_2014_path + '/all_aspect_vocab.vocab', 'w') as f:
-            for i, word in enumerate(sorted(aspect_vocab)):
-                f.write('%d\t%s\n' % (i, word[0]))
-
-        text_vector, aspect_vector = get_vectors(text_vocab, aspect_vocab)
+        with report.stage('write'):
+            # contains all the words
+            with open(p_2014_path + '/all_text_vocab.vocab', 'w') as f:
+                for i, word in enumerate(sorted(text_vocab)):
+                    f.write('%d\t%s\n' % (i, word[0]))
+
+            print(aspect_vocab)
+            print(len(aspect_vocab))
+            with open(p_2014_path + '/all_aspect_vocab.vocab', 'w') as f:
+                for i, word in enumerate(sorted(aspect_vocab)):
+                    f.write('%d\t%s\n' % (i, word[0]))
+
+        with report.stage('vectors') as stage:
+            text_vector, aspect_vector = get_vectors(text_vocab, aspect_vocab, args.w2v)
+            stage['rows'] = len(text_vector) + len(aspect_vector)
+        if args.min_count > 1 or args.max_vocab or args.coverage:
+            with report.stage('prune') as stage:
+                text_vector, stats = prune_vectors(text_vector, text_vocab, args.min_count, args.max_vocab,
+                                                   args.coverage)
+                stage.update(stats)
+                stage['rows'] = len(text_vector)
+            print_stats(stats)
         text_dict_i2w = dict(enumerate(sorted(list(text_vector.keys()))))
         aspect_dict_i2w = dict(enumerate(sorted(list(aspect_vector.keys()))))
         text_dict_w2i = {v: k for k, v in text_dict_i2w.items()}
         aspect_dict_w2i = {v: k for k, v in aspect_dict_i2w.items()}
 
-        # contains only the words that have embeddings
-        with open(p_2014_path + '/text_vocab.vocab', 'w') as f:
-            for i, word in text_dict_i2w.items():
-                f.write('%d\t%s\n' % (i, word))
-
-        with open(p_2014_path + '/aspect_vocab.vocab', 'w') as f:
-            for i, word in text_dict_i2w.items():
-                f.write('%d\t%s\n' % (i, word))
-
-        with open(p_2014_path + '/text_vocab.pkl', 'wb') as f:
-            pickle.dump(text_dict_i2w, f)
-        with open(p_2014_path + '/aspect_vocab.pkl', 'wb') as f:
-            pickle.dump(text_dict_i2w, f)
-
-        print(len(text_vector), len(aspect_vector))
-        with open(p_2014_path + '/text_vector.pkl', 'wb') as f:
-            pickle.dump(text_vector, f)
-        with open(p_2014_path + '/aspect_vector.pkl', 'wb') as f:
-            pickle.dump(aspect_vector, f)
+        with report.stage('write'):
+            # contains only the words that have embeddings
+            with open(p_2014_path + '/text_vocab.vocab', 'w') as f:
+                for i, word in text_dict_i2w.items():
+                    f.write('%d\t%s\n' % (i, word))
+
+            with open(p_2014_path + '/aspect_vocab.vocab', 'w') as f:
+                for i, word in text_dict_i2w.items():
+                    f.write('%d\t%s\n' % (i, word))
+
+            with open(p_2014_path + '/text_vocab.pkl', 'wb') as f:
+                pickle.dump(text_dict_i2w, f)
+            with open(p_2014_path + '/aspect_vocab.pkl', 'wb') as f:
+                pickle.dump(text_dict_i2w, f)
+
+            print(len(text_vector), len(aspect_vector))
+            with open(p_2014_path + '/text_vector.pkl', 'wb') as f:
+                pickle.dump(text_vector, f)
+            with open(p_2014_path + '/aspect_vector.pkl', 'wb') as f:
+                pickle.dump(aspect_vector, f)
         return text_dict_i2w, aspect_dict_i2w, text_dict_w2i, aspect_dict_w2i
 
 
     i2w, i2a, w2i, a2i = get_vec(text_vocab, aspect_vocab)
     # prepare processed data as input data to model
-    create_train_data(restaurants_train_data, i2w, i2a, w2i, a2i, save_path=p_2014_path)
-    create_test_data(restaurants_test_data, i2w, i2a, w2i, a2i, save_path=p_2014_path)
+    with report.stage('encode') as stage:
+        train_data, train_sentences = create_train_data(restaurants_train_data, i2w, i2a, w2i, a2i)
+        test_data, test_sentences = create_test_data(restaurants_test_data, i2w, i2a, w2i, a2i)
+        stage['rows'] = train_data.shape[0] + test_data.shape[0]
+        stage['sentences'] = train_sentences.shape[0] + test_sentences.shape[0]
+    with report.stage('write'):
+        save_model_data(train_data, train_sentences, p_2014_path, 'rest_train_data')
+        save_model_data(test_data, test_sentences, p_2014_path, 'rest_test_data')
+
+    report.summary()
+    report.save(args.report or p_2014_path + '/run_report.json')
@@ -9,6 +9,8 @@ import pandas as pd
 import gensim
 import numpy as np
 
+google_news_path = '/home/gangeshwark/test_Google/GoogleNews-vectors-negative300.bin'
+
 
 def get_vocab(a, b):
     text_vocab = {}
@@ -66,15 +68,14 @@ def get_vocab(a, b):
     return list(text_vocab), list(entity_vocab), list(attribute_vocab)
 
 
-def get_vectors(text_vocab, entity_vocab, attribute_vocab):
+def get_vectors(text_vocab, entity_vocab, attribute_vocab, w2v_path=google_news_path):
     text_skipped = 0
     entity_skipped = 0
     attribute_skipped = 0
     st = time()
     # Load Google's pre-trained Word2Vec model.
     print('Loading Google News Word2Vec model')
-    model = gensim.models.KeyedVectors.load_word2vec_format(
-        '/home/gangeshwark/test_Google/GoogleNews-vectors-negative300.bin', binary=True)
+    model = gensim.models.KeyedVectors.load_word2vec_format(w2v_path, binary=True)
     print(time() - st, " seconds to load the Google News vectors.")
 
     unk = np.random.uniform(-np.sqrt(3.0), np.sqrt(3.0), 300)
@@ -1,67 +1,43 @@
-import xml.etree.ElementTree
-
 import pandas as pd
 from tqdm import tqdm
 
+from data_process_pipeline.semeval_xml import read_2016
+
 
 def get_data(path):
     print("Preparing data..")
-    e = xml.etree.ElementTree.parse(path).getroot()
-
-    restaurants_df = pd.DataFrame(
-        columns=('review_id', 'sentence_id', 'text', 'target', 'category', 'entity', 'attribute', 'polarity'))
-
-    # pprint(e)
-    Reviews = e.findall('Review')
-    # print Reviews
-    i = 0
-    for review in tqdm(Reviews):
-        # print '\n'
-        r_id = review.get('rid')
-        sentences = review.findall('sentences')
-        # print sentences
-        for sentence in sentences[0]:
-            # print sentence
-            id = sentence.get('id')
-            text = sentence.find('text').text
-            # print text
-            Opinions = sentence.findall('Opinions')
-            if len(Opinions) == 0:
-                t, cat, ent, attr, p = None, None, None, None, None
-                restaurants_df.loc[i] = [r_id, id, text.lower(), t, cat, ent, attr, p]
-                i += 1
-            else:
-                for Opinion in Opinions[0].findall('Opinion'):
-                    t = Opinion.get('target')
-
-                    cat = Opinion.get('category')
-                    ent, attr = cat.split('#')
-                    # converting multi-word vocab to single word
-                    if ent == 'multimedia_devices'.upper():
-                        ent = 'multimedia'
-                    if ent == 'optical_drives'.upper():
-                        ent = 'optical'
-                    if ent == 'fans_cooling'.upper():
-                        ent = 'fans'
-                    if ent == 'hard_disc'.upper():
-                        ent = 'disc'
-                    if ent == 'power_supply'.upper():
-                        ent = 'power'
-
-                    if attr == 'design_features'.upper():
-                        attr = 'design'
-                    if attr == 'operation_performance'.upper():
-                        attr = 'performance'
-                    if attr == 'style_options'.upper():
-                        attr = 'style'
-
-                    p = Opinion.get('polarity')
-                    restaurants_df.loc[i] = [r_id, id, text.lower(), t, cat.lower(), ent.lower(), attr.lower(),
-                                             p]
-                    i += 1
+    rows = []
+    for r_id, id, text, opinions in tqdm(read_2016(path)):
+        if opinions is None:
+            t, cat, ent, attr, p = None, None, None, None, None
+            rows.append([r_id, id, text.lower(), t, cat, ent, attr, p])
+        else:
+            for t, cat, p, _, _ in opinions:
+                ent, attr = cat.split('#')
+                # converting multi-word vocab to single word
+                if ent == 'multimedia_devices'.upper():
+                    ent = 'multimedia'
+                if ent == 'optical_drives'.upper():
+                    ent = 'optical'
+                if ent == 'fans_cooling'.upper():
+                    ent = 'fans'
+                if ent == 'hard_disc'.upper():
+                    ent = 'disc'
+                if ent == 'power_supply'.upper():
+                    ent = 'power'
+
+                if attr == 'design_features'.upper():
+                    attr = 'design'
+                if attr == 'operation_performance'.upper():
+                    attr = 'performance'
+                if attr == 'style_options'.upper():
+                    attr = 'style'
+
+                rows.append([r_id, id, text.lower(), t, cat.lower(), ent.lower(), attr.lower(), p])
 
     # pprint(restaurants_df)
-    return restaurants_df
+    return pd.DataFrame(
+        rows, columns=('review_id', 'sentence_id', 'text', 'target', 'category', 'entity', 'attribute', 'polarity'))
 
 
 if __name__ == '__main__':
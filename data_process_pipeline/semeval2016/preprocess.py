@@ -137,6 +137,26 @@ def clean(s):
     return s
 
 
+def clean_unique(a):
+    """ clean() once per distinct sentence; rows of the same sentence (one per aspect) share its token list """
+    tokens = {}
+    for text in a['text']:
+        if text not in tokens:
+            tokens[text] = clean(text)
+    return a['text'].map(tokens)
+
+
+def split_sentences(a):
+    """
+    Per-aspect rows without the text, plus the distinct sentences (token lists) in order of first appearance;
+    the rows' 'sentence' column indexes into them
+    """
+    codes, sentences = pd.factorize(a['text'].map(tuple))
+    rows = a.drop(columns='text')
+    rows['sentence'] = codes
+    return rows, [list(s) for s in sentences]
+
+
 def preprocess_day(a, b):
     a = pd.read_csv('data/restaurants_train_data.tsv', delimiter='\t')
     b = pd.read_csv('data/restaurants_test_data.tsv', delimiter='\t')
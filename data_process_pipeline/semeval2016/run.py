@@ -1,41 +1,84 @@
+import argparse
+import os
 import pickle
 
-from data_process_pipeline.semeval2016.load_pp_data import get_vocab, get_vectors
+from data_process_pipeline.prune import prune_vectors, print_stats
+from data_process_pipeline.report import StageReport
+from data_process_pipeline.semeval2016.load_pp_data import get_vocab, get_vectors, google_news_path
 from data_process_pipeline.semeval2016.prepare_2016_data import get_data
-from data_process_pipeline.semeval2016.preprocess import clean
+from data_process_pipeline.semeval2016.preprocess import clean, clean_unique, split_sentences
 
 
-def prepare_data(folder):
+def prepare_data(folder, train_path=None, test_path=None, w2v_path=google_news_path, quiet=False, report_path=None,
+                 min_count=1, max_vocab=None, coverage=None):
     raw_2016_path = '../../data/raw_data/SemEval_16'
     p_2016_path = '../../data/semeval16/' + folder
     # get_laptop_data()
-
-    if folder == 'restaurants':
+    report = StageReport('semeval2016/' + os.path.basename(folder), quiet=quiet)
+
+    if train_path is not None:
+        # any other data in the same schema, e.g. from data_process_pipeline/synthetic.py
+        p_2016_path = folder
+        if not os.path.exists(p_2016_path):
+            os.makedirs(p_2016_path)
+    elif folder == 'restaurants':
         print('Yes, rest')
-        train_data = get_data(raw_2016_path + '/ABSA16_Restaurants_Train_SB1_v2.xml')
-        test_data = get_data(raw_2016_path + '/EN_REST_SB1_TEST.gold.xml')
+        train_path = raw_2016_path + '/ABSA16_Restaurants_Train_SB1_v2.xml'
+        test_path = raw_2016_path + '/EN_REST_SB1_TEST.gold.xml'
     elif folder == 'laptop':
         print('Yes, lap')
-        train_data = get_data(raw_2016_path + '/ABSA16_Laptops_Train_SB1_v2.xml')
-        test_data = get_data(raw_2016_path + '/EN_LAPT_SB1_TEST_.gold.xml')
+        train_path = raw_2016_path + '/ABSA16_Laptops_Train_SB1_v2.xml'
+        test_path = raw_2016_path + '/EN_LAPT_SB1_TEST_.gold.xml'
     else:
         return
 
-    print(train_data.shape[0], " data points")
-    train_data.to_csv(p_2016_path + '/train_data.tsv', '\t', encoding='utf-8')
+    with report.stage('ingest') as stage:
+        train_data = get_data(train_path)
+        test_data = get_data(test_path)
+        stage['rows'] = train_data.shape[0] + test_data.shape[0]
+
+    with report.stage('write'):
+        print(train_data.shape[0], " data points")
+        train_data.to_csv(p_2016_path + '/train_data.tsv', '\t', encoding='utf-8')
+
+        print(test_data.shape[0], " data points")
+        test_data.to_csv(p_2016_path + '/test_data.tsv', '\t', encoding='utf-8')
+
+    with report.stage('clean') as stage:
+        # one clean() per distinct sentence, not per opinion row
+        train_data['text'] = clean_unique(train_data)
+        test_data['text'] = clean_unique(test_data)
+        stage['rows'] = train_data.shape[0] + test_data.shape[0]
+
+    # save pre-processed data as pickle file: opinion rows index (column 'sentence') into the sentences
+    with report.stage('write'):
+        for name, data in [('train', train_data), ('test', test_data)]:
+            rows, sentences = split_sentences(data)
+            rows.to_pickle(p_2016_path + '/%s_data_processed.pkl' % name)
+            with open(p_2016_path + '/%s_data_processed_sentences.pkl' % name, 'wb') as f:
+                pickle.dump(sentences, f)
+    #print(test_data)
 
-    print(test_data.shape[0], " data points")
-    test_data.to_csv(p_2016_path + '/test_data.tsv', '\t', encoding='utf-8')
+    def get_vec(text_vocab, entity_vocab, attribute_vocab):
+        with report.stage('write'):
+            write_all_vocab(text_vocab, entity_vocab, attribute_vocab)
 
-    train_data['text'] = train_data['text'].apply(clean)
-    test_data['text'] = test_data['text'].apply(clean)
+        with report.stage('vectors') as stage:
+            text_vector, entity_vector, attribute_vector = get_vectors(text_vocab, entity_vocab, attribute_vocab,
+                                                                      w2v_path)
+            stage['rows'] = len(text_vector) + len(entity_vector) + len(attribute_vector)
 
-    # save pre-processed data as pickle file
-    train_data.to_pickle(p_2016_path + '/train_data_processed.pkl')
-    test_data.to_pickle(p_2016_path + '/test_data_processed.pkl')
-    #print(test_data)
+        if min_count > 1 or max_vocab or coverage:
+            with report.stage('prune') as stage:
+                text_vector, stats = prune_vectors(text_vector, text_vocab, min_count, max_vocab, coverage)
+                stage.update(stats)
+                stage['rows'] = len(text_vector)
+            print_stats(stats)
 
-    def get_vec(text_vocab, entity_vocab, attribute_vocab):
+        with report.stage('write'):
+            write_vectors(text_vector, entity_vector, attribute_vector)
+
+    def write_all_vocab(text_vocab, entity_vocab, attribute_vocab):
         print(text_vocab)
         print(len(text_vocab))
         # contains all the words
@@ -55,8 +98,7 @@ def prepare_data(folder):
             for i, word in enumerate(sorted(attribute_vocab)):
                 f.write('%d\t%s\n' % (i, word[0]))
 
-        text_vector, entity_vector, attribute_vector = get_vectors(text_vocab, entity_vocab, attribute_vocab)
-
+    def write_vectors(text_vector, entity_vector, attribute_vector):
         # contains only the words that have embeddings
         with open(p_2016_path + '/text_vocab.vocab', 'w') as f:
             for i, word in enumerate(sorted(list(text_vector.keys()))):
@@ -92,13 +134,34 @@ def prepare_data(folder):
         with open(p_2016_path + '/attribute_vector.pkl', 'wb') as f:
             pickle.dump(attribute_vector, f)
 
-    text_vocab, entity_vocab, attribute_vocab = get_vocab(train_data, test_data)
+    with report.stage('vocab') as stage:
+        text_vocab, entity_vocab, attribute_vocab = get_vocab(train_data, test_data)
+        stage['rows'] = len(text_vocab)
     get_vec(text_vocab, entity_vocab, attribute_vocab)
 
+    report.summary()
+    report.save(report_path or p_2016_path + '/run_report.json')
+
 
 if __name__ == '__main__':
-    prepare_data('restaurants')
-    prepare_data('laptop')
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--train', default=None, help='process this file and --test instead of the SemEval data')
+    parser.add_argument('--test', default=None)
+    parser.add_argument('--w2v', default=google_news_path)
+    parser.add_argument('--out-dir', default=None)
+    parser.add_argument('--quiet', action='store_true', help='drop the debug prints of the stages')
+    parser.add_argument('--report', default=None, help='json run report (default: <out-dir>/run_report.json)')
+    parser.add_argument('--min-count', type=int, default=1, help='drop the words seen fewer times (they are __UNK__)')
+    parser.add_argument('--max-vocab', type=int, default=None, help='keep at most this many most frequent words')
+    parser.add_argument('--coverage', type=float, default=None,
+                        help='keep the most frequent words up to this fraction of the tokens, e.g. 0.995')
+    args = parser.parse_args()
+    prune = {'min_count': args.min_count, 'max_vocab': args.max_vocab, 'coverage': args.coverage}
+    if args.train:
+        prepare_data(args.out_dir, args.train, args.test, args.w2v, args.quiet, args.report, **prune)
+    else:
+        prepare_data('restaurants', w2v_path=args.w2v, quiet=args.quiet, **prune)
+        prepare_data('laptop', w2v_path=args.w2v, quiet=args.quiet, **prune)
 
     """
     # get_laptop_data()
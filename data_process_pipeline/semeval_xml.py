@@ -0,0 +1,135 @@
+"""
+Streaming reader and writer of the SemEval 2014 (sentences/sentence) and 2016 (Reviews/Review/sentences/sentence) XML.
+
+The readers parse incrementally and drop every sentence once it has been yielded, so memory does not grow with the
+file. The writers format one sentence at a time into a large write buffer, e.g., to export the predictions of a model
+for millions of sentences:
+
+    with Writer2016(path) as w:
+        for review_id, sentence_id, text, opinions in predictions:
+            w.write(review_id, sentence_id, text, opinions)
+"""
+import xml.etree.ElementTree
+from xml.sax.saxutils import escape, quoteattr
+
+buffer_size = 1 << 20
+
+
+def _first(element, tag, children, fields):
+    """ Attribute tuples of the children of the first <tag> of element, None if there is no <tag> """
+    found = element.find(tag)
+    if found is None:
+        return None
+    return [tuple(child.get(f) for f in fields) for child in found.findall(children)]
+
+
+def read_2014(path):
+    """
+    Yields (sentence_id, text, aspect_terms, aspect_categories) per sentence, with aspect_terms a list of
+    (term, polarity, from, to) and aspect_categories a list of (category, polarity); None when the sentence has
+    no <aspectTerms> / <aspectCategories>. Attributes missing from the file (e.g. polarity in test files) are None.
+    """
+    context = xml.etree.ElementTree.iterparse(path, events=('start', 'end'))
+    _, root = next(context)
+    for event, e in context:
+        if event == 'end' and e.tag == 'sentence':
+            yield (e.get('id'), e.find('text').text,
+                   _first(e, 'aspectTerms', 'aspectTerm', ('term', 'polarity', 'from', 'to')),
+                   _first(e, 'aspectCategories', 'aspectCategory', ('category', 'polarity')))
+            root.clear()
+
+
+def read_2016(path):
+    """
+    Yields (review_id, sentence_id, text, opinions) per sentence, with opinions a list of
+    (target, category, polarity, from, to), None when the sentence has no <Opinions>.
+    """
+    context = xml.etree.ElementTree.iterparse(path, events=('start', 'end'))
+    _, root = next(context)
+    review_id = None
+    for event, e in context:
+        if event == 'start' and e.tag == 'Review':
+            review_id = e.get('rid')
+        elif event == 'end' and e.tag == 'sentence':
+            yield (review_id, e.get('id'), e.find('text').text,
+                   _first(e, 'Opinions', 'Opinion', ('target', 'category', 'polarity', 'from', 'to')))
+            e.clear()
+        elif event == 'end' and e.tag == 'Review':
+            root.clear()
+
+
+def _attributes(names, values):
+    return ' '.join('%s=%s' % (n, quoteattr(str(v))) for n, v in zip(names, values) if v is not None)
+
+
+class _Writer():
+    header = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    footer = ''
+
+    def __init__(self, path):
+        self.f = open(path, 'w', encoding='utf-8', buffering=buffer_size)
+        self.f.write(self.header)
+
+    def close(self):
+        self.f.write(self.footer)
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Writer2014(_Writer):
+    """ Writes sentences in the format read_2014() reads; None annotations and attributes are left out """
+    header = _Writer.header + '<sentences>\n'
+    footer = '</sentences>\n'
+
+    def write(self, sentence_id, text, aspect_terms=None, aspect_categories=None):
+        lines = ['    <sentence id=%s>\n        <text>%s</text>\n' % (quoteattr(str(sentence_id)), escape(text))]
+        if aspect_terms is not None:
+            lines.append('        <aspectTerms>\n')
+            lines.extend('            <aspectTerm %s/>\n' % _attributes(('term', 'polarity', 'from', 'to'), a)
+                         for a in aspect_terms)
+            lines.append('        </aspectTerms>\n')
+        if aspect_categories is not None:
+            lines.append('        <aspectCategories>\n')
+            lines.extend('            <aspectCategory %s/>\n' % _attributes(('category', 'polarity'), c)
+                         for c in aspect_categories)
+            lines.append('        </aspectCategories>\n')
+        lines.append('    </sentence>\n')
+        self.f.write(''.join(lines))
+
+
+class Writer2016(_Writer):
+    """ Writes sentences in the format read_2016() reads; consecutive sentences of a review go in one <Review> """
+    header = _Writer.header + '<Reviews>\n'
+    review_footer = '        </sentences>\n    </Review>\n'
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.reviews = 0
+        self.review_id = None
+
+    def write(self, review_id, sentence_id, text, opinions=None):
+        lines = []
+        if not self.reviews or review_id != self.review_id:
+            if self.reviews:
+                lines.append(self.review_footer)
+            lines.append('    <Review rid=%s>\n        <sentences>\n' % quoteattr(str(review_id)))
+            self.reviews += 1
+            self.review_id = review_id
+        lines.append('            <sentence id=%s>\n                <text>%s</text>\n' % (
+            quoteattr(str(sentence_id)), escape(text)))
+        if opinions is not None:
+            lines.append('                <Opinions>\n')
+            lines.extend('                    <Opinion %s/>\n' % _attributes(
+                ('target', 'category', 'polarity', 'from', 'to'), o) for o in opinions)
+            lines.append('                </Opinions>\n')
+        lines.append('            </sentence>\n')
+        self.f.write(''.join(lines))
+
+    def close(self):
+        self.footer = (self.review_footer if self.reviews else '') + '</Reviews>\n'
+        super().close()
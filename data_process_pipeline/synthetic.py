@@ -0,0 +1,330 @@
+"""
+Synthetic SemEval corpora for load testing the pipeline and training at scales the real data does not reach.
+
+Sentence lengths, words, aspect categories, polarities, aspect terms / opinion targets and the number of
+sentences per review are sampled from the distributions of the bundled SemEval 2014 and 2016 restaurant
+training data. Words are drawn independently, so the text is not grammatical; the length, vocabulary and
+label statistics are what matter for the pipeline. A matching word2vec file (binary, the GoogleNews format)
+is written for the vocabulary the pipeline will see after clean().
+
+    python -m data_process_pipeline.synthetic --sentences 1000000 --out-dir data/synthetic/1m
+
+writes semeval14_train.xml / semeval14_test.xml (sentence/aspectCategories), semeval16_train.xml /
+semeval16_test.xml (Review/sentences/Opinions) and w2v.bin. The output only depends on the arguments.
+"""
+import argparse
+import os
+import re
+import xml.etree.ElementTree
+from collections import Counter
+from time import time
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+source_2014 = os.path.join(root, 'data/raw_data/SemEval_14/SemEval14-ABSA-TrainData_v2/Restaurants_Train_v2.xml')
+source_2016 = os.path.join(root, 'data/raw_data/SemEval_16/ABSA16_Restaurants_Train_SB1_v2.xml')
+
+token_re = re.compile(r"\w+(?:'\w+)?|[^\w\s]", re.UNICODE)
+# sentences are generated this many at a time, so numpy does the sampling
+chunk_size = 10000
+
+
+class Empirical():
+    """ Samples values with the frequencies they were counted with """
+
+    def __init__(self, counts):
+        # most frequent first, ties by value, so the same counts always give the same sampler
+        items = sorted(counts.items(), key=lambda kv: (-kv[1], str(kv[0])))
+        self.values = [v for v, _ in items]
+        c = np.cumsum([n for _, n in items], dtype=np.float64)
+        self.cumulative = c / c[-1]
+
+    def indices(self, rng, size):
+        return np.minimum(np.searchsorted(self.cumulative, rng.random_sample(size), side='right'),
+                          len(self.values) - 1)
+
+    def sample(self, rng, size):
+        return [self.values[i] for i in self.indices(rng, size)]
+
+
+def tokenize(text):
+    return token_re.findall(text)
+
+
+def detokenize(tokens):
+    """ Text and the character offset of every token; punctuation is attached to the word before it """
+    parts, offsets, pos = [], [], 0
+    for t in tokens:
+        if parts and (t[0].isalnum() or t[0] == '_'):
+            parts.append(' ')
+            pos += 1
+        offsets.append(pos)
+        parts.append(t)
+        pos += len(t)
+    return ''.join(parts), offsets
+
+
+def fit_2014(path):
+    """ Distributions of the SemEval 2014 sentence/aspectCategories schema """
+    words, lengths, n_categories, categories, n_terms, terms = Counter(), Counter(), Counter(), Counter(), \
+                                                                Counter(), Counter()
+    polarity = {}
+    for sentence in xml.etree.ElementTree.parse(path).getroot().findall('sentence'):
+        tokens = tokenize(sentence.find('text').text)
+        words.update(tokens)
+        lengths[len(tokens)] += 1
+        cats = sentence.findall('aspectCategories/aspectCategory')
+        n_categories[len(cats)] += 1
+        for c in cats:
+            categories[c.get('category')] += 1
+            polarity.setdefault(c.get('category'), Counter())[c.get('polarity')] += 1
+        ts = sentence.findall('aspectTerms/aspectTerm')
+        n_terms[len(ts)] += 1
+        for t in ts:
+            if tokenize(t.get('term')):
+                terms[(t.get('term'), t.get('polarity'))] += 1
+    return {'words': Empirical(words), 'lengths': Empirical(lengths), 'n_categories': Empirical(n_categories),
+            'categories': Empirical(categories), 'polarity': {c: Empirical(p) for c, p in polarity.items()},
+            'n_terms': Empirical(n_terms), 'terms': Empirical(terms)}
+
+
+def fit_2016(path):
+    """ Distributions of the SemEval 2016 Review/sentences/Opinions schema """
+    words, lengths, n_sentences, n_opinions, opinions = Counter(), Counter(), Counter(), Counter(), Counter()
+    polarity = {}
+    for review in xml.etree.ElementTree.parse(path).getroot().findall('Review'):
+        sentences = review.findall('sentences/sentence')
+        n_sentences[len(sentences)] += 1
+        for sentence in sentences:
+            tokens = tokenize(sentence.find('text').text)
+            words.update(tokens)
+            lengths[len(tokens)] += 1
+            n_opinions[len(sentence.findall('Opinions/Opinion'))] += 1
+            for o in sentence.findall('Opinions/Opinion'):
+                if not tokenize(o.get('target')):
+                    continue
+                # targets depend on the category ("staff" is SERVICE#GENERAL), so they are sampled together
+                opinions[(o.get('category'), o.get('target'))] += 1
+                polarity.setdefault(o.get('category'), Counter())[o.get('polarity')] += 1
+    return {'words': Empirical(words), 'lengths': Empirical(lengths), 'n_sentences': Empirical(n_sentences),
+            'n_opinions': Empirical(n_opinions), 'opinions': Empirical(opinions),
+            'polarity': {c: Empirical(p) for c, p in polarity.items()}}
+
+
+class Vocabulary():
+    """
+    Words of the fitted data plus, optionally, extra_words rare synthetic words. Real vocabularies keep
+    growing with the corpus; each token is replaced by a Zipf-distributed rare word with probability
+    rare_rate so that the vocabulary of a large corpus grows too.
+    """
+
+    def __init__(self, words, extra_words=0, rare_rate=0.01):
+        self.words = words
+        self.extra = ['zq%s' % np.base_repr(i, 36).lower() for i in range(extra_words)]
+        self.rare_rate = rare_rate if extra_words else 0.0
+        if extra_words:
+            p = 1.0 / np.arange(1, extra_words + 1)
+            self.extra_cumulative = np.cumsum(p) / p.sum()
+
+    def sample(self, rng, size):
+        tokens = self.words.sample(rng, size)
+        if self.rare_rate:
+            rare = np.flatnonzero(rng.random_sample(size) < self.rare_rate)
+            picks = np.searchsorted(self.extra_cumulative, rng.random_sample(len(rare)), side='right')
+            for i, j in zip(rare, picks):
+                tokens[i] = self.extra[min(j, len(self.extra) - 1)]
+        return tokens
+
+    def all_words(self):
+        return list(self.words.values) + self.extra
+
+
+def sentence_tokens(vocab, lengths, rng, n):
+    """ n token lists with lengths sampled from the fitted distribution """
+    ls = np.maximum(np.asarray(lengths.sample(rng, n)), 1)
+    flat = vocab.sample(rng, int(ls.sum()))
+    out, start = [], 0
+    for l in ls:
+        out.append(flat[start:start + l])
+        start += l
+    return out
+
+
+def insert_phrases(tokens, phrases, rng):
+    """ Inserts each phrase (a token list) at a random position; returns the text and (from, to) per phrase """
+    tokens = list(tokens)
+    positions = []
+    for phrase in phrases:
+        at = rng.randint(0, len(tokens) + 1)
+        # never split a phrase inserted before
+        for p, q in zip(positions, phrases):
+            if p < at < p + len(q):
+                at = p
+        positions = [p + len(phrase) if p >= at else p for p in positions]
+        tokens[at:at] = phrase
+        positions.append(at)
+    text, offsets = detokenize(tokens)
+    spans = []
+    for phrase, at in zip(phrases, positions):
+        start = offsets[at]
+        end = offsets[at + len(phrase) - 1] + len(phrase[-1])
+        spans.append((start, end))
+    return text, spans
+
+
+def distinct(sampler, rng, k):
+    """ Up to k distinct values (a sentence does not repeat an aspect) """
+    values = []
+    for v in sampler.sample(rng, 3 * k):
+        if v not in values:
+            values.append(v)
+            if len(values) == k:
+                break
+    return values
+
+
+def write_2014(path, n, stats, vocab, seed):
+    rng = np.random.RandomState(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<sentences>\n')
+        for start in range(0, n, chunk_size):
+            m = min(chunk_size, n - start)
+            tokens = sentence_tokens(vocab, stats['lengths'], rng, m)
+            n_categories = stats['n_categories'].sample(rng, m)
+            n_terms = stats['n_terms'].sample(rng, m)
+            for i in range(m):
+                terms = stats['terms'].sample(rng, n_terms[i])
+                text, spans = insert_phrases(tokens[i], [tokenize(t) for t, _ in terms], rng)
+                f.write('    <sentence id="%d">\n        <text>%s</text>\n' % (start + i, escape(text)))
+                if terms:
+                    f.write('        <aspectTerms>\n')
+                    for (_, p), (a, b) in zip(terms, spans):
+                        f.write('            <aspectTerm term=%s polarity="%s" from="%d" to="%d"/>\n' % (
+                            quoteattr(text[a:b]), p, a, b))
+                    f.write('        </aspectTerms>\n')
+                categories = distinct(stats['categories'], rng, max(n_categories[i], 1))
+                f.write('        <aspectCategories>\n')
+                for c in categories:
+                    f.write('            <aspectCategory category=%s polarity="%s"/>\n' % (
+                        quoteattr(c), stats['polarity'][c].sample(rng, 1)[0]))
+                f.write('        </aspectCategories>\n    </sentence>\n')
+        f.write('</sentences>\n')
+
+
+def write_2016(path, n, stats, vocab, seed):
+    rng = np.random.RandomState(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Reviews>\n')
+        written, review = 0, 0
+        while written < n:
+            m = min(chunk_size, n - written)
+            tokens = sentence_tokens(vocab, stats['lengths'], rng, m)
+            n_opinions = stats['n_opinions'].sample(rng, m)
+            i = 0
+            while i < m:
+                k = min(max(stats['n_sentences'].sample(rng, 1)[0], 1), m - i)
+                f.write('    <Review rid="%d">\n        <sentences>\n' % review)
+                for s in range(k):
+                    opinions = distinct(stats['opinions'], rng, n_opinions[i + s])
+                    phrases = [tokenize(t) for _, t in opinions if t != 'NULL']
+                    text, spans = insert_phrases(tokens[i + s], phrases, rng)
+                    spans = iter(spans)
+                    f.write('            <sentence id="%d:%d">\n                <text>%s</text>\n' % (
+                        review, s, escape(text)))
+                    if opinions:
+                        f.write('                <Opinions>\n')
+                        for c, t in opinions:
+                            a, b = (0, 0) if t == 'NULL' else next(spans)
+                            f.write('                    <Opinion target=%s category=%s polarity="%s" '
+                                    'from="%d" to="%d"/>\n' % (quoteattr('NULL' if t == 'NULL' else text[a:b]),
+                                                               quoteattr(c), stats['polarity'][c].sample(rng, 1)[0],
+                                                               a, b))
+                        f.write('                </Opinions>\n')
+                    f.write('            </sentence>\n')
+                f.write('        </sentences>\n    </Review>\n')
+                i += k
+                review += 1
+            written += m
+        f.write('</Reviews>\n')
+
+
+def aspect_words(stats_2014, stats_2016):
+    """ Words the pipelines look up for aspects, entities and attributes """
+    words = set()
+    for c in stats_2014['categories'].values:
+        words.update(c.split('/'))
+    for c, _ in stats_2016['opinions'].values:
+        for part in c.lower().split('#'):
+            words.add(part)
+            words.update(part.split('_'))
+    return words
+
+
+def write_word2vec(path, words, dim=300, seed=1):
+    """ word2vec binary format, as read by gensim's KeyedVectors.load_word2vec_format(binary=True) """
+    rng = np.random.RandomState(seed)
+    with open(path, 'wb') as f:
+        f.write(('%d %d\n' % (len(words), dim)).encode('utf-8'))
+        for start in range(0, len(words), chunk_size):
+            batch = words[start:start + chunk_size]
+            vectors = rng.uniform(-0.25, 0.25, (len(batch), dim)).astype('<f4')
+            for w, v in zip(batch, vectors):
+                f.write(w.encode('utf-8') + b' ' + v.tobytes() + b'\n')
+
+
+def w2v_vocabulary(vocab, stats_2014, stats_2016, coverage, seed):
+    """
+    The tokens clean() makes of the generated words (plus the aspect words, always present). Only a
+    coverage fraction of the text words get a vector, as GoogleNews misses some of the real words too.
+    """
+    from data_process_pipeline.semeval2014.preprocess import clean
+    words = set()
+    phrases = vocab.all_words() + [t for t, _ in stats_2014['terms'].values] + [t for _, t in stats_2016['opinions'].values]
+    for w in phrases:
+        words.update(clean(w))
+    words = sorted(words)
+    rng = np.random.RandomState(seed)
+    keep = rng.random_sample(len(words)) < coverage
+    aspects = aspect_words(stats_2014, stats_2016)
+    return sorted(set(w for w, k in zip(words, keep) if k) | aspects)
+
+
+def generate(out_dir, sentences, test_fraction=0.2, extra_words=0, dim=300, coverage=0.97, seed=1,
+             path_2014=source_2014, path_2016=source_2016):
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+    stats_2014 = fit_2014(path_2014)
+    stats_2016 = fit_2016(path_2016)
+    n_test = int(round(sentences * test_fraction))
+    for name, stats, write in [('semeval14', stats_2014, write_2014), ('semeval16', stats_2016, write_2016)]:
+        vocab = Vocabulary(stats['words'], extra_words)
+        for split, n, s in [('train', sentences, seed), ('test', n_test, seed + 1)]:
+            st = time()
+            path = os.path.join(out_dir, '%s_%s.xml' % (name, split))
+            write(path, n, stats, vocab, s)
+            print("%s: %d sentences in %.1f seconds" % (path, n, time() - st))
+    st = time()
+    vocab = Vocabulary(Empirical(Counter(stats_2014['words'].values) + Counter(stats_2016['words'].values)),
+                       extra_words)
+    words = w2v_vocabulary(vocab, stats_2014, stats_2016, coverage, seed)
+    write_word2vec(os.path.join(out_dir, 'w2v.bin'), words, dim, seed)
+    print("%s: %d words in %.1f seconds" % (os.path.join(out_dir, 'w2v.bin'), len(words), time() - st))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sentences', type=int, default=1000, help='training sentences per schema')
+    parser.add_argument('--test-fraction', type=float, default=0.2)
+    parser.add_argument('--extra-words', type=int, default=0,
+                        help='rare synthetic words added to the vocabulary (it grows with the corpus)')
+    parser.add_argument('--dim', type=int, default=300)
+    parser.add_argument('--coverage', type=float, default=0.97, help='fraction of words with a vector')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--source-2014', default=source_2014)
+    parser.add_argument('--source-2016', default=source_2016)
+    parser.add_argument('--out-dir', default=os.path.join(root, 'data/synthetic'))
+    args = parser.parse_args()
+    generate(args.out_dir, args.sentences, args.test_fraction, args.extra_words, args.dim, args.coverage,
+             args.seed, args.source_2014, args.source_2016)
@@ -0,0 +1,250 @@
+"""
+Append-only vocabulary: onboards a new batch of SemEval 2014 style reviews without reprocessing what was encoded
+before. run.py numbers the words by sorting them, so one new word shifts the id of every word after it; here the
+ids in text_vocab.vocab never change and the new words of the batch (those with a word2vec vector) get the next ids.
+
+    $ python -m data_process_pipeline.vocab data/semeval14 new_reviews.xml --name batch_01 \
+        [--min-count 2] [--store data/embeddings --domain semeval14] [--weights baseline/saves/weights.npz]
+
+- appends the new words to text_vocab.vocab and their vectors to text_vector.pkl / text_vocab.pkl; with --min-count
+  only the new words the batch has at least that often (prune.keep_words). A vocabulary pruned by run.py does not
+  hold the words it pruned, so they are new words here: pass the --min-count run.py pruned with, or one batch adds
+  back every rare word it happens to contain. --max-vocab and --coverage are not applied to a batch
+- encodes only the batch, written next to the other splits as <name>.pkl / <name>_sentences.npy / <name>.tsv;
+  splits encoded before stay valid as they are
+- with --store, appends the new rows to the shared embedding store (embedding_store.py) in place and extends the
+  domain's remap
+- with --weights, appends the new rows to the (fixed) embedding_matrix of exported weights, so a model trained
+  before the batch reads the new words instead of __UNK__
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import pickle
+from collections import Counter
+
+import numpy as np
+
+from data_process_pipeline.embedding_store import remap_file
+from data_process_pipeline.prune import keep_words
+
+
+class AppendOnlyVocab():
+    """ The words of text_vocab.vocab in id order; add() gives unseen words the next id, save() appends them """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path) as f:
+            words = dict(line.rstrip('\n').split('\t') for line in f)
+        self.i2w = [words[str(i)] for i in range(len(words))]
+        self.w2i = {w: i for i, w in enumerate(self.i2w)}
+        self.new = []
+
+    def __len__(self):
+        return len(self.i2w)
+
+    def __contains__(self, word):
+        return word in self.w2i
+
+    def add(self, word):
+        if word not in self.w2i:
+            self.w2i[word] = len(self.i2w)
+            self.i2w.append(word)
+            self.new.append(word)
+        return self.w2i[word]
+
+    def save(self):
+        """ Appends the words added since the last save; the lines already in the file are not rewritten """
+        with open(self.path, 'a') as f:
+            for word in self.new:
+                f.write('%d\t%s\n' % (self.w2i[word], word))
+        self.new = []
+
+
+def new_words(sentences, vocab):
+    """ Words of the cleaned sentences that are not in vocab, in order of first appearance """
+    seen = set()
+    words = []
+    for tokens in sentences:
+        for word in tokens:
+            if word not in vocab and word not in seen:
+                seen.add(word)
+                words.append(word)
+    return words
+
+
+def extend_vocab(vocab_dir, sentences, vectors, min_count=1):
+    """
+    Adds the words of sentences that have a vector in vectors (a word2vec KeyedVectors or a dict) and occur at least
+    min_count times in sentences to the vocabulary of vocab_dir; the others stay __UNK__, as in run.py. Returns the
+    vocabulary and the added words.
+    """
+    sentences = list(sentences)
+    vocab = AppendOnlyVocab(os.path.join(vocab_dir, 'text_vocab.vocab'))
+    added = [w for w in new_words(sentences, vocab) if w in vectors]
+    if min_count > 1:
+        counts = Counter(w for tokens in sentences for w in tokens)
+        kept = set(keep_words([(w, counts[w]) for w in added], min_count=min_count, keep=()))
+        added = [w for w in added if w in kept]
+    if added:
+        with open(os.path.join(vocab_dir, 'text_vector.pkl'), 'rb') as f:
+            text_vector = pickle.load(f)
+        for word in added:
+            vocab.add(word)
+            text_vector[word] = np.asarray(vectors[word])
+        vocab.save()
+        with open(os.path.join(vocab_dir, 'text_vector.pkl'), 'wb') as f:
+            pickle.dump(text_vector, f)
+        with open(os.path.join(vocab_dir, 'text_vocab.pkl'), 'wb') as f:
+            pickle.dump(dict(enumerate(vocab.i2w)), f)
+    return vocab, added
+
+
+def append_rows(path, rows):
+    """
+    Appends rows to the 2-d array of a .npy file in place: the header gets the new shape (numpy leaves room for it)
+    and the rows are written at the end; the existing rows are neither read nor rewritten
+    """
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        rows = np.ascontiguousarray(rows, dtype=dtype).reshape(-1, *shape[1:])
+        assert not fortran_order, "%s is not in C order" % path
+        header = io.BytesIO()
+        d = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+             'shape': (shape[0] + rows.shape[0],) + tuple(shape[1:])}
+        if version == (1, 0):
+            np.lib.format.write_array_header_1_0(header, d)
+        else:
+            np.lib.format.write_array_header_2_0(header, d)
+        header = header.getvalue()  # magic string included
+        if len(header) != offset:
+            raise ValueError("No room for the new shape in the header of %s" % path)
+        f.seek(0, 2)
+        f.write(rows.tobytes())
+        f.seek(0)
+        f.write(header)
+
+
+def extend_store(store_dir, domain, vocab, vectors, words):
+    """
+    Rows of the store for words (ids at the end of the domain vocabulary): a word already stored with the same
+    vector (from another domain) reuses its row, the others are appended in place; the domain's remap is extended
+    """
+    with open(os.path.join(store_dir, 'manifest.json')) as f:
+        manifest = json.load(f)
+    matrix = np.load(os.path.join(store_dir, 'embeddings.npy'), mmap_mode='r')
+    rows = {}
+    with open(os.path.join(store_dir, 'vocab.vocab')) as f:
+        for line in f:
+            i, word = line.rstrip('\n').split('\t')
+            rows.setdefault(word, []).append(int(i))
+    remap_path = os.path.join(store_dir, remap_file(domain))
+    remap = list(np.load(remap_path))
+    assert len(remap) == len(vocab) - len(words), "the store is not at the vocabulary of %s before the batch" % domain
+    new_rows, new_words = [], []
+    for word in words:
+        vector = np.asarray(vectors[word], dtype=matrix.dtype)
+        row = next((r for r in rows.get(word, []) if np.array_equal(matrix[r], vector)), None)
+        if row is None:
+            row = matrix.shape[0] + len(new_rows)
+            new_rows.append(vector)
+            new_words.append(word)
+        remap.append(row)
+    del matrix
+    if new_rows:
+        new_rows = np.asarray(new_rows, dtype=np.float32)
+        append_rows(os.path.join(store_dir, 'embeddings.npy'), new_rows)
+        with open(os.path.join(store_dir, 'vocab.vocab'), 'a') as f:
+            for i, word in enumerate(new_words):
+                f.write('%d\t%s\n' % (manifest['rows'] + i, word))
+        manifest['rows'] += len(new_rows)
+        # chained, so the version does not need a pass over the whole matrix
+        manifest['version'] = hashlib.md5(manifest['version'].encode('utf-8') + new_rows.tobytes()).hexdigest()
+    np.save(remap_path, np.asarray(remap, dtype=np.int32))
+    manifest['domains'][domain]['vocab_size'] = len(remap)
+    with open(os.path.join(store_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return len(new_rows)
+
+
+def extend_weights(path, vocab_dir):
+    """ Appends the vectors of the words added since training to the embedding_matrix of exported weights """
+    with open(os.path.join(vocab_dir, 'text_vector.pkl'), 'rb') as f:
+        text_vector = pickle.load(f)
+    vocab = AppendOnlyVocab(os.path.join(vocab_dir, 'text_vocab.vocab'))
+    with np.load(path) as f:
+        weights = {k: f[k] for k in f.files}
+    emb = weights['embedding_matrix']
+    added = vocab.i2w[emb.shape[0]:]
+    if added:
+        rows = [text_vector.get(w, text_vector['__UNK__']) for w in added]
+        weights['embedding_matrix'] = np.concatenate([emb, np.asarray(rows, dtype=emb.dtype)])
+        np.savez(path + '.tmp.npz', **weights)
+        os.replace(path + '.tmp.npz', path)
+    return len(added)
+
+
+def encode_batch(a, vocab_dir, w2i, name, max_len=80):
+    """
+    Encodes the rows of a batch like create_train_data / create_test_data (without shuffling) and writes them to
+    vocab_dir as name; rows without an aspect category are left out and so are conflicts when there are labels
+    """
+    from data_process_pipeline.semeval2014.create_model_data import encode_sentences, aspect_ids, polarity_vectors, \
+        save_model_data
+
+    with open(os.path.join(vocab_dir, 'aspect_vector.pkl'), 'rb') as f:
+        a2i = {aspect: i for i, aspect in enumerate(sorted(pickle.load(f).keys()))}
+    a = a[a.aspect.notnull()]
+    labelled = a.polarity.notnull().any()
+    if labelled:
+        a = a[a.polarity != 'conflict']
+    a, sentences = encode_sentences(a.reset_index(drop=True), w2i, max_len)
+    a['aspect'] = aspect_ids(a, a2i)
+    if labelled:
+        a['polarity'] = [polarity_vectors[p] for p in a['polarity']]
+    save_model_data(a, sentences, vocab_dir, name)
+    return a, sentences
+
+
+def load_word2vec(path):
+    import gensim
+    return gensim.models.KeyedVectors.load_word2vec_format(path, binary=True)
+
+
+if __name__ == '__main__':
+    from data_process_pipeline.semeval2014.load_pp_data import google_news_path
+    from data_process_pipeline.semeval2014.prepare_2014_data import get_restaurants_data
+    from data_process_pipeline.semeval2014.preprocess import clean_unique
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('vocab_dir', help='output directory of the 2014 pipeline (text_vocab.vocab, text_vector.pkl)')
+    parser.add_argument('xml', help='the new batch, SemEval 2014 XML with aspect categories')
+    parser.add_argument('--name', required=True, help='name of the encoded batch, e.g. batch_01')
+    parser.add_argument('--min-count', type=int, default=1,
+                        help='occurrences in the batch a new word needs, as run.py --min-count (default: 1)')
+    parser.add_argument('--w2v', default=google_news_path, help='word2vec binary the vocabulary was built from')
+    parser.add_argument('--store', default=None, help='shared embedding store to extend (embedding_store.py)')
+    parser.add_argument('--domain', default='semeval14', help='domain of vocab_dir in --store')
+    parser.add_argument('--weights', nargs='*', default=[], help='exported weights whose embedding_matrix to extend')
+    args = parser.parse_args()
+
+    batch = get_restaurants_data(args.xml)
+    batch['text'] = clean_unique(batch)
+    vectors = load_word2vec(args.w2v)
+    vocab, added = extend_vocab(args.vocab_dir, batch['text'], vectors, args.min_count)
+    print("%d new words (ids %d-%d), vocabulary of %d" % (len(added), len(vocab) - len(added), len(vocab) - 1,
+                                                         len(vocab)))
+    rows, sentences = encode_batch(batch, args.vocab_dir, vocab.w2i, args.name)
+    print("Encoded %d rows, %d sentences as %s" % (rows.shape[0], sentences.shape[0],
+                                                    os.path.join(args.vocab_dir, args.name)))
+    if args.store:
+        print("Appended %d rows to %s" % (extend_store(args.store, args.domain, vocab, vectors, added), args.store))
+    for path in args.weights:
+        print("Appended %d rows to the embedding_matrix of %s" % (extend_weights(path, args.vocab_dir), path))
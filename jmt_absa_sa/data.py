@@ -0,0 +1,119 @@
+import os
+import pickle
+
+import numpy as np
+
+from data_process_pipeline.semeval2014.preprocess import clean
+from data_process_pipeline.semeval_xml import read_2014, read_2016
+
+polarities = ['negative', 'neutral', 'positive']
+polarity_index = {p: i for i, p in enumerate(polarities)}
+
+
+def load_sentences(path, dataset):
+    """
+    (ids, text, {category: polarity}) per sentence of a SemEval 2014 (aspect categories) or 2016 (opinion
+    categories) XML file. ids is (sentence_id,) or (review_id, sentence_id). In 2016 a category can have several
+    opinions; when their polarities disagree the category is kept with polarity 'conflict'.
+    """
+    sentences = []
+    if dataset == '2014':
+        for id, text, _, categories in read_2014(path):
+            sentences.append(((id,), text, dict(categories or [])))
+    elif dataset == '2016':
+        for review_id, id, text, opinions in read_2016(path):
+            categories = {}
+            for _, category, polarity, _, _ in opinions or []:
+                category = category.lower()
+                categories[category] = polarity if categories.get(category, polarity) == polarity else 'conflict'
+            sentences.append(((review_id, id), text, categories))
+    else:
+        raise ValueError("Unknown dataset: %s" % dataset)
+    return sentences
+
+
+def load_vocab(vocab_dir):
+    """ Word ids of the pipeline's vocabulary (the rows of text_vocab.vocab) """
+    w2i = {}
+    with open(os.path.join(vocab_dir, 'text_vocab.vocab')) as f:
+        for line in f:
+            i, word = line.rstrip('\n').split('\t')
+            w2i[word] = int(i)
+    return w2i
+
+
+def load_embedding(vocab_dir, w2i):
+    """ Embedding matrix of the vocabulary from text_vector.pkl; words without a vector get the __UNK__ vector """
+    with open(os.path.join(vocab_dir, 'text_vector.pkl'), 'rb') as f:
+        vectors = pickle.load(f)
+    emb = np.zeros((len(w2i), len(vectors['__UNK__'])), dtype=np.float32)
+    for word, i in w2i.items():
+        emb[i] = vectors.get(word, vectors['__UNK__'])
+    return emb
+
+
+class JointData():
+    """
+    Sentences encoded once for the joint model: padded word ids and lengths, the categories as a multi-hot
+    matrix, and per category the polarity class with a mask (0 where the category is absent or has a polarity
+    outside negative / neutral / positive, e.g. conflict)
+    """
+
+    def __init__(self, sentences, w2i, categories, input_len=80):
+        self.sentences = sentences
+        self.categories = list(categories)
+        category_index = {c: i for i, c in enumerate(self.categories)}
+        n, C = len(sentences), len(self.categories)
+        unk, pad = w2i['__UNK__'], w2i['__PAD__']
+        self.x = np.full((n, input_len), pad, dtype=np.int32)
+        self.x_len = np.zeros(n, dtype=np.int32)
+        self.y_category = np.zeros((n, C), dtype=np.float32)
+        self.y_polarity = np.zeros((n, C), dtype=np.int32)
+        self.polarity_mask = np.zeros((n, C), dtype=np.float32)
+        for s, (_, text, labels) in enumerate(sentences):
+            ids = [w2i.get(w, unk) for w in clean(text)][:input_len]
+            self.x[s, :len(ids)] = ids
+            self.x_len[s] = len(ids)
+            for category, polarity in labels.items():
+                if category not in category_index:
+                    continue
+                c = category_index[category]
+                self.y_category[s, c] = 1.0
+                if polarity in polarity_index:
+                    self.y_polarity[s, c] = polarity_index[polarity]
+                    self.polarity_mask[s, c] = 1.0
+
+    def __len__(self):
+        return self.x.shape[0]
+
+    def batches(self, batch_size, rng=None):
+        """ x, x_len, y_category, y_polarity, polarity_mask; shuffled when rng is given """
+        order = rng.permutation(len(self)) if rng is not None else np.arange(len(self))
+        for i in range(0, len(order), batch_size):
+            rows = order[i:i + batch_size]
+            yield self.x[rows], self.x_len[rows], self.y_category[rows], self.y_polarity[rows], \
+                self.polarity_mask[rows]
+
+
+def category_list(sentences):
+    return sorted(set(c for _, _, labels in sentences for c in labels))
+
+
+def evaluate(category_probs, polarity_probs, data, threshold=0.5):
+    """
+    Scores of the predictions for data, as semeval_base.Evaluate counts them:
+    category detection P / R / F1 (per sentence, the predicted set against the gold set), polarity accuracy on
+    the gold categories (task 4: every gold category counts, conflict is never right) and joint accuracy,
+    the gold (category, polarity) pairs that were both detected and given the right polarity, over all gold pairs.
+    """
+    predicted = category_probs >= threshold
+    gold = data.y_category > 0
+    common, retrieved, relevant = float(np.sum(predicted & gold)), float(np.sum(predicted)), float(np.sum(gold))
+    p = common / retrieved if retrieved > 0 else 0.
+    r = common / relevant if relevant > 0 else 0.
+    f1 = 2 * p * r / (p + r) if p > 0 and r > 0 else 0.
+    right = (np.argmax(polarity_probs, -1) == data.y_polarity) & (data.polarity_mask > 0)
+    accuracy = float(np.sum(right & gold)) / relevant if relevant > 0 else 0.
+    joint = float(np.sum(right & gold & predicted)) / relevant if relevant > 0 else 0.
+    return {'category_precision': p, 'category_recall': r, 'category_f1': f1, 'polarity_accuracy': accuracy,
+            'joint_accuracy': joint}
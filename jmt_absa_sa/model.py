@@ -0,0 +1,191 @@
+import numpy as np
+import tensorflow as tf
+
+
+class JointAspectModel():
+    """
+    Aspect category detection and aspect category polarity in one pass over the sentence.
+
+    The sentence is encoded once by the RNN. Every category c then attends over the outputs with its own embedding
+    (the attention of AspectLevelModel, with the category in place of the input aspect) and gets a representation
+    h*_c, from which a sigmoid decides whether the sentence mentions c and a softmax gives its polarity.
+    """
+
+    def __init__(self, cell, hidden_size, vocab_size, embedding_size, category_size, category_embedding_size,
+                 input_length,
+                 learning_rate=0.01,
+                 l2_reg=0.01,
+                 reg_lambda=0.001,
+                 polarity_weight=1.0):
+        self.hidden_size = hidden_size  # d in paper
+        self.vocab_size = vocab_size
+        self.embedding_size = embedding_size
+        self.category_size = category_size
+        self.category_embedding_size = category_embedding_size
+        self.N = input_length
+
+        self.l2_reg = l2_reg
+        self.reg_lambda = reg_lambda
+        self.polarity_weight = polarity_weight
+
+        self.class_size = 3
+        self.initial_learning_rate = learning_rate
+        self.cell_type = cell
+        if cell == 'lstm':
+            self.cell = tf.contrib.rnn.BasicLSTMCell(hidden_size)
+        elif cell == 'gru':
+            self.cell = tf.contrib.rnn.GRUCell(hidden_size)
+
+        self._init_placeholders()
+        self._init_embeddings()
+        self._init_joint()
+        self._init_optimizer()
+
+    def _init_placeholders(self):
+        self.keep_prob1 = tf.placeholder(tf.float32)
+        self.inputs = tf.placeholder(shape=(None, self.N), dtype=tf.int32, name='inputs')
+        self.inputs_length = tf.placeholder(shape=(None,), dtype=tf.int32, name='inputs_length')
+
+        # required for training, not required for testing
+        # multi-hot categories of the sentence
+        self.category_targets = tf.placeholder(shape=(None, self.category_size), dtype=tf.float32,
+                                               name='category_targets')
+        # polarity class per category; only counted where polarity_mask is 1 (the category is in the sentence)
+        self.polarity_targets = tf.placeholder(shape=(None, self.category_size), dtype=tf.int32,
+                                               name='polarity_targets')
+        self.polarity_mask = tf.placeholder(shape=(None, self.category_size), dtype=tf.float32,
+                                            name='polarity_mask')
+
+    def _init_embeddings(self):
+        with tf.variable_scope("WordEmbedding") as scope:
+            self.embedding_matrix = tf.Variable(
+                tf.constant(0.0, shape=[self.vocab_size, self.embedding_size]),
+                trainable=False, name="embedding_matrix")
+            self.embedding_placeholder = tf.placeholder(tf.float32, [self.vocab_size, self.embedding_size])
+            self.embedding_init = self.embedding_matrix.assign(self.embedding_placeholder)
+
+            self.inputs_embedded = tf.nn.embedding_lookup(self.embedding_matrix, self.inputs)  # -> [batch_size, N, dw]
+            self.inputs_embedded = tf.nn.dropout(self.inputs_embedded, keep_prob=self.keep_prob1)
+
+        with tf.variable_scope("CategoryEmbedding") as scope:
+            # Uniform(-sqrt(3), sqrt(3)) has variance=1.
+            sqrt3 = np.sqrt(3.0)
+            self.category_embedding_matrix = tf.Variable(
+                tf.random_uniform([self.category_size, self.category_embedding_size], -sqrt3, sqrt3),
+                name="category_embedding_matrix")  # -> [C, dc]
+
+    def _init_joint(self):
+        with tf.variable_scope("RNN") as scope:
+            # shape of state is [batch_size, cell.state_size]
+            (self.outputs, self.state) = (
+                tf.nn.dynamic_rnn(cell=self.cell,
+                                  inputs=self.inputs_embedded,
+                                  sequence_length=self.inputs_length,
+                                  dtype=tf.float32)
+            )
+            N = self.N
+            C = self.category_size
+            d = self.hidden_size
+
+            Wh = tf.Variable(tf.random_normal(shape=[d, d], stddev=1.0 / tf.sqrt(600.0)),
+                             dtype=tf.float32, name='Wh')  # -> [d, d]
+            Wv = tf.Variable(tf.random_normal(shape=[self.category_embedding_size, d], stddev=1.0 / tf.sqrt(600.0)),
+                             dtype=tf.float32, name='Wv')  # -> [dc, d]
+            w = tf.get_variable(
+                name='w',
+                shape=[d, 1],
+                initializer=tf.random_uniform_initializer(-0.003, 0.003),
+                regularizer=tf.contrib.layers.l2_regularizer(self.l2_reg)
+            )
+
+            # the category has to enter the scores inside the tanh, or every category would attend alike
+            a = tf.tensordot(self.outputs, Wh, 1)  # -> [batch_size, N, d]
+            b = tf.matmul(self.category_embedding_matrix, Wv)  # -> [C, d]
+            M = tf.tanh(tf.expand_dims(a, 1) + tf.reshape(b, [1, C, 1, d]))  # -> [batch_size, C, N, d]
+            scores = tf.squeeze(tf.tensordot(M, w, 1), [3])  # -> [batch_size, C, N]
+            # steps past the sentence length get no attention
+            mask = tf.sequence_mask(self.inputs_length, N, dtype=tf.float32)  # -> [batch_size, N]
+            scores += tf.expand_dims(mask - 1.0, 1) * 1e9
+            self.alpha = tf.nn.softmax(scores)  # -> [batch_size, C, N]
+
+            r = tf.matmul(self.alpha, self.outputs, name='sentence_weighted_representation')  # -> [batch_size, C, d]
+
+            Wp = tf.Variable(tf.random_normal(shape=[d, d], stddev=1.0 / tf.sqrt(600.0)),
+                             dtype=tf.float32, name='Wp')
+            Wx = tf.Variable(tf.random_normal(shape=[d, d], stddev=1.0 / tf.sqrt(600.0)),
+                             dtype=tf.float32, name='Wx')
+
+            # LSTMStateTuple carries (c, h); the GRU state is h itself
+            last_h = self.state.h if isinstance(self.state, tf.contrib.rnn.LSTMStateTuple) else self.state
+            h_star = tf.tanh(tf.tensordot(r, Wp, 1) + tf.expand_dims(tf.matmul(last_h, Wx), 1),
+                             name='sentence_representation')  # -> [batch_size, C, d]
+
+            # category detection: one logistic unit per category over its own h*
+            Wc = tf.Variable(tf.random_normal(shape=[C, d], stddev=1.0 / tf.sqrt(600.0)),
+                             dtype=tf.float32, name='Wc')
+            bc = tf.Variable(tf.zeros(shape=[C]), name='bc')
+            self.category_logits = tf.reduce_sum(h_star * Wc, 2) + bc  # -> [batch_size, C]
+
+            # polarity: softmax shared by the categories
+            Ws = tf.Variable(tf.random_normal(shape=[d, self.class_size], stddev=1.0 / tf.sqrt(600.0)),
+                             dtype=tf.float32, name='Ws')
+            bs = tf.Variable(tf.zeros(shape=[1, self.class_size]), name='bs')
+            self.polarity_logits = tf.tensordot(h_star, Ws, 1) + bs  # -> [batch_size, C, class_size]
+
+            # kept around so the trained weights can be exported for inference outside tensorflow
+            self.attention_weights = {'Wh': Wh, 'Wv': Wv, 'w': w, 'Wp': Wp, 'Wx': Wx, 'Wc': Wc, 'bc': bc,
+                                      'Ws': Ws, 'bs': bs}
+
+            self.category_probs = tf.sigmoid(self.category_logits)
+            self.polarity_probs = tf.nn.softmax(self.polarity_logits)
+            self.polarity_prediction = tf.argmax(self.polarity_probs, axis=-1, name='polarity_prediction')
+
+    def _init_optimizer(self):
+        self.category_loss = tf.reduce_mean(tf.nn.sigmoid_cross_entropy_with_logits(
+            labels=self.category_targets, logits=self.category_logits))
+        polarity_xent = tf.nn.sparse_softmax_cross_entropy_with_logits(
+            labels=self.polarity_targets, logits=self.polarity_logits)  # -> [batch_size, C]
+        self.polarity_loss = tf.reduce_sum(polarity_xent * self.polarity_mask) / tf.maximum(
+            tf.reduce_sum(self.polarity_mask), 1.0)
+        self.loss = self.category_loss + self.polarity_weight * self.polarity_loss + tf.reduce_sum(
+            [self.reg_lambda * tf.nn.l2_loss(x) for x in tf.trainable_variables()]) + tf.losses.get_regularization_loss()
+        # a variable rather than a constant so a plateau schedule can lower it, and checkpoints keep it
+        self.learning_rate = tf.Variable(self.initial_learning_rate, trainable=False, dtype=tf.float32,
+                                         name='learning_rate')
+        self.new_learning_rate = tf.placeholder(tf.float32, shape=(), name='new_learning_rate')
+        self.learning_rate_update = tf.assign(self.learning_rate, self.new_learning_rate)
+        self.optimizer = tf.train.AdamOptimizer(self.learning_rate)
+        self.grads_and_vars = [(g, v) for g, v in self.optimizer.compute_gradients(self.loss) if g is not None]
+        self.train_op = self.optimizer.apply_gradients(self.grads_and_vars)
+
+    def set_learning_rate(self, session, learning_rate):
+        session.run(self.learning_rate_update, feed_dict={self.new_learning_rate: learning_rate})
+
+    def get_weight_tensors(self):
+        """ Map of export name -> variable for everything the forward pass needs """
+        tensors = {
+            'embedding_matrix': self.embedding_matrix,
+            'category_embedding_matrix': self.category_embedding_matrix,
+        }
+        tensors.update(self.attention_weights)
+        # BasicLSTMCell -> rnn/basic_lstm_cell/{kernel,bias}
+        # GRUCell -> rnn/gru_cell/{gates,candidate}/{kernel,bias}
+        for v in tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope='RNN/rnn/'):
+            name = v.op.name.split('/')
+            kind = 'kernel' if name[-1] in ('kernel', 'weights') else 'bias'
+            if name[-2] in ('gates', 'candidate'):
+                tensors['cell_%s_%s' % (name[-2], kind)] = v
+            else:
+                tensors['cell_%s' % kind] = v
+        return tensors
+
+    def export_weights(self, session, path, categories):
+        """ Dump the trained weights and the category names to a .npz file readable by NumpyJointModel """
+        tensors = self.get_weight_tensors()
+        names = sorted(tensors.keys())
+        values = session.run([tensors[n] for n in names])
+        weights = dict(zip(names, values))
+        weights['cell'] = np.asarray(self.cell_type)
+        weights['categories'] = np.asarray(categories)
+        np.savez(path, **weights)
+        return path
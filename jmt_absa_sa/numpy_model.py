@@ -0,0 +1,61 @@
+import numpy as np
+
+from baseline.numpy_model import NumpyAspectLevelModel, sigmoid, softmax
+from jmt_absa_sa.data import polarities
+
+
+class NumpyJointModel(NumpyAspectLevelModel):
+    """
+    Inference-only forward pass of JointAspectModel (numpy alone). One call encodes the sentences once and returns
+    the detected categories with their polarities, instead of a detector call plus one AspectLevelModel call per
+    detected category. Weights come from JointAspectModel.export_weights.
+    """
+
+    def __init__(self, weights, cell, categories, dtype=np.float32, embeddings=None):
+        super().__init__(weights, cell, dtype=dtype, embeddings=embeddings)
+        self.categories = list(categories)
+
+    @classmethod
+    def load(cls, path, dtype=np.float32, embeddings=None):
+        with np.load(path) as f:
+            skip = ('cell', 'categories', 'embedding_matrix') if embeddings is not None else ('cell', 'categories')
+            weights = {k: f[k] for k in f.files if k not in skip}
+            cell = str(f['cell'])
+            categories = [str(c) for c in f['categories']]
+        return cls(weights, cell, categories, dtype=dtype, embeddings=embeddings)
+
+    def forward(self, x, x_len):
+        """
+        x -> [batch_size, N] word ids, x_len -> [batch_size]. Returns the category probabilities [batch_size, C]
+        and the polarity probabilities of every category [batch_size, C, 3]
+        """
+        x = np.asarray(x)
+        x_len = np.asarray(x_len)
+        batch_size, N = x.shape
+        d = self.hidden_size
+        C = len(self.categories)
+
+        outputs, state = self.rnn(self.embedding_matrix[x], x_len)  # -> [batch_size, N, d]
+
+        a = self.matmul(outputs.reshape(-1, d), 'Wh').reshape(batch_size, N, d)
+        b = self.matmul(self.category_embedding_matrix, 'Wv')  # -> [C, d]
+        # one category at a time keeps the tanh input at [batch_size, N, d] rather than [batch_size, C, N, d]
+        scores = np.empty((batch_size, C, N), dtype=self.dtype)
+        for c in range(C):
+            scores[:, c, :] = np.dot(np.tanh(a + b[c]), self.w)[:, :, 0]
+        mask = (np.arange(N)[None, :] < x_len[:, None]).astype(self.dtype)
+        alpha = softmax(scores + (mask - 1.0)[:, None, :] * 1e9)  # -> [batch_size, C, N]
+        r = np.matmul(alpha, outputs)  # -> [batch_size, C, d]
+
+        h_star = np.tanh(self.matmul(r.reshape(-1, d), 'Wp').reshape(batch_size, C, d) +
+                         self.matmul(self._last_h(state), 'Wx')[:, None, :])
+        category_probs = sigmoid(np.sum(h_star * self.Wc, 2) + self.bc)
+        polarity_probs = softmax(self.matmul(h_star.reshape(-1, d), 'Ws').reshape(batch_size, C, -1) + self.bs)
+        return category_probs, polarity_probs
+
+    def predict(self, x, x_len, threshold=0.5):
+        """ [(category, polarity), ...] per sentence, for the categories with probability >= threshold """
+        category_probs, polarity_probs = self.forward(x, x_len)
+        polarity = np.argmax(polarity_probs, axis=-1)
+        return [[(self.categories[c], polarities[polarity[s, c]]) for c in np.flatnonzero(category_probs[s] >= threshold)]
+                for s in range(category_probs.shape[0])]
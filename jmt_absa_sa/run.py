@@ -0,0 +1,149 @@
+"""
+Trains JointAspectModel on SemEval 2014 restaurant aspect categories or SemEval 2016 restaurant entity#attribute
+categories, from the repository root:
+
+    python -m jmt_absa_sa.run --dataset 2014
+    python -m jmt_absa_sa.run --dataset 2016 --predictions saves/joint_2016_predictions.xml
+
+The vocabulary and word vectors are the ones the data pipeline wrote (--vocab-dir). After every epoch the model is
+scored on the test file (category P / R / F1, polarity accuracy on the gold categories, joint accuracy); the
+weights of the last epoch are exported for jmt_absa_sa.numpy_model.NumpyJointModel.
+"""
+import argparse
+import json
+import os
+from time import time
+
+import numpy as np
+import tensorflow as tf
+
+from data_process_pipeline.semeval_xml import Writer2014, Writer2016
+from jmt_absa_sa.data import load_sentences, load_vocab, load_embedding, category_list, JointData, evaluate, \
+    polarities
+from jmt_absa_sa.model import JointAspectModel
+
+defaults = {
+    '2014': {'train': 'data/raw_data/SemEval_14/SemEval14-ABSA-TrainData_v2/Restaurants_Train_v2.xml',
+             'test': None,
+             'vocab_dir': 'data/semeval14'},
+    '2016': {'train': 'data/raw_data/SemEval_16/ABSA16_Restaurants_Train_SB1_v2.xml',
+             'test': 'data/raw_data/SemEval_16/EN_REST_SB1_TEST.gold.xml',
+             'vocab_dir': 'data/semeval16/restaurants'},
+}
+
+
+def predict(session, model, data, batch_size):
+    category_probs, polarity_probs = [], []
+    for x, x_len, _, _, _ in data.batches(batch_size):
+        c, p = session.run([model.category_probs, model.polarity_probs],
+                           {model.inputs: x, model.inputs_length: x_len, model.keep_prob1: 1.0})
+        category_probs.append(c)
+        polarity_probs.append(p)
+    return np.concatenate(category_probs), np.concatenate(polarity_probs)
+
+
+def write_predictions(path, dataset, data, category_probs, polarity_probs, threshold=0.5):
+    """ The test sentences with the predicted categories and polarities, in the format of the input file """
+    polarity = np.argmax(polarity_probs, axis=-1)
+    with (Writer2014 if dataset == '2014' else Writer2016)(path) as out:
+        for s, (ids, text, _) in enumerate(data.sentences):
+            detected = [(data.categories[c], polarities[polarity[s, c]])
+                        for c in np.flatnonzero(category_probs[s] >= threshold)]
+            if dataset == '2014':
+                out.write(ids[0], text, aspect_categories=detected)
+            else:
+                out.write(ids[0], ids[1], text, [('NULL', c.upper(), p, '0', '0') for c, p in detected])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dataset', default='2014', choices=['2014', '2016'])
+    parser.add_argument('--train', default=None, help='SemEval XML with gold categories and polarities')
+    parser.add_argument('--test', default=None,
+                        help='SemEval XML with gold categories and polarities (2014: the last --test-fraction of '
+                             '--train, as there is no gold 2014 test file)')
+    parser.add_argument('--test-fraction', type=float, default=0.2)
+    parser.add_argument('--vocab-dir', default=None, help='text_vocab.vocab and text_vector.pkl of the pipeline')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cell', default='lstm', choices=['lstm', 'gru'])
+    parser.add_argument('--hidden-size', type=int, default=300)
+    parser.add_argument('--category-embedding-size', type=int, default=100)
+    parser.add_argument('--input-len', type=int, default=80)
+    parser.add_argument('--batch-size', type=int, default=25)
+    parser.add_argument('--keep-prob', type=float, default=0.5, help='dropout keep probability of the inputs')
+    parser.add_argument('--l2-reg', type=float, default=0.01, help='l2 regularizer of the attention vector w')
+    parser.add_argument('--reg-lambda', type=float, default=0.001, help='l2 penalty on all trainable variables')
+    parser.add_argument('--polarity-weight', type=float, default=1.0, help='weight of the polarity loss')
+    parser.add_argument('--threshold', type=float, default=0.5, help='category detection threshold')
+    parser.add_argument('--threads', type=int, default=0, help='tensorflow intra-op threads (0: all cores)')
+    parser.add_argument('--epochs', type=int, default=20)
+    parser.add_argument('--learning-rate', type=float, default=0.01)
+    parser.add_argument('--save-dir', default='saves')
+    parser.add_argument('--metrics-file', default=None, help='append one JSON line of test scores per epoch')
+    parser.add_argument('--predictions', default=None, help='write the test predictions of the last epoch here')
+    args = parser.parse_args()
+    train_path = args.train or defaults[args.dataset]['train']
+    test_path = args.test or defaults[args.dataset]['test']
+    vocab_dir = args.vocab_dir or defaults[args.dataset]['vocab_dir']
+
+    train = load_sentences(train_path, args.dataset)
+    if test_path:
+        test = load_sentences(test_path, args.dataset)
+    else:
+        n = int(len(train) * (1 - args.test_fraction))
+        train, test = train[:n], train[n:]
+    categories = category_list(train)
+    w2i = load_vocab(vocab_dir)
+    embedding = load_embedding(vocab_dir, w2i)
+    train_data = JointData(train, w2i, categories, args.input_len)
+    test_data = JointData(test, w2i, categories, args.input_len)
+    print("%d train / %d test sentences, %d categories: %s" % (len(train_data), len(test_data), len(categories),
+                                                               ', '.join(categories)))
+
+    tf.set_random_seed(args.seed)
+    rng = np.random.RandomState(args.seed)
+    session_config = tf.ConfigProto(intra_op_parallelism_threads=args.threads)
+    with tf.Session(config=session_config) as session:
+        model = JointAspectModel(args.cell, hidden_size=args.hidden_size, vocab_size=embedding.shape[0],
+                                 embedding_size=embedding.shape[1], category_size=len(categories),
+                                 category_embedding_size=args.category_embedding_size,
+                                 input_length=args.input_len, learning_rate=args.learning_rate,
+                                 l2_reg=args.l2_reg, reg_lambda=args.reg_lambda,
+                                 polarity_weight=args.polarity_weight)
+        session.run(tf.global_variables_initializer())
+        session.run(model.embedding_init, feed_dict={model.embedding_placeholder: embedding})
+
+        print("Training")
+        for epoch in range(args.epochs):
+            st = time()
+            loss = []
+            for x, x_len, y_category, y_polarity, polarity_mask in train_data.batches(args.batch_size, rng):
+                fd = {
+                    model.inputs: x,
+                    model.inputs_length: x_len,
+                    model.category_targets: y_category,
+                    model.polarity_targets: y_polarity,
+                    model.polarity_mask: polarity_mask,
+                    model.keep_prob1: args.keep_prob
+                }
+                _, l = session.run([model.train_op, model.loss], fd)
+                loss.append(l)
+            category_probs, polarity_probs = predict(session, model, test_data, args.batch_size)
+            scores = evaluate(category_probs, polarity_probs, test_data, args.threshold)
+            print("Epoch %d: loss %.4f, category P/R/F1 %.4f/%.4f/%.4f, polarity accuracy %.4f, joint accuracy %.4f "
+                  "(%.1fs)" % (epoch + 1, np.mean(loss), scores['category_precision'], scores['category_recall'],
+                               scores['category_f1'], scores['polarity_accuracy'], scores['joint_accuracy'],
+                               time() - st))
+            if args.metrics_file:
+                with open(args.metrics_file, 'a') as f:
+                    f.write(json.dumps(dict(scores, epoch=epoch + 1, loss=float(np.mean(loss)))) + '\n')
+
+        if not os.path.exists(args.save_dir):
+            os.makedirs(args.save_dir)
+        path = model.export_weights(session, os.path.join(args.save_dir, 'joint_weights_%s.npz' % args.dataset),
+                                    categories)
+        print("Exported weights to", path)
+        if args.predictions:
+            write_predictions(args.predictions, args.dataset, test_data, category_probs, polarity_probs,
+                              args.threshold)
+            print("Wrote", args.predictions)
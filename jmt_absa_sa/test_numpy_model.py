@@ -0,0 +1,125 @@
+"""
+numpy_model.NumpyJointModel against a per-sentence, per-category numpy reference of the graph in model.py (always
+runs) and against the tensorflow graph itself, for both cells (skipped when tensorflow cannot be imported):
+
+    python -m pytest jmt_absa_sa/test_numpy_model.py
+"""
+import os
+import tempfile
+
+import numpy as np
+import pytest
+
+from jmt_absa_sa.data import polarities
+from jmt_absa_sa.numpy_model import NumpyJointModel
+
+vocab_size, categories, emb, category_emb, hidden, N = 50, ['food', 'price', 'service', 'ambience'], 16, 8, 12, 7
+
+
+def random_weights(cell, rng):
+    d, C = hidden, len(categories)
+    shapes = {'embedding_matrix': (vocab_size, emb), 'category_embedding_matrix': (C, category_emb),
+              'Wh': (d, d), 'Wv': (category_emb, d), 'w': (d, 1), 'Wp': (d, d), 'Wx': (d, d),
+              'Wc': (C, d), 'bc': (C,), 'Ws': (d, 3), 'bs': (1, 3)}
+    if cell == 'lstm':
+        shapes.update({'cell_kernel': (emb + d, 4 * d), 'cell_bias': (4 * d,)})
+    else:
+        shapes.update({'cell_gates_kernel': (emb + d, 2 * d), 'cell_gates_bias': (2 * d,),
+                       'cell_candidate_kernel': (emb + d, d), 'cell_candidate_bias': (d,)})
+    return {k: rng.uniform(-0.5, 0.5, s) for k, s in shapes.items()}
+
+
+def inputs(rng, batch_size=5):
+    x = rng.randint(0, vocab_size, (batch_size, N))
+    x_len = np.asarray([7, 3, 5, 1, 6][:batch_size])
+    return x, x_len
+
+
+def reference_forward(W, cell, x, x_len):
+    """ One sentence, one time step and one category at a time, in float64 """
+    def sig(z):
+        return 1.0 / (1.0 + np.exp(-z))
+
+    d = hidden
+    category_probs, polarity_probs = [], []
+    for words, n in zip(x, x_len):
+        h, c = np.zeros(d), np.zeros(d)
+        outputs = []
+        for t in range(n):
+            v = np.concatenate([W['embedding_matrix'][words[t]], h])
+            if cell == 'lstm':
+                i, j, f, o = np.split(v.dot(W['cell_kernel']) + W['cell_bias'], 4)
+                c = c * sig(f + 1.0) + sig(i) * np.tanh(j)
+                h = np.tanh(c) * sig(o)
+            else:
+                r, u = np.split(sig(v.dot(W['cell_gates_kernel']) + W['cell_gates_bias']), 2)
+                v = np.concatenate([W['embedding_matrix'][words[t]], r * h])
+                h = u * h + (1 - u) * np.tanh(v.dot(W['cell_candidate_kernel']) + W['cell_candidate_bias'])
+            outputs.append(h)
+        # only the n steps of the sentence are attended over
+        outputs = np.asarray(outputs)
+        detected, polarity = [], []
+        for k in range(len(categories)):
+            scores = np.tanh(outputs.dot(W['Wh']) + W['category_embedding_matrix'][k].dot(W['Wv'])).dot(W['w'])[:, 0]
+            alpha = np.exp(scores - scores.max()) / np.exp(scores - scores.max()).sum()
+            h_star = np.tanh(alpha.dot(outputs).dot(W['Wp']) + h.dot(W['Wx']))
+            detected.append(sig(h_star.dot(W['Wc'][k]) + W['bc'][k]))
+            z = h_star.dot(W['Ws']) + W['bs'][0]
+            polarity.append(np.exp(z - z.max()) / np.exp(z - z.max()).sum())
+        category_probs.append(detected)
+        polarity_probs.append(polarity)
+    return np.asarray(category_probs), np.asarray(polarity_probs)
+
+
+@pytest.mark.parametrize('cell', ['lstm', 'gru'])
+def test_matches_reference(cell):
+    rng = np.random.RandomState(0)
+    weights = random_weights(cell, rng)
+    x, x_len = inputs(rng)
+    expected = reference_forward(weights, cell, x, x_len)
+    for dtype, atol in [(np.float64, 1e-10), (np.float32, 1e-5)]:
+        got = NumpyJointModel(weights, cell, categories, dtype=dtype).forward(x, x_len)
+        for g, e in zip(got, expected):
+            assert g.shape == e.shape
+            assert np.allclose(g, e, atol=atol), np.dtype(dtype).name
+
+
+@pytest.mark.parametrize('cell', ['lstm', 'gru'])
+def test_predict(cell):
+    """ The categories at or above the threshold, each with its argmax polarity """
+    rng = np.random.RandomState(2)
+    model = NumpyJointModel(random_weights(cell, rng), cell, categories, dtype=np.float64)
+    x, x_len = inputs(rng)
+    category_probs, polarity_probs = model.forward(x, x_len)
+    for s, predicted in enumerate(model.predict(x, x_len, threshold=0.5)):
+        assert predicted == [(categories[k], polarities[np.argmax(polarity_probs[s, k])])
+                             for k in range(len(categories)) if category_probs[s, k] >= 0.5]
+    assert model.predict(x, x_len, threshold=1.01) == [[] for _ in x_len]
+
+
+@pytest.mark.parametrize('cell', ['lstm', 'gru'])
+def test_matches_tensorflow(cell):
+    tf = pytest.importorskip('tensorflow')
+    from jmt_absa_sa.model import JointAspectModel
+
+    rng = np.random.RandomState(1)
+    embedding = rng.uniform(-1, 1, (vocab_size, emb)).astype(np.float32)
+    x, x_len = inputs(rng, batch_size=4)
+
+    tf.reset_default_graph()
+    tf.set_random_seed(1)
+    with tf.Session() as session:
+        model = JointAspectModel(cell, hidden_size=hidden, vocab_size=vocab_size, embedding_size=emb,
+                                 category_size=len(categories), category_embedding_size=category_emb,
+                                 input_length=N)
+        session.run(tf.global_variables_initializer())
+        session.run(model.embedding_init, feed_dict={model.embedding_placeholder: embedding})
+        expected = session.run([model.category_probs, model.polarity_probs], {model.inputs: x,
+                                                                              model.inputs_length: x_len,
+                                                                              model.keep_prob1: 1.0})
+        path = model.export_weights(session, os.path.join(tempfile.mkdtemp(), 'weights.npz'), categories)
+
+    for dtype in [np.float32, np.float64]:
+        got = NumpyJointModel.load(path, dtype=dtype).forward(x, x_len)
+        for g, e in zip(got, expected):
+            assert np.allclose(g, e, atol=1e-5), (cell, np.dtype(dtype).name)